@@ -1,29 +1,46 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Header, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Union
 import os
 import re
+import io
+import csv
 import uuid
 import asyncio
-from datetime import datetime
+import threading
+import multiprocessing
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime
 import json
 from pathlib import Path
-import pandas as pd  # For reading Excel files
-import requests
-
-# New imports for PDF/chart generation
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import numpy as np
+from lazy_imports import LazyModule, lazy_import_times, lazy_modules, importtime_report
+from fast_responses import ORJSONResponse, CompressionMiddleware
+from backends import BackendPool, pools_from_env, health_check_loop
+from profiling import PROFILE_DIR, ProfilingMiddleware, current_profile, is_admin
+import memory_report
+from result_store import ResultStore, result_budget
+from callbacks import CallbackDispatcher, new_delivery, validate_callback_url
+from pipeline import Stage, StageContext, StageGraph, digest
+from single_flight import SingleFlight
+import sales_datasets
+
+# Heavy dependencies are imported on first use to keep cold start fast
+pd = LazyModule("pandas")  # For reading Excel files
+np = LazyModule("numpy")
+reports = LazyModule("reports")  # PDF/chart generation (reportlab + matplotlib)
+finance_store = LazyModule("finance_store")  # Finance metrics by entity and period (numpy)
+pa = LazyModule("pyarrow")  # Optional, for Arrow responses
+pdf_extract = LazyModule("pdf_extract")  # Page-streamed statement text extraction (pypdf)
+
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -31,7 +48,8 @@ app = FastAPI(
     description="AI-powered financial statement analysis using LangGraph and Google Gemini",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Ensure runtime dirs exist
@@ -48,10 +66,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON responses above the threshold with brotli or gzip, as negotiated with the client
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")),
+)
+
+# Sampling profiler for requests sent with X-Profile (admin only) or picked by PROFILE_SAMPLE_RATE, see profiling.py
+app.add_middleware(ProfilingMiddleware)
+
 # Data models
 class AnalysisRequest(BaseModel):
     file_path: Optional[str] = Field(None, description="Path to existing PDF file")
     analysis_type: str = Field("full", description="Type of analysis: 'metrics', 'ratios', 'full'")
+    stream: bool = Field(False, description="Relay the narrative through /stream/{request_id} as it is generated")
+    entity: Optional[str] = Field(None, description="Company the statement belongs to; with period, the metrics are kept in the finance store")
+    period: Optional[str] = Field(None, description="Reporting period, e.g. 2024, 2024-Q1, 2024-H1 or 2024-03")
+    callback_url: Optional[str] = Field(None, description="URL the result is POSTed to when the analysis completes or fails")
+
+class BusinessAdvisoryRequest(BaseModel):
+    finance_request_id: str = Field(..., description="request_id of a completed /analyze/upload or /analyze/file analysis")
+    sales_request_id: str = Field(..., description="request_id of a completed /analyze/spreadsheet/upload analysis")
+    stream: bool = Field(False, description="Relay the combined narrative through /stream/{request_id} as it is generated")
+    callback_url: Optional[str] = Field(None, description="URL the result is POSTed to when the analysis completes or fails")
+
+class FinanceRecord(BaseModel):
+    entity: str
+    period: str = Field(..., description="2024, 2024-Q1, 2024-H1 or 2024-03")
+    metrics: Dict[str, Optional[float]] = Field(..., description="Metrics as extracted by the finance workflow, e.g. Total Revenue")
+
+class FinanceRecordsRequest(BaseModel):
+    records: List[FinanceRecord]
+
+class DatasetRowsRequest(BaseModel):
+    rows: List[Dict[str, Any]] = Field(..., description="Sales rows keyed by column header, as in the CSV/Excel export")
 
 class AnalysisResponse(BaseModel):
     request_id: str
@@ -70,19 +118,161 @@ class AnalysisResult(BaseModel):
     text_length: int
     timestamp: str
     processing_time: float
+    model: Optional[str] = None
+    stages: Optional[Dict[str, Any]] = None
+
+class RerunRequest(BaseModel):
+    model: Optional[str] = Field(None, description="Model for the narrative stages: gemini, openrouter, ollama, groq or deepseek; none for the workflow's own narrative")
+    stream: bool = Field(False, description="Relay the new narrative through /stream/{request_id} as it is generated")
+    callback_url: Optional[str] = Field(None, description="URL the result is POSTed to when the analysis completes or fails")
 
-# Storage for analysis results (in production, use a proper database)
-analysis_results: Dict[str, AnalysisResult] = {}
+# Storage for analysis results (in production, use a proper database).
+# Results are kept compressed within a shared memory budget, see result_store.py
+analysis_results: ResultStore = ResultStore("analysis_results", result_budget)
 analysis_queue: Dict[str, Dict[str, Any]] = {}
 
 # Storage for Excel analysis results
-excel_analysis_results: Dict[str, Any] = {}
+excel_analysis_results: ResultStore = ResultStore("excel_analysis_results", result_budget)
 excel_analysis_queue: Dict[str, Any] = {}
 
 # Storage for Business Advisory analysis results
-ba_analysis_results: Dict[str, Any] = {}
+ba_analysis_results: ResultStore = ResultStore("ba_analysis_results", result_budget)
 ba_analysis_queue: Dict[str, Any] = {}
 
+# Upload pass-through: keep the upload's own spooled buffer instead of writing it to uploads/
+PASSTHROUGH_UPLOADS = os.getenv("PASSTHROUGH_UPLOADS", "false").lower() == "true"
+
+class SpooledUpload:
+    """The spooled temp file the form parser wrote the upload to (in memory up to 1 MB, then on disk)"""
+
+    def __init__(self, upload_file: UploadFile):
+        self.filename = Path(upload_file.filename).name
+        # Taken over rather than copied: FastAPI closes the UploadFile's file once the response is
+        # sent, while the analysis still reads it, so the UploadFile gets an empty one to close instead
+        self.buffer = upload_file.file
+        upload_file.file = io.BytesIO()
+        self.size = self.buffer.seek(0, os.SEEK_END)
+        self.buffer.seek(0)
+
+    @property
+    def spilled(self) -> bool:
+        return bool(getattr(self.buffer, "_rolled", False))
+
+    def close(self):
+        self.buffer.close()
+
+UploadSource = Union[str, SpooledUpload]
+
+# Business advisory orchestration: "workflow" sends both files to the n8n Combined workflow,
+# "api" runs the finance and sales workflows concurrently and only asks n8n for the combined narrative
+BA_ORCHESTRATION = os.getenv("BA_ORCHESTRATION", "workflow")
+
+# Finance text extraction: "n8n" sends the whole PDF to the finance workflow's Extract from File node,
+# "api" extracts only the statement pages here and posts their text to /webhook/finance-text
+FINANCE_EXTRACTION = os.getenv("FINANCE_EXTRACTION", "n8n")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+extract_pool: Optional[ProcessPoolExecutor] = None
+extract_pool_lock = threading.Lock()
+
+# Sales summarisation: "n8n" sends the whole spreadsheet to the sales workflow,
+# "api" sketches it here chunk by chunk and posts only the summary to /webhook/sales-summary
+SALES_SUMMARY = os.getenv("SALES_SUMMARY", "n8n")
+SALES_CHUNK_ROWS = int(os.getenv("SALES_CHUNK_ROWS", "100000"))
+# Files and workbook sheets of one sales upload (at most SALES_MAX_FILES files) are parsed in parallel
+SALES_INGEST_WORKERS = int(os.getenv("SALES_INGEST_WORKERS", str(os.cpu_count() or 1)))
+SALES_MAX_FILES = int(os.getenv("SALES_MAX_FILES", "64"))
+ingest_pool: Optional[ProcessPoolExecutor] = None
+ingest_pool_lock = threading.Lock()
+
+# n8n backends per pipeline (N8N_FINANCE_URLS, N8N_SALES_URLS, N8N_COMBINED_URLS), see backends.py
+n8n_pools: Dict[str, BackendPool] = pools_from_env()
+N8N_HEALTH_PATH = os.getenv("N8N_HEALTH_PATH", "/healthz")
+N8N_HEALTH_INTERVAL = float(os.getenv("N8N_HEALTH_INTERVAL", "10"))
+N8N_HEALTH_TIMEOUT = float(os.getenv("N8N_HEALTH_TIMEOUT", "2"))
+health_check_task: Optional[asyncio.Task] = None
+
+# Startup warm-up: keep-alive connections opened per n8n backend, and the lazy modules loaded up front
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_MODULES = [pd, np, reports, finance_store, pdf_extract, pa]
+warmup_task: Optional[asyncio.Task] = None
+warmup_state: Dict[str, Any] = {"started": None, "finished": None, "duration_seconds": None, "modules": {}, "errors": []}
+
+# Idempotency-Key handling: a retried request within the window returns the original request_id
+IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+idempotency_keys: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+# Completion callbacks, delivered by their own workers (see callbacks.py)
+callback_dispatcher = CallbackDispatcher()
+
+# Stage outputs of the pipeline graphs keyed by content and parameters (see pipeline.py), kept within
+# the result memory budget, and the inputs of every finished run so /rerun can run it with new parameters
+stage_outputs: ResultStore = ResultStore("stage_outputs", result_budget)
+pipeline_runs: Dict[str, Dict[str, Any]] = {}
+# Models the finance, sales and combined narrative webhooks route to
+NARRATIVE_MODELS = ["gemini", "openrouter", "ollama", "groq", "deepseek"]
+
+# Request coalescing: identical analyses (same upload content, analysis_type and parameters)
+# submitted while one of them runs attach to that run instead of starting their own (see single_flight.py).
+# Without it every request is a run of its own, still tracked in analysis_flights so it can be cancelled
+COALESCE_ANALYSES = os.getenv("COALESCE_ANALYSES", "true").lower() == "true"
+analysis_flights = SingleFlight("analyses")
+
+class NarrativeStream:
+    """Narrative fragments of one running analysis, replayed to every subscriber of /stream/{request_id}"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.fragments = []
+        self.done = False
+        self.error: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, text: str):
+        self.fragments.append(text)
+        self._notify()
+
+    def _finish(self, error: Optional[str]):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def push(self, text: str):
+        """Add a fragment; safe to call from the worker thread running the webhook"""
+        self.loop.call_soon_threadsafe(self._append, text)
+
+    def close(self, error: Optional[str] = None):
+        self.loop.call_soon_threadsafe(self._finish, error)
+
+    async def follow(self):
+        """Yield every fragment from the start, then new ones as they arrive, until the stream closes"""
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.fragments):
+                yield self.fragments[sent]
+                sent += 1
+            if self.done:
+                return
+            await changed.wait()
+
+# Open narrative streams by request_id; removed once the analysis finishes
+narrative_streams: Dict[str, NarrativeStream] = {}
+
+# Report rendering runs in worker processes so matplotlib never blocks the event loop
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+report_pool: Optional[ProcessPoolExecutor] = None
+
+# n8n calls wait for a slot from the pool's concurrency limiter, blocking their thread, so they
+# run on their own threads; asyncio's default executor stays free for file I/O and other endpoints
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "64"))
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
 # Utility functions
 def save_uploaded_file(upload_file: UploadFile) -> str:
     """Save uploaded file and return the file path"""
@@ -123,116 +313,582 @@ def cleanup_file(file_path: str):
     except Exception as e:
         print(f"⚠️  Warning: Could not clean up file {file_path}: {e}")
 
-async def process_analysis(request_id: str, file_path: str, analysis_type: str):
-    """Background task to process the analysis"""
-    start_time = datetime.now()
-    
-    try:
-        # Update status to processing
-        analysis_queue[request_id]["status"] = "processing"
-        
-        # print(f"\n🔍 Processing n8n analysis {request_id}...")
-
-        # Execute analysis pipeline
-        if (analysis_type in ["metrics", "full"]) and (analysis_type in ["ratios", "full"]):
-            state = requests.post(
-                # 'http://localhost:5678/webhook-test/finance',
-                'http://localhost:5678/webhook/finance',
-                files= {'file': (os.path.basename(file_path), open(file_path, 'rb'), 'application/pdf')},
-            )
+def hold_upload(upload_file: UploadFile, save) -> UploadSource:
+    """Keep the upload in a spooled buffer in pass-through mode, otherwise save it to uploads/"""
+    if PASSTHROUGH_UPLOADS:
+        return SpooledUpload(upload_file)
+    return save(upload_file)
 
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        if state.status_code == 200:
-            results = state.json()
+def source_queue_info(source: UploadSource) -> Dict[str, Any]:
+    """Queue entry fields describing where the upload is held"""
+    if isinstance(source, SpooledUpload):
+        return {
+            "upload_mode": "passthrough",
+            "file_name": source.filename,
+            "file_size": source.size,
+            "spilled_to_disk": source.spilled,
+        }
+    return {"file_path": source}
+
+@contextmanager
+def open_source(source: UploadSource):
+    """Yield (filename, file object) for a saved file path or a spooled upload"""
+    if isinstance(source, SpooledUpload):
+        source.buffer.seek(0)
+        yield source.filename, source.buffer
+    else:
+        with open(source, 'rb') as f:
+            yield os.path.basename(source), f
+
+def release_source(source: UploadSource, delete_file: bool = False):
+    """Free the spooled buffer of a pass-through upload, and with delete_file remove a saved one"""
+    if isinstance(source, SpooledUpload):
+        source.close()
+    elif delete_file:
+        cleanup_file(source)
+
+def open_narrative_stream(request_id: str):
+    narrative_streams[request_id] = NarrativeStream(asyncio.get_running_loop())
+
+def stream_fragment_sink(request_id: str):
+    """Callback that relays webhook narrative fragments to /stream subscribers, or None when not streaming"""
+    stream = narrative_streams.get(request_id)
+    return stream.push if stream is not None else None
+
+def close_narrative_stream(request_id: str, error: Optional[str] = None):
+    stream = narrative_streams.pop(request_id, None)
+    if stream is not None:
+        stream.close(error)
+
+def find_idempotent_request(endpoint: str, key: Optional[str], queue: Dict[str, Any]) -> Optional[AnalysisResponse]:
+    """Return the original response for a repeated Idempotency-Key, or None to start new work"""
+    if key is None:
+        return None
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+    entry = idempotency_keys.get(f"{endpoint}:{key}")
+    if entry is None:
+        return None
+    request_id = entry["request_id"]
+    if time.time() - entry["created"] > IDEMPOTENCY_WINDOW_SECONDS or request_id not in queue:
+        # Expired, or the job was cleaned up since
+        del idempotency_keys[f"{endpoint}:{key}"]
+        return None
+
+    print(f"🔁 Idempotency-Key {key} matched request {request_id}")
+    return AnalysisResponse(
+        request_id=request_id,
+        status=queue[request_id]["status"],
+        message="Duplicate request, returning the original analysis",
+        timestamp=datetime.now().isoformat()
+    )
 
-            # Create result
+def remember_idempotency_key(endpoint: str, key: Optional[str], request_id: str):
+    if key is None:
+        return
+    now = time.time()
+    idempotency_keys[f"{endpoint}:{key}"] = {"request_id": request_id, "created": now}
+    # Keys are stored in creation order, so expired and excess keys are at the front
+    while idempotency_keys:
+        oldest = next(iter(idempotency_keys.values()))
+        if len(idempotency_keys) <= IDEMPOTENCY_MAX_KEYS and now - oldest["created"] <= IDEMPOTENCY_WINDOW_SECONDS:
+            break
+        idempotency_keys.popitem(last=False)
+
+async def callback_delivery(callback_url: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Delivery state for the queue entry, or None without a callback_url"""
+    if not callback_url:
+        return None
+    try:
+        # Resolves the host, so kept off the event loop
+        await asyncio.to_thread(validate_callback_url, callback_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return new_delivery(callback_url)
+
+def queue_completion_callback(request_id: str, pipeline: str, queue: Dict[str, Any], results):
+    """POST the finished job to its callback_url, if it has one"""
+    queue_info = queue[request_id]
+    delivery = queue_info.get("callback")
+    if delivery is None:
+        return
+    result = results.get(request_id)
+    if isinstance(result, BaseModel):
+        result = result.dict()
+    event = f"analysis.{queue_info['status']}"
+    body = ORJSONResponse({
+        "event": event,
+        "request_id": request_id,
+        "pipeline": pipeline,
+        "status": queue_info["status"],
+        "error": queue_info.get("error"),
+        "result": result,
+        "timestamp": datetime.now().isoformat(),
+    }).body
+    callback_dispatcher.submit(delivery, event, request_id, body)
+
+def validate_finance_key(entity: Optional[str], period: Optional[str]):
+    """entity and period are optional, but only together"""
+    if (entity is None) != (period is None):
+        raise HTTPException(status_code=400, detail="entity and period must be given together")
+    if entity is not None:
+        try:
+            finance_store.validate_key(entity, period)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+async def record_finance_metrics(request_id: str, metrics: Dict[str, Any]):
+    """Keep a finished analysis's metrics in the finance store when it was tagged with entity and period"""
+    queue_info = analysis_queue[request_id]
+    if queue_info.get("entity") is None:
+        return
+    try:
+        record = {"entity": queue_info["entity"], "period": queue_info["period"], "metrics": metrics}
+        await asyncio.to_thread(finance_store.store.upsert, [record])
+        print(f"🗄️  Stored metrics for {record['entity']} {record['period']}")
+    except Exception as e:
+        print(f"⚠️  Could not store metrics for {request_id}: {e}")
+
+def source_digest(source: UploadSource) -> str:
+    """SHA-256 of the upload content"""
+    digest = hashlib.sha256()
+    with open_source(source) as (_, f):
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def sources_digest(source: Union[UploadSource, List[UploadSource]]) -> str:
+    """Content hash of one upload, or of several uploads in order"""
+    if not isinstance(source, list):
+        return source_digest(source)
+    return hashlib.sha256("".join(source_digest(s) for s in source).encode("ascii")).hexdigest()
+
+def post_webhook_streaming(pool: BackendPool, path: str, on_fragment, narrative_key: str = "Analysis", **kwargs) -> Dict[str, Any]:
+    """POST to an n8n webhook and relay narrative fragments from a streamed (NDJSON) response.
+
+    n8n streams `{"type": "item", "content": ...}` lines when the Webhook node uses the
+    Streaming response mode. A line without a type (or with type "result") is taken as the
+    final workflow output; a plain JSON response is handled as a non-streamed reply.
+    """
+    with pool.request("POST", path, stream=True, **kwargs) as state:
+        if state.status_code != 200:
+            raise Exception(f"Webhook {path} failed with status code {state.status_code}")
+
+        fragments, final, raw = [], None, []
+        for line in state.iter_lines():
+            if not line:
+                continue
+            line = line.decode("utf-8")
+            raw.append(line)
             try:
-                result = AnalysisResult(
-                    request_id=request_id,
-                    status="completed",
-                    metrics=results["Metrics"],
-                    ratios=results["Ratios"],
-                    analysis=results["Analysis"],
-                    text_length=len(results["Analysis"]),
-                    timestamp=datetime.now().isoformat(),
-                    processing_time=processing_time
-                )
-
-                analysis_results[request_id] = result
-
-            except Exception as e:
-                raise Exception(f"Error creating AnalysisResult: {str(e)}")
-
-        else:
-            raise Exception(f"Analysis failed with status code {state.status_code}")
-        
-        # Store result
-        analysis_queue[request_id]["status"] = "completed"
-        
-        # Cleanup temporary file
-        cleanup_file(file_path)
-        
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(event, dict):
+                continue
+
+            kind = event.get("type")
+            if kind == "item":
+                text = event.get("content") or ""
+                if text:
+                    fragments.append(text)
+                    on_fragment(text)
+            elif kind == "error":
+                raise Exception(f"Webhook stream error: {event.get('content')}")
+            elif kind in ("begin", "end"):
+                continue
+            else:
+                final = event.get("data", event) if kind == "result" else event
+
+    if final is None and not fragments:
+        final = json.loads("\n".join(raw))
+    final = dict(final or {})
+
+    if fragments:
+        final.setdefault(narrative_key, "".join(fragments))
+    elif narrative_key in final:
+        on_fragment(final[narrative_key])
+    return final
+
+def get_extract_pool() -> Optional[ProcessPoolExecutor]:
+    """Process pool for extracting long PDFs, or None with a single worker"""
+    global extract_pool
+    if PDF_EXTRACT_WORKERS <= 1:
+        return None
+    with extract_pool_lock:
+        if extract_pool is None:
+            # Spawned rather than forked: the pool is started from a worker thread of a threaded server
+            extract_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return extract_pool
+
+def extract_finance_text(source: UploadSource) -> Optional[Dict[str, Any]]:
+    """Statement pages of the PDF, or None if it cannot be read here (n8n then gets the file)"""
+    with open_source(source) as (file_name, f):
+        data = f.read()
+    try:
+        extraction = pdf_extract.extract_statement_text(data, get_extract_pool())
     except Exception as e:
-        processing_time = (datetime.now() - start_time).total_seconds()
-        error_result = AnalysisResult(
-            request_id=request_id,
-            status="failed",
-            metrics={},
-            ratios={},
-            analysis=f"Analysis failed: {str(e)}",
-            text_length=0,
-            timestamp=datetime.now().isoformat(),
-            processing_time=processing_time
-        )
-        analysis_results[request_id] = error_result
-        analysis_queue[request_id]["status"] = "failed"
-        analysis_queue[request_id]["error"] = str(e)
+        print(f"⚠️  Could not extract {file_name}, sending the file to n8n: {e}")
+        return None
+
+    print(f"📄 Extracted pages {extraction['pages']} of {extraction['page_count']} "
+          f"(scanned {extraction['pages_scanned']}, {extraction['cache_hits']} cached)")
+    if extraction["missing_metrics"]:
+        print(f"⚠️  Metrics not found in {file_name}: {', '.join(extraction['missing_metrics'])}")
+    return extraction
+
+def run_finance_webhook(source: UploadSource, extraction: Optional[Dict[str, Any]] = None, on_fragment=None) -> Dict[str, Any]:
+    """Send a financial statement (or its extracted statement pages) to the n8n finance workflow and return its JSON output"""
+    if extraction is not None:
+        payload = {"text": extraction["text"]}
+        if on_fragment is not None:
+            results = post_webhook_streaming(n8n_pools["finance"], '/webhook/finance-text', on_fragment, json=payload)
+            results.setdefault("Metrics", {})
+            results.setdefault("Ratios", {})
+            return results
+        with n8n_pools["finance"].request("POST", '/webhook/finance-text', json=payload) as state:
+            if state.status_code != 200:
+                raise Exception(f"Finance analysis failed with status code {state.status_code}")
+            return state.json()
+
+    with open_source(source) as (file_name, f):
+        files = {'file': (file_name, f, 'application/pdf')}
+        # '/webhook-test/finance'
+        if on_fragment is not None:
+            results = post_webhook_streaming(n8n_pools["finance"], '/webhook/finance', on_fragment, files=files)
+            results.setdefault("Metrics", {})
+            results.setdefault("Ratios", {})
+            return results
+        with n8n_pools["finance"].request("POST", '/webhook/finance', files=files) as state:
+            if state.status_code != 200:
+                raise Exception(f"Finance analysis failed with status code {state.status_code}")
+            return state.json()
+
+def get_ingest_pool() -> Optional[ProcessPoolExecutor]:
+    """Process pool for parsing spreadsheets, or None with a single worker"""
+    global ingest_pool
+    if SALES_INGEST_WORKERS <= 1:
+        return None
+    with ingest_pool_lock:
+        if ingest_pool is None:
+            # Spawned rather than forked: the pool is started from a worker thread of a threaded server
+            ingest_pool = ProcessPoolExecutor(max_workers=SALES_INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return ingest_pool
+
+def sales_parts(sources: List[UploadSource]) -> List[Tuple[UploadSource, str, Optional[str]]]:
+    """(source, file name, sheet) for every CSV and every sales sheet of every workbook"""
+    parts = []
+    for source in sources:
+        with open_source(source) as (file_name, f):
+            parts.extend((source, file_name, sheet) for sheet in sales_datasets.sales_sheets(file_name, f))
+    return parts
+
+def ingest_sales(parts: List[Tuple[UploadSource, str, Optional[str]]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Sketch the parts in the ingest pool and merge the partial sketches; returns the summary and timings"""
+    start_time = time.perf_counter()
+    # Saved uploads are opened by path in the workers, pass-through uploads are sent as bytes
+    payloads = {}
+    for source, _, _ in parts:
+        if id(source) not in payloads:
+            if isinstance(source, SpooledUpload):
+                with open_source(source) as (_, f):
+                    payloads[id(source)] = f.read()
+            else:
+                payloads[id(source)] = source
+    args = [(file_name, payloads[id(source)], sheet, SALES_CHUNK_ROWS) for source, file_name, sheet in parts]
+
+    pool = get_ingest_pool() if len(parts) > 1 else None
+    if pool is None:
+        done = [sales_datasets.sketch_part(*arg) for arg in args]
+    else:
+        futures = [pool.submit(sales_datasets.sketch_part, *arg) for arg in args]
+        done = [future.result() for future in futures]
+    parse_seconds = time.perf_counter() - start_time
+
+    sketch = sales_datasets.merge_tree([part.pop("sketch") for part in done])
+    if sketch.rows == 0:
+        errors = "; ".join(f"{part['file']}{'/' + part['sheet'] if part['sheet'] else ''}: {part['error']}" for part in done)
+        raise ValueError(f"No sales rows found ({errors})")
+    summary = sketch.summary()
+    ingest = {
+        "parts": done,
+        "workers": SALES_INGEST_WORKERS if pool is not None else 1,
+        "parse_seconds": round(parse_seconds, 4),
+        "reduce_seconds": round(time.perf_counter() - start_time - parse_seconds, 4),
+        "slowest_part_seconds": max(part["parse_seconds"] for part in done),
+    }
+    print(f"📊 Sketched {summary['rows']} sales rows from {len(parts)} file(s)/sheet(s) in {parse_seconds:.2f}s "
+          f"(slowest {ingest['slowest_part_seconds']:.2f}s, ~{summary['distinct_customers']} customers)")
+    return summary, ingest
 
-async def process_excel_analysis(request_id: str, file_path: str, analysis_type: str):
-    start_time = datetime.now()
+def summarize_sales(sources: List[UploadSource]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Sketch summary of the uploads, or None to send a single spreadsheet to n8n as a file.
 
+    Several files, or a workbook with several sales sheets, are always
+    summarised here: the workflow only reads the first sheet of one file.
+    """
     try:
-        # Update status to processing
-        excel_analysis_queue[request_id]["status"] = "processing"
+        parts = sales_parts(sources)
+        if len(parts) == 1 and SALES_SUMMARY != "api":
+            return None
+        return ingest_sales(parts)
+    except Exception as e:
+        if len(sources) > 1:
+            raise
+        print(f"⚠️  Could not summarise {getattr(sources[0], 'filename', sources[0])}, sending the file to n8n: {e}")
+        return None
+
+def sales_summary_results(summary: Dict[str, Any], ingest: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    """Workflow-shaped output for a summary: the sketches as Metrics, per-label revenue as Ratios"""
+    return {
+        "Metrics": [summary],
+        "Ratios": [
+            {"channel_data": {label: d["total"] for label, d in summary["sale_value_by_channels"].items()}},
+            {"sales_map": {label: d["total"] for label, d in summary["sale_value_by_salespeople"].items()}},
+        ],
+        "Analysis": results.get("Analysis", ""),
+        "Ingest": ingest,
+    }
+
+def run_sales_webhook(source: Union[UploadSource, List[UploadSource]], summarized: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None,
+                      on_fragment=None) -> Dict[str, Any]:
+    """Send a sales spreadsheet (or the summary of several) to the n8n sales workflow and return its JSON output"""
+    if summarized is not None:
+        summary, ingest = summarized
+        payload = {"summary": summary}
+        if on_fragment is not None:
+            results = post_webhook_streaming(n8n_pools["sales"], '/webhook/sales-summary', on_fragment, json=payload)
+            return sales_summary_results(summary, ingest, results)
+        with n8n_pools["sales"].request("POST", '/webhook/sales-summary', json=payload) as state:
+            if state.status_code != 200:
+                raise Exception(f"Sales analysis failed with status code {state.status_code}")
+            return sales_summary_results(summary, ingest, state.json())
+
+    with open_source(source) as (file_name, f):
+        files = {'file': (file_name, f, 'application/xlsx')}
+        # '/webhook-test/sales'
+        if on_fragment is not None:
+            results = post_webhook_streaming(n8n_pools["sales"], '/webhook/sales', on_fragment, files=files)
+            results.setdefault("Metrics", [])
+            results.setdefault("Ratios", [])
+            return results
+        with n8n_pools["sales"].request("POST", '/webhook/sales', files=files) as state:
+            if state.status_code != 200:
+                raise Exception(f"Sales analysis failed with status code {state.status_code}")
+            return state.json()
+
+def run_narrative_webhook(pipeline: str, metrics: Any, ratios: Any, model: str, on_fragment=None) -> str:
+    """Ask the finance or sales workflow for a new narrative of extracted metrics and ratios, written by `model`"""
+    payload = {"metrics": metrics, "ratios": ratios, "model": model}
+    path = f'/webhook/{pipeline}-narrative'
+    if on_fragment is not None:
+        return post_webhook_streaming(n8n_pools[pipeline], path, on_fragment, json=payload)["Analysis"]
+    with n8n_pools[pipeline].request("POST", path, json=payload) as state:
+        if state.status_code != 200:
+            raise Exception(f"{pipeline.capitalize()} narrative failed with status code {state.status_code}")
+        return state.json()["Analysis"]
+
+def run_combined_narrative_webhook(analysis_finance: str, analysis_sales: str, model: Optional[str] = None, on_fragment=None) -> str:
+    """Ask the n8n Combined workflow to merge two narratives into one report"""
+    payload = {"analysis_finance": analysis_finance, "analysis_sales": analysis_sales}
+    if model is not None:
+        payload["model"] = model
+    if on_fragment is not None:
+        return post_webhook_streaming(n8n_pools["combined"], '/webhook/combined-narrative', on_fragment, "analysis", json=payload)["analysis"]
+    with n8n_pools["combined"].request("POST", '/webhook/combined-narrative', json=payload) as state:
+        if state.status_code != 200:
+            raise Exception(f"Combined analysis failed with status code {state.status_code}")
+        return state.json()["analysis"]
+
+# Pipeline stage graphs (see pipeline.py). Stage names are shared by the graphs, so the business
+# advisory graph reuses the finance/sales stage outputs of earlier runs on the same files.
+def pipeline_params(model: Optional[str] = None) -> Dict[str, Any]:
+    """Parameters read by the stages; part of their cache keys"""
+    return {"finance_extraction": FINANCE_EXTRACTION, "sales_summary": SALES_SUMMARY, "model": model}
+
+def finance_parse_stage(ctx: StageContext) -> Optional[Dict[str, Any]]:
+    """Statement pages extracted here in api mode, or None to send the PDF to n8n"""
+    if ctx.params["finance_extraction"] != "api":
+        return None
+    return extract_finance_text(ctx.source)
+
+def finance_extract_stage(ctx: StageContext) -> Dict[str, Any]:
+    return run_finance_webhook(ctx.source, ctx["finance:parse"], ctx.on_fragment)
+
+def sales_parse_stage(ctx: StageContext) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Sketch summary of the uploads, or None to send the spreadsheet to n8n"""
+    return summarize_sales(ctx.source if isinstance(ctx.source, list) else [ctx.source])
+
+def sales_extract_stage(ctx: StageContext) -> Dict[str, Any]:
+    return run_sales_webhook(ctx.source, ctx["sales:parse"], ctx.on_fragment)
+
+def narrative_stage(pipeline: str):
+    """The workflow's own narrative, or a new one from the narrative webhook when a model is chosen"""
+    def run(ctx: StageContext) -> str:
+        results = ctx[f"{pipeline}:extract"]
+        if ctx.params["model"] is None:
+            return results["Analysis"]
+        return run_narrative_webhook(pipeline, results["Metrics"], ctx[f"{pipeline}:ratios"], ctx.params["model"], ctx.on_fragment)
+    return run
+
+def combine_stage(ctx: StageContext) -> str:
+    return run_combined_narrative_webhook(ctx["finance:narrative"], ctx["sales:narrative"], ctx.params["model"], ctx.on_fragment)
+
+def pipeline_stages(pipeline: str, parse, extract, parse_params: List[str], streams: bool) -> List[Stage]:
+    """parse -> extract -> ratios -> narrative. The workflows return metrics, ratios and narrative
+    from one call, so ratios selects the workflow's ratios and narrative only calls n8n for a chosen model"""
+    return [
+        Stage(f"{pipeline}:parse", parse, params=parse_params, source=pipeline),
+        Stage(f"{pipeline}:extract", extract, deps=[f"{pipeline}:parse"], source=pipeline, streams=streams),
+        Stage(f"{pipeline}:ratios", lambda ctx: ctx[f"{pipeline}:extract"]["Ratios"], deps=[f"{pipeline}:extract"]),
+        Stage(f"{pipeline}:narrative", narrative_stage(pipeline), deps=[f"{pipeline}:extract", f"{pipeline}:ratios"],
+              params=["model"], streams=streams),
+    ]
+
+def result_stages(pipeline: str) -> List[str]:
+    return [f"{pipeline}:extract", f"{pipeline}:ratios", f"{pipeline}:narrative"]
+
+def finance_stages(streams: bool) -> List[Stage]:
+    return pipeline_stages("finance", finance_parse_stage, finance_extract_stage, ["finance_extraction"], streams)
+
+def sales_stages(streams: bool) -> List[Stage]:
+    return pipeline_stages("sales", sales_parse_stage, sales_extract_stage, ["sales_summary"], streams)
+
+PIPELINE_GRAPHS = {
+    "finance": StageGraph("finance", finance_stages(streams=True), result_stages("finance"), stage_executor),
+    "sales": StageGraph("sales", sales_stages(streams=True), result_stages("sales"), stage_executor),
+    # Only the combined narrative is streamed
+    "business-advisory": StageGraph(
+        "business-advisory",
+        finance_stages(streams=False) + sales_stages(streams=False) + [
+            Stage("combine", combine_stage, deps=["finance:narrative", "sales:narrative"], params=["model"], streams=True),
+        ],
+        result_stages("finance") + result_stages("sales") + ["combine"],
+        stage_executor,
+    ),
+}
+
+# Queue and result store of each pipeline
+PIPELINE_STORES = {
+    "finance": (analysis_queue, analysis_results),
+    "sales": (excel_analysis_queue, excel_analysis_results),
+    "business-advisory": (ba_analysis_queue, ba_analysis_results),
+}
+
+def pipeline_result(pipeline: str, outputs: Dict[str, Any], queue_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Result fields built from the outputs of the graph's result stages"""
+    if pipeline == "business-advisory":
+        return {
+            "metrics": {"finance": outputs["finance:extract"]["Metrics"], "sales": outputs["sales:extract"]["Metrics"]},
+            "ratios": {"finance": outputs["finance:ratios"], "sales": outputs["sales:ratios"]},
+            "analysis": outputs["combine"],
+            "analysis_finance": outputs["finance:narrative"],
+            "analysis_sales": outputs["sales:narrative"],
+            "text_length": len(outputs["combine"]),
+            "orchestration": queue_info.get("orchestration"),
+        }
+    results = outputs[f"{pipeline}:extract"]
+    result = {
+        "metrics": results["Metrics"],
+        "ratios": outputs[f"{pipeline}:ratios"],
+        "analysis": outputs[f"{pipeline}:narrative"],
+        "text_length": len(outputs[f"{pipeline}:narrative"]),
+    }
+    if "Ingest" in results:
+        result["ingest"] = results["Ingest"]
+    return result
 
-        # Step 1: Extract metrics
-        if (analysis_type in ["metrics", "full"]) and (analysis_type in ["ratios", "full"]):
-            state = requests.post(
-                # 'http://localhost:5678/webhook-test/sales',
-                'http://localhost:5678/webhook/sales',
-                files= {'file': (os.path.basename(file_path), open(file_path, 'rb'), 'application/xlsx')},
-            )
+def result_seeds(pipeline: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored finance/sales result as seeded extract, ratios and narrative stages"""
+    return {
+        f"{pipeline}:extract": {"Metrics": result["metrics"], "Ratios": result["ratios"], "Analysis": result["analysis"]},
+        f"{pipeline}:ratios": result["ratios"],
+        f"{pipeline}:narrative": result["analysis"],
+    }
 
-        # print('Debugging state from n8n Excel analysis:', state, '\n\n', state.keys())
+def release_sources(sources: Dict[str, Any], delete_files: bool = False):
+    for source in sources.values():
+        for part in (source if isinstance(source, list) else [source]):
+            release_source(part, delete_files)
+
+def flight_key(pipeline: str, digests: Dict[str, str], params: Dict[str, Any], seeds: Optional[Dict[str, Any]],
+               analysis_type: Optional[str]) -> str:
+    """Identical work has identical result stage keys (content hashes, parameters and seeds) and analysis_type"""
+    graph = PIPELINE_GRAPHS[pipeline]
+    keys = graph.keys(digests, params, seeds or {})
+    return digest({"pipeline": pipeline, "outputs": [keys[name] for name in graph.outputs], "analysis_type": analysis_type})
+
+async def run_analysis_graph(pipeline: str, request_id: str, sources: Dict[str, Any], params: Dict[str, Any],
+                             seeds: Optional[Dict[str, Any]] = None, digests: Optional[Dict[str, str]] = None,
+                             analysis_type: Optional[str] = None, delete_files: bool = False):
+    """Run a pipeline's stage graph for a queued request, store the result and remember the run for /rerun.
+
+    With COALESCE_ANALYSES, a request for work already in flight attaches to that run. The run then
+    owns the uploads of the request that started it, and the other requests release theirs when done.
+    Whoever releases an upload last also deletes a saved one with delete_files, whatever the outcome
+    (completed, failed or cancelled).
+    """
+    queue, results_store = PIPELINE_STORES[pipeline]
+    start_time = datetime.now()
+    releases_sources = True
 
-        # Processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
+    async def execute(flight):
+        try:
+            # Without a streaming request the webhooks are called in their plain JSON mode
+            on_fragment = flight.push if flight.streams() else None
+            return await PIPELINE_GRAPHS[pipeline].run(stage_outputs, sources, digests, params, seeds, on_fragment)
+        finally:
+            release_sources(sources, delete_files)
 
-        if state.status_code == 200:
-            results = state.json()
-
-            print('Debugging results from n8n Excel analysis:', results, '\n\n', results.keys())
-            # Store result
-            excel_analysis_results[request_id] = {
-                "request_id": request_id,
-                "status": "completed",
-                "metrics": results["Metrics"],
-                "ratios": results["Ratios"],
-                "analysis": results["Analysis"],
-                "text_length": len(results["Analysis"]),
-                "timestamp": datetime.now().isoformat(),
-                "processing_time": processing_time
-            }
-            excel_analysis_queue[request_id]["status"] = "completed"
-        
+    try:
+        queue[request_id]["status"] = "processing"
+
+        if digests is None:
+            digests = {name: await asyncio.to_thread(sources_digest, source) for name, source in sources.items()}
+        # A key of its own per request when not coalescing: the run is never shared, but can still be cancelled
+        key = flight_key(pipeline, digests, params, seeds, analysis_type) if COALESCE_ANALYSES else f"request:{request_id}"
+        flight = analysis_flights.join(key, request_id, execute, stream_fragment_sink(request_id))
+        releases_sources = flight.leader != request_id
+        if flight.leader != request_id:
+            queue[request_id]["coalesced_with"] = flight.leader
+        run = await analysis_flights.wait(request_id)
+        pipeline_runs[request_id] = {
+            "pipeline": pipeline,
+            "digests": digests,
+            "params": params,
+            "seeds": {name: run["stages"][name]["key"] for name in seeds or {}},
+        }
+
+        processing_time = (datetime.now() - start_time).total_seconds()
+        result = {
+            "request_id": request_id,
+            "status": "completed",
+            **pipeline_result(pipeline, run["outputs"], queue[request_id]),
+            "timestamp": datetime.now().isoformat(),
+            "processing_time": processing_time,
+            "model": params.get("model"),
+            "stages": run["stages"],
+        }
+        stream = narrative_streams.get(request_id)
+        if stream is not None and not stream.fragments:
+            # Nothing is streamed when the narrative comes from the cache
+            stream.push(result["analysis"])
+
+        if pipeline == "finance":
+            results_store[request_id] = AnalysisResult(**result)
+            await record_finance_metrics(request_id, result["metrics"])
         else:
-            raise Exception(f"Analysis failed with status code {state.status_code}")
+            results_store[request_id] = result
+        queue[request_id]["status"] = "completed"
+
+    except asyncio.CancelledError:
+        queue[request_id]["status"] = "cancelled"
+        queue[request_id]["error"] = "Analysis was cancelled"
 
     except Exception as e:
         processing_time = (datetime.now() - start_time).total_seconds()
-        excel_analysis_results[request_id] = {
+        error_result = {
             "request_id": request_id,
             "status": "failed",
             "metrics": {},
@@ -242,8 +898,42 @@ async def process_excel_analysis(request_id: str, file_path: str, analysis_type:
             "timestamp": datetime.now().isoformat(),
             "processing_time": processing_time
         }
-        excel_analysis_queue[request_id]["status"] = "failed"
-        excel_analysis_queue[request_id]["error"] = str(e)
+        results_store[request_id] = AnalysisResult(**error_result) if pipeline == "finance" else error_result
+        queue[request_id]["status"] = "failed"
+        queue[request_id]["error"] = str(e)
+
+    finally:
+        if releases_sources:
+            release_sources(sources, delete_files)
+        close_narrative_stream(request_id, queue[request_id].get("error"))
+        queue_completion_callback(request_id, pipeline, queue, results_store)
+
+async def process_analysis(request_id: str, file_path: UploadSource, analysis_type: str):
+    """Background task to process the analysis"""
+    await run_analysis_graph("finance", request_id, {"finance": file_path}, pipeline_params(), analysis_type=analysis_type,
+                             delete_files=True)
+
+async def process_excel_analysis(request_id: str, file_path: Union[UploadSource, List[UploadSource]], analysis_type: str):
+    await run_analysis_graph("sales", request_id, {"sales": file_path}, pipeline_params(), analysis_type=analysis_type)
+
+def post_combined_workflow(file_path_finance: str, file_path_sales: str) -> Dict[str, Any]:
+    """Send both files to the combined n8n workflow; blocks, so it runs on stage_executor"""
+    with open(file_path_sales, 'rb') as f_sales, open(file_path_finance, 'rb') as f_finance:
+        files = {
+            'finance_file': (os.path.basename(file_path_finance), f_finance, 'application/pdf'),
+            'sales_file': (os.path.basename(file_path_sales), f_sales, 'application/xlsx'),
+        }
+
+        with n8n_pools["combined"].request(
+            "POST",
+            # "/webhook-test/combined",
+            "/webhook/combined",
+            files=files,
+            params={'analysis_type': 'full'}
+        ) as state:
+            if state.status_code != 200:
+                raise Exception(f"Analysis failed with status code {state.status_code}")
+            return state.json()
 
 async def process_ba_analysis(request_id: str, file_path_finance: str, file_path_sales: str, analysis_type: str):
     start_time = datetime.now()
@@ -251,39 +941,26 @@ async def process_ba_analysis(request_id: str, file_path_finance: str, file_path
     try:
         ba_analysis_queue[request_id]["status"] = "processing"
 
-        with open(file_path_sales, 'rb') as f_sales, open(file_path_finance, 'rb') as f_finance:
-            files = {
-                'finance_file': (os.path.basename(file_path_finance), f_finance, 'application/pdf'),
-                'sales_file': (os.path.basename(file_path_sales), f_sales, 'application/xlsx'),
-            }
-
-            state = requests.post(
-                # "http://localhost:5678/webhook-test/combined",
-                "http://localhost:5678/webhook/combined",
-                files=files,
-                params={'analysis_type': 'full'}
-            )
+        results = await asyncio.get_running_loop().run_in_executor(
+            stage_executor, post_combined_workflow, file_path_finance, file_path_sales)
 
         # Processing time
         processing_time = (datetime.now() - start_time).total_seconds()
 
-        if state.status_code == 200:
-            results = state.json()
-
-            print('Debugging results from n8n BA analysis:', results, '\n\n', results.keys())
-
-            # Store result
-            ba_analysis_results[request_id] = {
-                "request_id": request_id,
-                "status": "completed",
-                "analysis": results["analysis"],
-                "analysis_finance": results["analysis_finance"],
-                "analysis_sales": results["analysis_sales"],
-                "text_length": len(results["analysis"]),
-                "timestamp": datetime.now().isoformat(),
-                "processing_time": processing_time
-            }
-            ba_analysis_queue[request_id]["status"] = "completed"
+        print('Debugging results from n8n BA analysis:', results, '\n\n', results.keys())
+
+        # Store result
+        ba_analysis_results[request_id] = {
+            "request_id": request_id,
+            "status": "completed",
+            "analysis": results["analysis"],
+            "analysis_finance": results["analysis_finance"],
+            "analysis_sales": results["analysis_sales"],
+            "text_length": len(results["analysis"]),
+            "timestamp": datetime.now().isoformat(),
+            "processing_time": processing_time
+        }
+        ba_analysis_queue[request_id]["status"] = "completed"
 
     except Exception as e:
         processing_time = (datetime.now() - start_time).total_seconds()
@@ -300,6 +977,42 @@ async def process_ba_analysis(request_id: str, file_path_finance: str, file_path
         ba_analysis_queue[request_id]["status"] = "failed"
         ba_analysis_queue[request_id]["error"] = str(e)
 
+    finally:
+        queue_completion_callback(request_id, "business-advisory", ba_analysis_queue, ba_analysis_results)
+
+async def process_ba_orchestrated(request_id: str, file_path_finance: str, file_path_sales: str, analysis_type: str):
+    """Run finance and sales concurrently from the API, then only the combined narrative in n8n"""
+    await run_analysis_graph("business-advisory", request_id, {"finance": file_path_finance, "sales": file_path_sales}, pipeline_params(),
+                             analysis_type=analysis_type)
+
+async def process_ba_from_results(request_id: str, seeds: Dict[str, Any]):
+    """Combine two completed finance/sales analyses, running only the combined narrative stage"""
+    await run_analysis_graph("business-advisory", request_id, {}, pipeline_params(), seeds, digests={})
+
+def find_completed_result(request_id: str):
+    """Return (kind, result dict) for a completed analysis of any pipeline"""
+    if request_id in analysis_results:
+        kind, result = "finance", analysis_results[request_id].dict()
+    elif request_id in excel_analysis_results:
+        kind, result = "sales", excel_analysis_results[request_id]
+    elif request_id in ba_analysis_results:
+        kind, result = "business-advisory", ba_analysis_results[request_id]
+    else:
+        raise HTTPException(status_code=404, detail="Analysis results not found")
+
+    if result["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Analysis is {result['status']}")
+    return kind, result
+
+async def render_in_pool(func, *args):
+    """Run a reports.* render function in the report process pool"""
+    global report_pool
+    if report_pool is None:
+        # Spawned like the extract and ingest pools: executor and health-check threads are running by now
+        report_pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(report_pool, func, *args)
+
 # API Endpoints
 @app.get("/", response_model=Dict[str, Any])
 async def root():
@@ -317,14 +1030,89 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "api_key_configured": bool(os.getenv("GOO_API_KEY"))
+        "api_key_configured": bool(os.getenv("GOO_API_KEY")),
+        "backends": {pipeline: pool.stats() for pipeline, pool in n8n_pools.items()},
+        "callbacks": callback_dispatcher.stats(),
+        "coalescing": analysis_flights.stats()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """n8n routing and concurrency gauges in the Prometheus text format"""
+    gauges = {
+        "n8n_concurrency_limit": ("Adaptive limit on requests in flight", []),
+        "n8n_in_flight": ("Requests in flight", []),
+        "n8n_waiting": ("Requests waiting for a concurrency slot", []),
+        "n8n_baseline_latency_seconds": ("Baseline round-trip latency used by the limiter", []),
+        "n8n_backend_healthy": ("1 if the backend is in rotation", []),
+        "n8n_backend_latency_ewma_seconds": ("Round-trip latency EWMA per backend", []),
     }
+    for pipeline, pool in n8n_pools.items():
+        stats = pool.stats()
+        concurrency = stats["concurrency"]
+        if concurrency is not None:
+            labels = f'pipeline="{pipeline}"'
+            gauges["n8n_concurrency_limit"][1].append((labels, concurrency["limit"]))
+            gauges["n8n_in_flight"][1].append((labels, concurrency["in_flight"]))
+            gauges["n8n_waiting"][1].append((labels, concurrency["waiting"]))
+            for path, baseline_ms in concurrency["baseline_latency_ms"].items():
+                gauges["n8n_baseline_latency_seconds"][1].append((f'{labels},path="{path}"', baseline_ms / 1000))
+        for backend in stats["backends"]:
+            labels = f'pipeline="{pipeline}",backend="{backend["base_url"]}"'
+            gauges["n8n_backend_healthy"][1].append((labels, int(backend["healthy"])))
+            if backend["ewma_latency_ms"] is not None:
+                gauges["n8n_backend_latency_ewma_seconds"][1].append((labels, backend["ewma_latency_ms"] / 1000))
+
+    lines = []
+    for name, (description, samples) in gauges.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{{{labels}}} {value}" for labels, value in samples]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", response_model=Dict[str, Any])
+async def readiness_check():
+    """Readiness probe: 503 until warm-up has finished and every pipeline has an n8n backend answering.
+
+    Per backend: the round trip of the last health probe, and the latency EWMA of webhook calls.
+    """
+    for pool in n8n_pools.values():
+        if not pool.ready():
+            await asyncio.to_thread(pool.check_health, N8N_HEALTH_PATH, N8N_HEALTH_TIMEOUT)
+
+    backends = {}
+    for pipeline, pool in n8n_pools.items():
+        stats = pool.stats()
+        backends[pipeline] = {
+            "ready": pool.ready(),
+            "healthy_backends": stats["healthy_backends"],
+            "backends": [
+                {
+                    "base_url": b["base_url"],
+                    "last_check_ok": b["last_check_ok"],
+                    "probe_latency_ms": b["probe_latency_ms"],
+                    "webhook_latency_ewma_ms": b["ewma_latency_ms"],
+                    "last_health_check": b["last_health_check"],
+                }
+                for b in stats["backends"]
+            ],
+        }
+
+    ready = warmup_state["finished"] is not None and all(b["ready"] for b in backends.values())
+    return ORJSONResponse(
+        {"ready": ready, "timestamp": datetime.now().isoformat(), "warmup": warmup_state, "backends": backends},
+        status_code=200 if ready else 503,
+    )
 
 @app.post("/analyze/upload", response_model=AnalysisResponse)
 async def analyze_upload(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="PDF file to analyze"),
-    analysis_type: str = "full"
+    analysis_type: str = "full",
+    stream: bool = False,
+    entity: Optional[str] = None,
+    period: Optional[str] = None,
+    callback_url: Optional[str] = Query(None, description="URL the result is POSTed to when the analysis completes or fails"),
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the original request")
 ):
     """Upload and analyze a PDF file"""
     
@@ -336,24 +1124,41 @@ async def analyze_upload(
     if analysis_type not in ["metrics", "ratios", "full"]:
         raise HTTPException(status_code=400, detail="Invalid analysis_type. Use 'metrics', 'ratios', or 'full'")
     
+    validate_finance_key(entity, period)
+    
     # Check API key
     # if not os.getenv("GOOGLE_API_KEY") and analysis_type == "full":
     #     raise HTTPException(status_code=500, detail="Google API key not configured")
     
+    callback = await callback_delivery(callback_url)
+
+    duplicate = find_idempotent_request("upload", idempotency_key, analysis_queue)
+    if duplicate is not None:
+        return duplicate
+    
     try:
         # Generate request ID
         request_id = str(uuid.uuid4())
         
-        # Save uploaded file
-        file_path = save_uploaded_file(file)
+        # Save uploaded file (or hold it in memory in pass-through mode)
+        file_path = hold_upload(file, save_uploaded_file)
         
         # Initialize queue entry
         analysis_queue[request_id] = {
             "status": "queued",
-            "file_path": file_path,
+            **source_queue_info(file_path),
             "analysis_type": analysis_type,
+            "stream": stream,
+            "entity": entity,
+            "period": period,
+            "idempotency_key": idempotency_key,
+            "callback": callback,
+            "profile": current_profile.get(),
             "timestamp": datetime.now().isoformat()
         }
+        remember_idempotency_key("upload", idempotency_key, request_id)
+        if stream:
+            open_narrative_stream(request_id)
 
         # Start background processing
         background_tasks.add_task(process_analysis, request_id, file_path, analysis_type)
@@ -371,32 +1176,56 @@ async def analyze_upload(
 @app.post("/analyze/spreadsheet/upload", response_model=AnalysisResponse)
 async def analyze_excel_upload(
     background_tasks: BackgroundTasks,
-    file: UploadFile = File(..., description="Excel file to analyze"),
-    analysis_type: str = "full"
+    file: Optional[UploadFile] = File(None, description="Excel file to analyze"),
+    files: Optional[List[UploadFile]] = File(None, description="Several Excel or CSV files analyzed as one dataset, e.g. monthly exports"),
+    analysis_type: str = "full",
+    stream: bool = False,
+    callback_url: Optional[str] = Query(None, description="URL the result is POSTed to when the analysis completes or fails"),
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the original request")
 ):
-    if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
-        raise HTTPException(status_code=400, detail="Only Excel and CSV files are supported")
+    uploads = ([file] if file is not None else []) + (files or [])
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Upload a file or one or more files")
+    if len(uploads) > SALES_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {SALES_MAX_FILES} files can be analyzed together")
+    for upload in uploads:
+        if not upload.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+            raise HTTPException(status_code=400, detail="Only Excel and CSV files are supported")
     
     if analysis_type not in ["metrics", "ratios", "full"]:
         raise HTTPException(status_code=400, detail="Invalid analysis_type")
     
+    callback = await callback_delivery(callback_url)
+
+    duplicate = find_idempotent_request("spreadsheet", idempotency_key, excel_analysis_queue)
+    if duplicate is not None:
+        return duplicate
+    
     try:
         request_id = str(uuid.uuid4())
-        file_path = save_uploaded_excel(file)
+        sources = [hold_upload(upload, save_uploaded_excel) for upload in uploads]
+        file_path = sources[0] if len(sources) == 1 else sources
 
         excel_analysis_queue[request_id] = {
             "status": "queued",
-            "file_path": file_path,
+            **(source_queue_info(file_path) if len(sources) == 1 else {"files": [{**source_queue_info(s), "file_name": u.filename} for s, u in zip(sources, uploads)]}),
             "analysis_type": analysis_type,
+            "stream": stream,
+            "idempotency_key": idempotency_key,
+            "callback": callback,
+            "profile": current_profile.get(),
             "timestamp": datetime.now().isoformat()
         }
+        remember_idempotency_key("spreadsheet", idempotency_key, request_id)
+        if stream:
+            open_narrative_stream(request_id)
 
         background_tasks.add_task(process_excel_analysis, request_id, file_path, analysis_type)
 
         return AnalysisResponse(
             request_id=request_id,
             status="queued",
-            message="Excel analysis started successfully",
+            message="Excel analysis started successfully" if len(sources) == 1 else f"Excel analysis of {len(sources)} files started successfully",
             timestamp=datetime.now().isoformat()
         )
 
@@ -408,7 +1237,11 @@ async def analyze_ba_upload(
     background_tasks: BackgroundTasks,
     finance_file: UploadFile = File(..., description="Excel file to analyze"),
     sales_file: UploadFile = File(..., description="PDF file to analyze"),
-    analysis_type: str = "full"
+    analysis_type: str = "full",
+    orchestration: Optional[str] = None,
+    stream: bool = False,
+    callback_url: Optional[str] = Query(None, description="URL the result is POSTed to when the analysis completes or fails"),
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the original request")
 ):
     if not finance_file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported for Finance analysis")
@@ -419,6 +1252,16 @@ async def analyze_ba_upload(
     if analysis_type not in ["metrics", "ratios", "full"]:
         raise HTTPException(status_code=400, detail="Invalid analysis_type")
     
+    orchestration = orchestration or BA_ORCHESTRATION
+    if orchestration not in ["workflow", "api"]:
+        raise HTTPException(status_code=400, detail="Invalid orchestration. Use 'workflow' or 'api'")
+    
+    callback = await callback_delivery(callback_url)
+
+    duplicate = find_idempotent_request("business-advisory", idempotency_key, ba_analysis_queue)
+    if duplicate is not None:
+        return duplicate
+    
     try:
         request_id = str(uuid.uuid4())
         file_path_sales = save_uploaded_excel(sales_file)
@@ -428,10 +1271,21 @@ async def analyze_ba_upload(
             "status": "queued",
             "file_path": file_path_sales,
             "analysis_type": analysis_type,
+            "orchestration": orchestration,
+            "stream": stream and orchestration == "api",
+            "idempotency_key": idempotency_key,
+            "callback": callback,
+            "profile": current_profile.get(),
             "timestamp": datetime.now().isoformat()
         }
+        remember_idempotency_key("business-advisory", idempotency_key, request_id)
 
-        background_tasks.add_task(process_ba_analysis, request_id, file_path_finance, file_path_sales, analysis_type)
+        if orchestration == "api":
+            if stream:
+                open_narrative_stream(request_id)
+            background_tasks.add_task(process_ba_orchestrated, request_id, file_path_finance, file_path_sales, analysis_type)
+        else:
+            background_tasks.add_task(process_ba_analysis, request_id, file_path_finance, file_path_sales, analysis_type)
 
         return AnalysisResponse(
             request_id=request_id,
@@ -443,10 +1297,61 @@ async def analyze_ba_upload(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process Excel upload: {str(e)}")
 
+@app.post("/analyze/business-advisory", response_model=AnalysisResponse)
+async def analyze_ba_from_results(
+    background_tasks: BackgroundTasks,
+    request: BusinessAdvisoryRequest
+):
+    """Combine existing finance and sales analyses without re-running their pipelines"""
+
+    finance_result = analysis_results.get(request.finance_request_id)
+    if finance_result is None:
+        raise HTTPException(status_code=404, detail="Finance request ID not found")
+    if finance_result.status != "completed":
+        raise HTTPException(status_code=409, detail="Finance analysis is not completed")
+
+    sales_result = excel_analysis_results.get(request.sales_request_id)
+    if sales_result is None:
+        raise HTTPException(status_code=404, detail="Sales request ID not found")
+    if sales_result["status"] != "completed":
+        raise HTTPException(status_code=409, detail="Sales analysis is not completed")
+
+    callback = await callback_delivery(request.callback_url)
+
+    try:
+        request_id = str(uuid.uuid4())
+
+        ba_analysis_queue[request_id] = {
+            "status": "queued",
+            "finance_request_id": request.finance_request_id,
+            "sales_request_id": request.sales_request_id,
+            "orchestration": "results",
+            "stream": request.stream,
+            "callback": callback,
+            "profile": current_profile.get(),
+            "timestamp": datetime.now().isoformat()
+        }
+        if request.stream:
+            open_narrative_stream(request_id)
+
+        seeds = {**result_seeds("finance", finance_result.dict()), **result_seeds("sales", sales_result)}
+        background_tasks.add_task(process_ba_from_results, request_id, seeds)
+
+        return AnalysisResponse(
+            request_id=request_id,
+            status="queued",
+            message="Business advisory analysis started successfully",
+            timestamp=datetime.now().isoformat()
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start business advisory analysis: {str(e)}")
+
 @app.post("/analyze/file", response_model=AnalysisResponse)
 async def analyze_existing_file(
     background_tasks: BackgroundTasks,
-    request: AnalysisRequest
+    request: AnalysisRequest,
+    idempotency_key: Optional[str] = Header(None, description="Retries with the same key return the original request")
 ):
     """Analyze an existing PDF file"""
     
@@ -456,10 +1361,18 @@ async def analyze_existing_file(
     if not os.path.exists(request.file_path):
         raise HTTPException(status_code=404, detail="File not found")
     
+    validate_finance_key(request.entity, request.period)
+    
     # Check API key
     # if not os.getenv("GOOGLE_API_KEY") and request.analysis_type == "full":
     #     raise HTTPException(status_code=500, detail="Google API key not configured")
     
+    callback = await callback_delivery(request.callback_url)
+
+    duplicate = find_idempotent_request("file", idempotency_key, analysis_queue)
+    if duplicate is not None:
+        return duplicate
+    
     try:
         # Generate request ID
         request_id = str(uuid.uuid4())
@@ -469,8 +1382,17 @@ async def analyze_existing_file(
             "status": "queued",
             "file_path": request.file_path,
             "analysis_type": request.analysis_type,
+            "stream": request.stream,
+            "entity": request.entity,
+            "period": request.period,
+            "idempotency_key": idempotency_key,
+            "callback": callback,
+            "profile": current_profile.get(),
             "timestamp": datetime.now().isoformat()
         }
+        remember_idempotency_key("file", idempotency_key, request_id)
+        if request.stream:
+            open_narrative_stream(request_id)
         
         # Start background processing
         background_tasks.add_task(process_analysis, request_id, request.file_path, request.analysis_type)
@@ -485,6 +1407,87 @@ async def analyze_existing_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start analysis: {str(e)}")
 
+@app.post("/rerun/{request_id}", response_model=AnalysisResponse)
+async def rerun_analysis(
+    request_id: str,
+    background_tasks: BackgroundTasks,
+    request: RerunRequest
+):
+    """Run a finished analysis again with new parameters; only the stages that read them (and their downstream) run"""
+
+    if request.model is not None and request.model not in NARRATIVE_MODELS:
+        raise HTTPException(status_code=400, detail=f"Invalid model. Use one of: {', '.join(NARRATIVE_MODELS)}")
+
+    record = pipeline_runs.get(request_id)
+    if record is None:
+        if any(request_id in queue for queue, _ in PIPELINE_STORES.values()):
+            raise HTTPException(status_code=409, detail="Analysis has no finished stage graph to re-run (still running, failed, or run by the Combined workflow)")
+        raise HTTPException(status_code=404, detail="Request ID not found")
+
+    pipeline = record["pipeline"]
+    graph = PIPELINE_GRAPHS[pipeline]
+    queue, _ = PIPELINE_STORES[pipeline]
+    params = {**record["params"], "model": request.model}
+    try:
+        seeds = {name: stage_outputs[key] for name, key in record["seeds"].items()}
+    except KeyError:
+        raise HTTPException(status_code=409, detail="The analyses this request combined are no longer cached; combine them again")
+    plan = graph.plan(stage_outputs, record["digests"], params, seeds)
+    # Uploads are released once an analysis finishes, so stages reading them can only come from the cache
+    missing = graph.unavailable(plan, {})
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Stages {', '.join(missing)} are no longer cached; upload the file again")
+
+    callback = await callback_delivery(request.callback_url)
+
+    try:
+        new_request_id = str(uuid.uuid4())
+        queue[new_request_id] = {
+            "status": "queued",
+            "rerun_of": request_id,
+            "model": request.model,
+            "plan": plan,
+            "orchestration": queue.get(request_id, {}).get("orchestration"),
+            "stream": request.stream,
+            "callback": callback,
+            "profile": current_profile.get(),
+            "timestamp": datetime.now().isoformat()
+        }
+        if request.stream:
+            open_narrative_stream(new_request_id)
+
+        background_tasks.add_task(run_analysis_graph, pipeline, new_request_id, {}, params, seeds, record["digests"])
+
+        stages = [name for name, status in plan.items() if status == "run"]
+        return AnalysisResponse(
+            request_id=new_request_id,
+            status="queued",
+            message=f"Re-running {', '.join(stages)}" if stages else "Every stage is cached",
+            data={"pipeline": pipeline, "rerun_of": request_id, "plan": plan},
+            timestamp=datetime.now().isoformat()
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start re-run: {str(e)}")
+
+@app.post("/cancel/{request_id}", response_model=Dict[str, Any])
+async def cancel_analysis(request_id: str):
+    """Cancel a running analysis. Requests sharing one run are counted; the run stops when the last one cancels"""
+
+    if not any(request_id in queue for queue, _ in PIPELINE_STORES.values()):
+        raise HTTPException(status_code=404, detail="Request ID not found")
+    remaining = analysis_flights.cancel(request_id)
+    if remaining is None:
+        raise HTTPException(status_code=409, detail="Analysis is not running (finished, not started yet, or run by the Combined workflow)")
+
+    return {
+        "request_id": request_id,
+        "status": "cancelled",
+        "attached_requests": remaining,
+        "message": "Analysis cancelled" if remaining == 0 else f"Detached from the shared run; {remaining} other request(s) still attached",
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.get("/status/{request_id}", response_model=Dict[str, Any])
 async def get_analysis_status(request_id: str):
     """Get the status of an analysis request"""
@@ -497,18 +1500,18 @@ async def get_analysis_status(request_id: str):
     # Check if analysis is complete
     if queue_info["status"] == "completed" and request_id in analysis_results:
         result = analysis_results[request_id]
-        return {
+        return ORJSONResponse({
             "request_id": request_id,
             "status": "completed",
             "result": result.dict(),
             "queue_info": queue_info
-        }
+        })
     
-    return {
+    return ORJSONResponse({
         "request_id": request_id,
         "status": queue_info["status"],
         "queue_info": queue_info
-    }
+    })
 
 @app.get("/results/{request_id}", response_model=AnalysisResult)
 async def get_analysis_results(request_id: str):
@@ -522,7 +1525,7 @@ async def get_analysis_results(request_id: str):
     if result.status == "failed":
         raise HTTPException(status_code=500, detail=f"Analysis failed: {result.analysis}")
     
-    return result
+    return ORJSONResponse(result.dict())
 
 @app.get("/status/spreadsheet/{request_id}")
 async def get_excel_status(request_id: str):
@@ -533,18 +1536,18 @@ async def get_excel_status(request_id: str):
 
     if queue_info["status"] == "completed" and request_id in excel_analysis_results:
         result = excel_analysis_results[request_id]
-        return {
+        return ORJSONResponse({
             "request_id": request_id, 
             "status": "completed", 
             "result": result, 
             "queue_info": queue_info
-        }
+        })
     
-    return {
+    return ORJSONResponse({
         "request_id": request_id, 
         "status": queue_info["status"], 
         "queue_info": queue_info
-    }
+    })
 
 @app.get("/results/spreadsheet/{request_id}")
 async def get_excel_results(request_id: str):
@@ -555,7 +1558,7 @@ async def get_excel_results(request_id: str):
     
     if result["status"] == "failed":
         raise HTTPException(status_code=500, detail=f"Analysis failed: {result['analysis']}")
-    return result
+    return ORJSONResponse(result)
 
 @app.get("/status/business-advisory/{request_id}")
 async def get_ba_status(request_id: str):
@@ -568,18 +1571,18 @@ async def get_ba_status(request_id: str):
     if queue_info["status"] == "completed" and request_id in ba_analysis_results:
         result = ba_analysis_results[request_id]
         
-        return {
+        return ORJSONResponse({
             "request_id": request_id, 
             "status": "completed", 
             "result": result, 
             "queue_info": queue_info
-        }
+        })
     
-    return {
+    return ORJSONResponse({
         "request_id": request_id, 
         "status": queue_info["status"], 
         "queue_info": queue_info
-    }
+    })
 
 @app.get("/results/business-advisory/{request_id}")
 async def get_ba_results(request_id: str):
@@ -590,31 +1593,292 @@ async def get_ba_results(request_id: str):
     
     if result["status"] == "failed":
         raise HTTPException(status_code=500, detail=f"Analysis failed: {result['analysis']}")
+    return ORJSONResponse(result)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/stream/{request_id}")
+async def stream_narrative(request_id: str):
+    """Relay the narrative of a streaming analysis as server-sent events while it is generated"""
+    stream = narrative_streams.get(request_id)
+
+    if stream is None:
+        if request_id in analysis_results:
+            result = analysis_results[request_id].dict()
+        elif request_id in excel_analysis_results:
+            result = excel_analysis_results[request_id]
+        elif request_id in ba_analysis_results:
+            result = ba_analysis_results[request_id]
+        elif request_id in analysis_queue or request_id in excel_analysis_queue or request_id in ba_analysis_queue:
+            raise HTTPException(status_code=409, detail="Streaming was not enabled for this request")
+        else:
+            raise HTTPException(status_code=404, detail="Request ID not found")
+
+        async def replay():
+            if result["status"] == "completed":
+                yield sse_event("fragment", {"text": result["analysis"]})
+                yield sse_event("done", {"status": "completed"})
+            else:
+                yield sse_event("error", {"status": "failed", "detail": result["analysis"]})
+
+        return StreamingResponse(replay(), media_type="text/event-stream")
+
+    async def relay():
+        async for text in stream.follow():
+            yield sse_event("fragment", {"text": text})
+        if stream.error:
+            yield sse_event("error", {"status": "failed", "detail": stream.error})
+        else:
+            yield sse_event("done", {"status": "completed"})
+
+    return StreamingResponse(relay(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/reports/{request_id}.pdf")
+async def get_report_pdf(request_id: str):
+    """Render (or serve the cached) PDF report for a completed analysis"""
+    kind, result = find_completed_result(request_id)
+
+    report_path = Path("reports") / f"{reports.result_hash(kind, result)}.pdf"
+    if not report_path.exists():
+        await render_in_pool(reports.render_report, kind, result, str(report_path), "charts")
+
+    return FileResponse(report_path, media_type="application/pdf", filename=f"{request_id}.pdf")
+
+@app.get("/charts/{request_id}/{chart}.png")
+async def get_chart_png(request_id: str, chart: str):
+    """Render (or serve the cached) chart PNG for a completed analysis"""
+    kind, result = find_completed_result(request_id)
+
+    if chart not in reports.CHARTS[kind]:
+        raise HTTPException(status_code=404, detail=f"Chart not available. Use one of: {', '.join(reports.CHARTS[kind])}")
+
+    chart_path = Path("charts") / f"{reports.result_hash(kind, result)}-{chart}.png"
+    if not chart_path.exists():
+        await render_in_pool(reports.render_chart, kind, result, chart, str(chart_path))
+
+    return FileResponse(chart_path, media_type="image/png")
+
+@app.post("/datasets/{dataset_id}/append", response_model=Dict[str, Any])
+async def append_dataset_file(dataset_id: str, file: UploadFile = File(..., description="Excel or CSV sales export to append")):
+    """Append a sales export to a dataset and update its aggregates from the new rows only"""
+    if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+        raise HTTPException(status_code=400, detail="Only Excel and CSV files are supported")
+
+    start_time = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(sales_datasets.append_file, dataset_id, Path(file.filename).name, file.file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result["processing_time"] = time.perf_counter() - start_time
+    print(f"📚 Dataset {dataset_id}: +{result['rows_appended']} rows ({result['total_rows']} total) in {result['processing_time']:.3f}s")
+    return result
+
+@app.post("/datasets/{dataset_id}/rows", response_model=Dict[str, Any])
+async def append_dataset_rows(dataset_id: str, request: DatasetRowsRequest):
+    """Append sales rows posted as JSON to a dataset"""
+    if not request.rows:
+        raise HTTPException(status_code=400, detail="rows must not be empty")
+
+    start_time = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(sales_datasets.append_records, dataset_id, request.rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result["processing_time"] = time.perf_counter() - start_time
+    print(f"📚 Dataset {dataset_id}: +{result['rows_appended']} rows ({result['total_rows']} total) in {result['processing_time']:.3f}s")
     return result
 
+@app.get("/datasets", response_model=Dict[str, Any])
+async def list_sales_datasets():
+    """List the sales datasets"""
+    return {"datasets": sales_datasets.list_datasets()}
+
+@app.get("/datasets/{dataset_id}", response_model=Dict[str, Any])
+async def get_sales_dataset(dataset_id: str, top: Optional[int] = None):
+    """Aggregates per channel, salesperson, customer and item; `top` limits each to the highest revenue"""
+    try:
+        dataset = sales_datasets.get_dataset(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    return ORJSONResponse(await asyncio.to_thread(dataset.summary, top))
+
+@app.get("/datasets/{dataset_id}/rollup", response_model=Dict[str, Any])
+async def get_dataset_rollup(
+    dataset_id: str,
+    grain: str = "month",
+    by: Optional[str] = None,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to")
+):
+    """Daily, weekly or monthly totals, optionally per channel, salesperson, item or customer"""
+    if grain not in sales_datasets.GRAINS:
+        raise HTTPException(status_code=400, detail=f"Invalid grain. Use one of: {', '.join(sales_datasets.GRAINS)}")
+    if by is not None and by not in sales_datasets.DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid by. Use one of: {', '.join(sales_datasets.DIMENSIONS)}")
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    try:
+        dataset = sales_datasets.get_dataset(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    return ORJSONResponse({
+        "dataset_id": dataset_id,
+        "grain": grain,
+        "by": by,
+        "from": from_date.isoformat() if from_date else None,
+        "to": to_date.isoformat() if to_date else None,
+        "rows": await asyncio.to_thread(dataset.rollup, grain, by, from_date, to_date)
+    })
+
+@app.delete("/datasets/{dataset_id}")
+async def delete_sales_dataset(dataset_id: str):
+    """Delete a dataset and its stored aggregates"""
+    if not sales_datasets.DATASET_ID_PATTERN.match(dataset_id) or not sales_datasets.delete_dataset(dataset_id):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return {"message": f"Deleted dataset {dataset_id}"}
+
+@app.post("/finance/records", response_model=Dict[str, Any])
+async def record_finance_statements(request: FinanceRecordsRequest):
+    """Add or replace metrics per entity and period, e.g. to backfill historical statements"""
+    if not request.records:
+        raise HTTPException(status_code=400, detail="records must not be empty")
+    try:
+        recorded = await asyncio.to_thread(finance_store.store.upsert, [r.dict() for r in request.records])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"recorded": recorded}
+
+RATIO_BATCH_MAX_RECORDS = int(os.getenv("RATIO_BATCH_MAX_RECORDS", "100000"))
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+def parse_ratio_batch(body: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """Metric records from a CSV body (one statement per row) or JSON ({"records": [...]} or a bare list)"""
+    if "csv" in content_type:
+        return list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+
+    payload = json.loads(body)
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected {\"records\": [...]} with one object per statement")
+    return records
+
+def ratio_batch_response(columns: Dict[str, Any], output: str) -> Response:
+    if output == "arrow":
+        table = pa.table({name: pa.array(values, from_pandas=True) for name, values in columns.items()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_STREAM_TYPE)
+
+    names = list(columns)
+    lists = [
+        [None if isinstance(v, float) and v != v else v for v in values.tolist()] if hasattr(values, "tolist") else values
+        for values in columns.values()
+    ]
+    return ORJSONResponse({"count": len(lists[0]) if lists else 0, "records": [dict(zip(names, row)) for row in zip(*lists)]})
+
+@app.post("/ratios/batch")
+async def compute_ratio_batch(request: Request, format: Optional[str] = None):
+    """Compute financial ratios for many metric records in one vectorized pass.
+
+    Send JSON ({"records": [{"id": ..., "Total Revenue": ..., ...}]}) or CSV
+    (Content-Type: text/csv). Ratios come back as numbers in percent, null
+    where revenue is zero or a metric is missing. Use format=arrow (or
+    Accept: application/vnd.apache.arrow.stream) for an Arrow IPC stream.
+    """
+    output = format or ("arrow" if ARROW_STREAM_TYPE in request.headers.get("accept", "") else "json")
+    if output not in ["json", "arrow"]:
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'json' or 'arrow'")
+    if output == "arrow":
+        try:
+            pa.table
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow output requires pyarrow to be installed")
+
+    try:
+        records = parse_ratio_batch(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {str(e)}")
+    if len(records) > RATIO_BATCH_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {RATIO_BATCH_MAX_RECORDS} records per batch")
+
+    start_time = time.perf_counter()
+    columns = await asyncio.to_thread(finance_store.batch_ratios, records)
+    try:
+        response = await asyncio.to_thread(ratio_batch_response, columns, output)
+    except (TypeError, ValueError) as e:
+        # Arrow needs one type per column, e.g. not ids that mix numbers and strings
+        raise HTTPException(status_code=400, detail=f"Cannot build Arrow table: {str(e)}")
+    print(f"🧮 Computed ratios for {len(records)} records in {time.perf_counter() - start_time:.3f}s")
+    return response
+
+@app.get("/finance/entities", response_model=Dict[str, Any])
+async def list_finance_entities():
+    """Entities in the finance store and the periods recorded for each"""
+    return ORJSONResponse({"entities": await asyncio.to_thread(finance_store.store.entity_summary)})
+
+@app.get("/finance/entities/{entity}/trend", response_model=Dict[str, Any])
+async def get_finance_trend(entity: str):
+    """Metrics and ratios per period with year-over-year growth and margin changes"""
+    trend = await asyncio.to_thread(finance_store.store.trend, entity)
+    if trend is None:
+        raise HTTPException(status_code=404, detail="Entity not found")
+    return ORJSONResponse({"entity": entity, "periods": trend})
+
+@app.get("/finance/entities/{entity}/peers", response_model=Dict[str, Any])
+async def get_finance_peer_ranks(entity: str, period: str):
+    """Percentile rank of every metric and ratio among the entities reporting the same period"""
+    ranks = await asyncio.to_thread(finance_store.store.percentile_ranks, entity, period)
+    if ranks is None:
+        raise HTTPException(status_code=404, detail="No metrics for this entity and period")
+    return ORJSONResponse({"entity": entity, "period": period, "ranks": ranks})
+
+@app.get("/finance/peers", response_model=Dict[str, Any])
+async def get_finance_ranking(period: str, metric: str = "Net Profit Margin"):
+    """Entities of a period ranked by one metric or ratio"""
+    if metric not in finance_store.COLUMN_INDEX:
+        raise HTTPException(status_code=400, detail=f"Unknown metric. Use one of: {', '.join(finance_store.COLUMNS)}")
+    ranking = await asyncio.to_thread(finance_store.store.ranking, period, metric)
+    if ranking is None:
+        raise HTTPException(status_code=404, detail="No metrics for this period")
+    return ORJSONResponse({"period": period, "metric": metric, "entities": ranking})
+
 @app.get("/queue", response_model=Dict[str, Any])
 async def get_queue_status():
     """Get the current analysis queue status"""
-    return {
+    return ORJSONResponse({
         "total_requests": len(analysis_queue),
         "completed": len([r for r in analysis_queue.values() if r["status"] == "completed"]),
         "processing": len([r for r in analysis_queue.values() if r["status"] == "processing"]),
         "queued": len([r for r in analysis_queue.values() if r["status"] == "queued"]),
         "failed": len([r for r in analysis_queue.values() if r["status"] == "failed"]),
         "requests": analysis_queue
-    }
+    })
 
 @app.delete("/cleanup/{request_id}")
 async def cleanup_analysis(request_id: str):
     """Clean up analysis results and queue entry"""
     
+    analysis_flights.cancel(request_id)
     if request_id in analysis_results:
         del analysis_results[request_id]
+    pipeline_runs.pop(request_id, None)
     
     if request_id in analysis_queue:
         # Clean up temporary file if it exists
         queue_info = analysis_queue[request_id]
-        if "file_path" in queue_info:
+        # A shared run started by this request may still be reading the file for the requests attached to it
+        if "file_path" in queue_info and not analysis_flights.leads(request_id):
             cleanup_file(queue_info["file_path"])
         del analysis_queue[request_id]
     
@@ -624,21 +1888,198 @@ async def cleanup_analysis(request_id: str):
 async def cleanup_all():
     """Clean up all analysis results and queue entries"""
     
+    for request_id in analysis_queue:
+        analysis_flights.cancel(request_id)
+
     # Clean up all temporary files
-    for queue_info in analysis_queue.values():
-        if "file_path" in queue_info:
+    for request_id, queue_info in analysis_queue.items():
+        if "file_path" in queue_info and not analysis_flights.leads(request_id):
             cleanup_file(queue_info["file_path"])
     
     # Clear all data
+    for request_id in analysis_queue:
+        pipeline_runs.pop(request_id, None)
     analysis_results.clear()
     analysis_queue.clear()
     
     return {"message": "Cleaned up all analyses"}
 
+async def warm_up():
+    """Open pooled connections to every n8n backend and load the lazily imported engines"""
+    start = time.perf_counter()
+    warmup_state["started"] = datetime.now().isoformat()
+    print(f"🔥 Warming up {WARMUP_CONNECTIONS} connection(s) per n8n backend")
+
+    for pipeline, pool in n8n_pools.items():
+        await asyncio.to_thread(pool.warm_up, N8N_HEALTH_PATH, N8N_HEALTH_TIMEOUT, WARMUP_CONNECTIONS)
+        if not pool.ready():
+            warmup_state["errors"].append(f"No {pipeline} backend answered the warm-up probe")
+
+    for module in WARMUP_MODULES:
+        try:
+            await asyncio.to_thread(module._load)
+            warmup_state["modules"][module._name] = round(lazy_import_times.get(module._name, 0.0), 3)
+        except ImportError as e:
+            # Optional dependencies (pyarrow) may be missing
+            warmup_state["modules"][module._name] = None
+            print(f"⚠️  Skipped warm-up of {module._name}: {e}")
+
+    warmup_state["duration_seconds"] = round(time.perf_counter() - start, 3)
+    warmup_state["finished"] = datetime.now().isoformat()
+    print(f"✅ Warm-up finished in {warmup_state['duration_seconds']:.2f}s")
+
+@app.on_event("startup")
+async def start_health_checks():
+    global health_check_task, warmup_task
+    callback_dispatcher.start()
+    warmup_task = asyncio.create_task(warm_up())
+    if N8N_HEALTH_INTERVAL > 0:
+        health_check_task = asyncio.create_task(
+            health_check_loop(n8n_pools, N8N_HEALTH_PATH, N8N_HEALTH_INTERVAL, N8N_HEALTH_TIMEOUT)
+        )
+
+@app.on_event("shutdown")
+async def shutdown_report_pool():
+    if report_pool is not None:
+        report_pool.shutdown(wait=False, cancel_futures=True)
+    if extract_pool is not None:
+        extract_pool.shutdown(wait=False, cancel_futures=True)
+    if ingest_pool is not None:
+        ingest_pool.shutdown(wait=False, cancel_futures=True)
+    if health_check_task is not None:
+        health_check_task.cancel()
+    if warmup_task is not None:
+        warmup_task.cancel()
+    callback_dispatcher.stop()
+
+def require_admin(admin_token: Optional[str]):
+    if not is_admin(admin_token):
+        raise HTTPException(status_code=403, detail="A valid X-Admin-Token is required")
+
+@app.get("/profiles", response_model=Dict[str, Any])
+async def list_profiles(admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Saved request profiles, newest first"""
+    require_admin(admin_token)
+    paths = sorted(PROFILE_DIR.glob("*.folded"), key=lambda p: p.stat().st_mtime, reverse=True) if PROFILE_DIR.exists() else []
+    return {
+        "profiles": [
+            {"url": f"/profiles/{p.name}", "size_bytes": p.stat().st_size, "created": datetime.fromtimestamp(p.stat().st_mtime).isoformat()}
+            for p in paths
+        ]
+    }
+
+@app.get("/profiles/{name}")
+async def get_profile(name: str, admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Collapsed stacks of a saved profile, for flamegraph.pl, speedscope or inferno"""
+    require_admin(admin_token)
+    path = PROFILE_DIR / name
+    if not re.fullmatch(r"[\w-]+\.folded", name) or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+def memory_stores() -> Dict[str, Any]:
+    """In-memory stores reported by /admin/memory"""
+    stores = {
+        "analysis_queue": analysis_queue,
+        "analysis_results": analysis_results,
+        "excel_analysis_queue": excel_analysis_queue,
+        "excel_analysis_results": excel_analysis_results,
+        "ba_analysis_queue": ba_analysis_queue,
+        "ba_analysis_results": ba_analysis_results,
+        "stage_outputs": stage_outputs,
+        "pipeline_runs": pipeline_runs,
+        "idempotency_keys": idempotency_keys,
+        "narrative_streams": narrative_streams,
+        "sales_datasets": sales_datasets.sales_datasets,
+    }
+    if pdf_extract.loaded:
+        stores["pdf_page_text_cache"] = pdf_extract.page_text_cache
+    return stores
+
+def validate_group_by(group_by: str):
+    if group_by not in memory_report.GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by. Use one of: {', '.join(memory_report.GROUP_BY)}")
+
+@app.get("/admin/memory", response_model=Dict[str, Any])
+async def get_memory_report(admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """RSS, open file descriptors, store sizes and tracemalloc status"""
+    require_admin(admin_token)
+    # Copied on the loop, which mutates the queues and caches, then sized off it
+    stores = memory_report.snapshot_stores(memory_stores())
+    report = await asyncio.to_thread(memory_report.process_report, stores)
+    report["result_budget"] = result_budget.stats()
+    return report
+
+@app.post("/admin/memory/tracing", response_model=Dict[str, Any])
+async def set_memory_tracing(
+    enabled: bool = True,
+    frames: int = Query(1, ge=1, le=64, description="Stack frames recorded per allocation"),
+    admin_token: Optional[str] = Header(None, alias="X-Admin-Token")
+):
+    """Start or stop tracemalloc; stopping discards the kept snapshots"""
+    require_admin(admin_token)
+    if enabled:
+        memory_report.start_tracing(frames)
+    else:
+        memory_report.stop_tracing()
+    return memory_report.tracing_status()
+
+@app.post("/admin/memory/snapshots", response_model=Dict[str, Any])
+async def take_memory_snapshot(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = "lineno",
+    admin_token: Optional[str] = Header(None, alias="X-Admin-Token")
+):
+    """Take a tracemalloc snapshot and return its top allocation sites"""
+    require_admin(admin_token)
+    validate_group_by(group_by)
+    try:
+        return await asyncio.to_thread(memory_report.take_snapshot, limit, group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/admin/memory/snapshots/{snapshot_id}/diff", response_model=Dict[str, Any])
+async def diff_memory_snapshots(
+    snapshot_id: str,
+    against: Optional[str] = Query(None, description="Older snapshot id (default: the previous one)"),
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = "lineno",
+    admin_token: Optional[str] = Header(None, alias="X-Admin-Token")
+):
+    """Allocation sites that grew between two snapshots"""
+    require_admin(admin_token)
+    validate_group_by(group_by)
+    try:
+        return await asyncio.to_thread(memory_report.diff_snapshots, snapshot_id, against, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Snapshot not found: {e.args[0]}")
+
+@app.get("/debug/imports", response_model=Dict[str, Any])
+async def get_import_report(importtime: bool = False):
+    """Startup import cost, lazily loaded modules and (optionally) a fresh -X importtime breakdown"""
+    if not DEBUG:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # A module is loaded once any of its proxies (here or in sales_datasets, sketches) imported it
+    names = dict.fromkeys(module._name for module in lazy_modules)
+    report = {
+        "startup_import_seconds": STARTUP_IMPORT_SECONDS,
+        "lazy_modules": {
+            name: {
+                "loaded": any(module.loaded for module in lazy_modules if module._name == name),
+                "import_seconds": lazy_import_times.get(name),
+            }
+            for name in names
+        },
+    }
+    if importtime:
+        report["importtime"] = await asyncio.to_thread(importtime_report, "api")
+    return report
+
 # Error handlers
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
@@ -647,6 +2088,8 @@ async def global_exception_handler(request, exc):
         }
     )
 
+STARTUP_IMPORT_SECONDS = time.perf_counter() - _import_started
+
 if __name__ == "__main__":
     import uvicorn
     
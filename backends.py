@@ -0,0 +1,386 @@
+"""
+Pools of n8n backends per pipeline with load-aware routing and health checks.
+
+Each pipeline (finance, sales, combined) can run on several n8n instances.
+Requests go to the healthy backend with the fewest requests in flight
+("least_outstanding") or the lowest latency EWMA weighted by load ("ewma").
+Backends are ejected after repeated failures, either on live traffic or on the
+periodic health check, and reinstated once a health check succeeds again.
+
+Requests in flight per pipeline are capped by an AIMD limiter: the limit grows
+by about one per round of requests while latency stays near its baseline, and
+is cut multiplicatively when latency climbs or n8n returns 5xx responses. The
+baseline is kept per webhook path, since one pool serves quick text/summary
+calls and slow LLM narrative calls alike.
+
+File uploads are streamed as a multipart body read from the open files, so a
+large upload is never copied into memory to be sent.
+"""
+
+import asyncio
+import os
+import uuid
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP session so connections to n8n are pooled and reused
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+
+ROUTING_STRATEGIES = ["least_outstanding", "ewma"]
+
+# Failures of the backend rather than of the request: these count towards ejection and cut the limit
+BACKEND_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+class MultipartBody:
+    """multipart/form-data body streamed from open files, for `files`-style {field: (filename, file, content type)}.
+
+    Each file is sent from its current position to its end, in chunks. The length is known up front,
+    so the request carries a Content-Length instead of being chunked, and iterating again resends it.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, files: Dict[str, Any]):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        # (part header, file, start offset, length) per file
+        self.parts = []
+        for field, (filename, f, content_type) in files.items():
+            start = f.tell()
+            length = f.seek(0, os.SEEK_END) - start
+            f.seek(start)
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{self.quote(field)}"; filename="{self.quote(filename)}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode("utf-8")
+            self.parts.append((header, f, start, length))
+        self.closing = f"--{self.boundary}--\r\n".encode("utf-8")
+
+    @staticmethod
+    def quote(value: str) -> str:
+        # As browsers (and urllib3) do for form-data names
+        return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+    def __len__(self) -> int:
+        return sum(len(header) + length + 2 for header, _, _, length in self.parts) + len(self.closing)
+
+    def __iter__(self):
+        for header, f, start, length in self.parts:
+            yield header
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(self.CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{header!r} ended {remaining} bytes early")
+                remaining -= len(chunk)
+                yield chunk
+            yield b"\r\n"
+        yield self.closing
+
+class AdaptiveLimiter:
+    """AIMD limit on concurrent requests, driven by round-trip latency and errors.
+
+    Each route (webhook path) has its own baseline: the lowest latency seen on it over the current and
+    previous `baseline_window` seconds, so a lasting change in workload is accepted after at most two
+    windows. A request slower than `tolerance` times its route's baseline, or a failed one, cuts the
+    limit by `backoff`; requests that started before the last cut are ignored so
+    one slow burst only cuts once. The limit only grows while it is being used.
+    """
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 backoff: float = 0.7, tolerance: float = 2.0, baseline_window: float = 60.0):
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.baseline_window = baseline_window
+        # route -> lowest recent latency, and [window start, lowest in this window, lowest in the previous one]
+        self.baselines: Dict[str, float] = {}
+        self._windows: Dict[str, List[Any]] = {}
+        self.in_flight = 0
+        self.waiting = 0
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """Block until a slot is free; returns the start time to pass to release()"""
+        with self._cond:
+            self.waiting += 1
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.waiting -= 1
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, latency: Optional[float], failed: bool, route: str = ""):
+        """Free the slot; latency None frees it without adjusting the limit (the request never reached n8n)"""
+        with self._cond:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+            if latency is None:
+                self._cond.notify_all()
+                return
+            if not failed:
+                now = time.monotonic()
+                window = self._windows.setdefault(route, [now, None, None])
+                if now - window[0] > self.baseline_window:
+                    window[:] = [now, None, window[1]]
+                if window[1] is None or latency < window[1]:
+                    window[1] = latency
+                self.baselines[route] = min(m for m in window[1:] if m is not None)
+
+            congested = failed or latency > self.baselines[route] * self.tolerance
+            if congested:
+                if started >= self._last_decrease and self.limit > self.min_limit:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+                    self.decreases += 1
+            elif in_flight * 2 >= self.limit and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.increases += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "baseline_latency_ms": {route: round(baseline * 1000, 1) for route, baseline in self.baselines.items()},
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+class Backend:
+    """One n8n instance and its live routing statistics"""
+
+    def __init__(self, base_url: str, ewma_alpha: float = 0.3):
+        self.base_url = base_url.rstrip("/")
+        self.ewma_alpha = ewma_alpha
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ewma_latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_health_check: Optional[str] = None
+        # Outcome and round-trip time of the last health check or warm-up probe (not a webhook call)
+        self.last_check_ok: Optional[bool] = None
+        self.probe_latency: Optional[float] = None
+
+    def record_latency(self, seconds: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = seconds
+        else:
+            self.ewma_latency = self.ewma_alpha * seconds + (1 - self.ewma_alpha) * self.ewma_latency
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "last_error": self.last_error,
+            "last_health_check": self.last_health_check,
+            "last_check_ok": self.last_check_ok,
+            "probe_latency_ms": round(self.probe_latency * 1000, 1) if self.probe_latency is not None else None,
+        }
+
+class BackendPool:
+    """Backends serving one pipeline"""
+
+    def __init__(self, name: str, base_urls: List[str], strategy: str = "least_outstanding", eject_after: int = 3,
+                 limiter: Optional[AdaptiveLimiter] = None):
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}. Use one of: {', '.join(ROUTING_STRATEGIES)}")
+        if not base_urls:
+            raise ValueError(f"No n8n backends configured for {name}")
+        self.name = name
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.backends = [Backend(url) for url in base_urls]
+        self.limiter = limiter
+        self._lock = threading.Lock()
+
+    def _score(self, backend: Backend):
+        latency = backend.ewma_latency or 0.0
+        if self.strategy == "ewma":
+            return (latency * (backend.outstanding + 1), backend.outstanding)
+        return (backend.outstanding, latency)
+
+    def choose(self) -> Backend:
+        """Pick a backend; if every backend is ejected, fall back to all of them"""
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy] or self.backends
+            best = min(self._score(b) for b in candidates)
+            backend = random.choice([b for b in candidates if self._score(b) == best])
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _finish(self, backend: Optional[Backend], path: str, elapsed: Optional[float], error: Optional[str],
+                started: Optional[float] = None):
+        """Free the limiter slot and the backend; elapsed None (a client-side error) records neither latency nor failure"""
+        if self.limiter is not None and started is not None:
+            self.limiter.release(started, elapsed, error is not None, path)
+        if backend is None:
+            return
+        with self._lock:
+            backend.outstanding -= 1
+            if elapsed is None:
+                return
+            if error is None:
+                backend.record_latency(elapsed)
+                backend.consecutive_failures = 0
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = error
+            if backend.healthy and backend.consecutive_failures >= self.eject_after:
+                backend.healthy = False
+                print(f"⚠️  Ejected n8n backend {backend.base_url} from {self.name} pool: {error}")
+
+    @contextmanager
+    def request(self, method: str, path: str, **kwargs):
+        """Send a request to the chosen backend and yield the response.
+
+        The backend counts as busy until the block exits, so streamed bodies are
+        included in its outstanding count. Connection errors, timeouts and 5xx responses
+        count towards ejection; other errors (a bad URL, an unreadable body) are the
+        caller's and only free the slot. With a limiter, the call first waits for a free slot, blocking
+        the calling thread: call it from a dedicated executor, not the event loop or asyncio's
+        default executor. `files` are sent as a streamed MultipartBody.
+        """
+        if "files" in kwargs:
+            body = MultipartBody(kwargs.pop("files"))
+            kwargs["data"] = body
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Content-Type": body.content_type}
+        started = self.limiter.acquire() if self.limiter is not None else None
+        backend: Optional[Backend] = None
+        start = time.perf_counter()
+        elapsed: Optional[float] = None
+        error = None
+        try:
+            backend = self.choose()
+            try:
+                response = session.request(method, backend.base_url + path, **kwargs)
+            except BACKEND_ERRORS as e:
+                elapsed, error = time.perf_counter() - start, str(e)
+                raise
+
+            if response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+            try:
+                with response:
+                    yield response
+            except BACKEND_ERRORS as e:
+                error = str(e)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+        finally:
+            self._finish(backend, path, elapsed, error, started)
+
+    def probe(self, backend: Backend, path: str, timeout: float):
+        """Health-check one backend; eject it on failure and reinstate it on success"""
+        start = time.perf_counter()
+        try:
+            ok = session.get(backend.base_url + path, timeout=timeout).status_code < 500
+            error = None if ok else "health check failed"
+        except requests.RequestException as e:
+            ok, error = False, str(e)
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            backend.last_health_check = datetime.now().isoformat()
+            backend.last_check_ok = ok
+            backend.probe_latency = latency
+            if ok:
+                if not backend.healthy:
+                    print(f"✅ Reinstated n8n backend {backend.base_url} in {self.name} pool")
+                backend.healthy = True
+                backend.consecutive_failures = 0
+            else:
+                backend.last_error = error
+                if backend.healthy:
+                    print(f"⚠️  Ejected n8n backend {backend.base_url} from {self.name} pool: {error}")
+                backend.healthy = False
+
+    def check_health(self, path: str, timeout: float):
+        """Probe every backend once"""
+        for backend in self.backends:
+            self.probe(backend, path, timeout)
+
+    def warm_up(self, path: str, timeout: float, connections: int):
+        """Probe every backend `connections` times at once, leaving that many keep-alive connections in the session pool"""
+        probes = [backend for backend in self.backends for _ in range(connections)]
+        with ThreadPoolExecutor(max_workers=max(len(probes), 1)) as executor:
+            list(executor.map(lambda backend: self.probe(backend, path, timeout), probes))
+
+    def ready(self) -> bool:
+        """True once at least one backend has answered its last health check"""
+        with self._lock:
+            return any(b.last_check_ok for b in self.backends)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "strategy": self.strategy,
+                "healthy_backends": sum(b.healthy for b in self.backends),
+                "backends": [b.stats() for b in self.backends],
+            }
+        stats["concurrency"] = self.limiter.stats() if self.limiter is not None else None
+        return stats
+
+def urls_from_env(name: str, default: str) -> List[str]:
+    return [url.strip() for url in os.getenv(name, default).split(",") if url.strip()]
+
+def pools_from_env() -> Dict[str, BackendPool]:
+    """Build the finance/sales/combined pools from N8N_*_URLS (comma-separated base URLs)"""
+    default = os.getenv("N8N_BASE_URL", "http://localhost:5678")
+    strategy = os.getenv("N8N_ROUTING", "least_outstanding")
+    eject_after = int(os.getenv("N8N_EJECT_AFTER", "3"))
+    adaptive = os.getenv("N8N_ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+
+    def limiter() -> Optional[AdaptiveLimiter]:
+        if not adaptive:
+            return None
+        return AdaptiveLimiter(
+            initial=int(os.getenv("N8N_LIMIT_INITIAL", "8")),
+            min_limit=int(os.getenv("N8N_LIMIT_MIN", "1")),
+            max_limit=int(os.getenv("N8N_LIMIT_MAX", "64")),
+            backoff=float(os.getenv("N8N_LIMIT_BACKOFF", "0.7")),
+            tolerance=float(os.getenv("N8N_LIMIT_TOLERANCE", "2.0")),
+            baseline_window=float(os.getenv("N8N_LIMIT_BASELINE_WINDOW", "60")),
+        )
+
+    return {
+        pipeline: BackendPool(pipeline, urls_from_env(f"N8N_{pipeline.upper()}_URLS", default), strategy, eject_after, limiter())
+        for pipeline in ("finance", "sales", "combined")
+    }
+
+async def health_check_loop(pools: Dict[str, BackendPool], path: str, interval: float, timeout: float):
+    """Actively probe every backend in the background"""
+    while True:
+        for pool in pools.values():
+            await asyncio.to_thread(pool.check_health, path, timeout)
+        await asyncio.sleep(interval)
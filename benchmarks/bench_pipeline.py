@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Parsing, aggregation, metric extraction and serialization benchmarks on synthetic inputs (see synth.py).
+
+Cases, sized in rows (pages for extract_metrics):
+
+- parse_csv, parse_xlsx, parse_xls: read_sales_chunks + prepare_rows over every sales sheet of an export
+- aggregate_sketch: SalesSketch.update and summary over prepared chunks (parsing is not timed)
+- aggregate_dataset: SalesDataset.fold and summary over prepared chunks (parsing is not timed)
+- extract_metrics: extract_statement_text on a statement replicated to N pages, page cache cleared
+- serialize_result: a dataset summary of that many rows rendered with ORJSONResponse and
+  written to and read back from a ResultStore
+
+Every case and size runs in a fresh child process, so one case's allocations do
+not inflate another's peak RSS. The peak is the child's resident high-water mark
+while the case runs (reset after setup on Linux; elsewhere it includes setup).
+Results record the median and best time, throughput and peak RSS, and can be
+saved as a JSON baseline and compared with a later run. A regression is a slowdown
+or peak RSS growth above the thresholds; comparing exits with status 1 when
+there is one.
+
+    python benchmarks/bench_pipeline.py --rows 10000,100000 --pages 10,100 --output baseline.json
+    python benchmarks/bench_pipeline.py --compare baseline.json               # run now, compare
+    python benchmarks/bench_pipeline.py --compare baseline.json current.json  # compare two saved runs
+    python benchmarks/bench_pipeline.py --against HEAD~1                      # HEAD~1 vs the working tree
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import synth
+
+REPO_DIR = synth.REPO_DIR
+CHUNK_ROWS = int(os.getenv("SALES_CHUNK_ROWS", "100000"))
+CASES = ["parse_csv", "parse_xlsx", "parse_xls", "aggregate_sketch", "aggregate_dataset", "extract_metrics", "serialize_result"]
+
+# Case setup and timing, run in the child process with the benchmarked tree first on sys.path
+
+def sales_chunks(path: Path):
+    """Raw frames of every sales sheet of the export"""
+    import sales_datasets
+
+    # Trees from before multi-sheet uploads read the first sheet only
+    sheets = [None]
+    if hasattr(sales_datasets, "sales_sheets"):
+        with open(path, "rb") as f:
+            sheets = sales_datasets.sales_sheets(path.name, f)
+    for sheet in sheets:
+        with open(path, "rb") as f:
+            yield from sales_datasets.read_sales_chunks(path.name, f, CHUNK_ROWS, *([sheet] if sheet else []))
+
+def parse_case(path: Path):
+    import sales_datasets
+
+    def run():
+        start = time.perf_counter()
+        rows = sum(len(sales_datasets.prepare_rows(frame)) for frame in sales_chunks(path))
+        return time.perf_counter() - start, rows
+    return run, "rows"
+
+def aggregate_case(path: Path, dataset: bool):
+    import sales_datasets
+
+    def run():
+        target = sales_datasets.SalesDataset("bench") if dataset else sales_datasets.SalesSketch()
+        fold = target.fold if dataset else target.update
+        seconds, rows = 0.0, 0
+        for frame in sales_chunks(path):
+            prepared = sales_datasets.prepare_rows(frame)
+            start = time.perf_counter()
+            fold(prepared)
+            seconds += time.perf_counter() - start
+            rows += len(prepared)
+        start = time.perf_counter()
+        target.summary()
+        return seconds + time.perf_counter() - start, rows
+    return run, "rows"
+
+def extract_case(path: Path):
+    import pdf_extract
+
+    data = path.read_bytes()
+
+    def run():
+        pdf_extract.page_text_cache.clear()
+        start = time.perf_counter()
+        extraction = pdf_extract.extract_statement_text(data)
+        return time.perf_counter() - start, extraction["page_count"]
+    return run, "pages"
+
+def serialize_case(path: Path):
+    import sales_datasets
+    from fast_responses import ORJSONResponse
+    from result_store import ResultBudget, ResultStore
+
+    dataset = sales_datasets.SalesDataset("bench")
+    for frame in sales_chunks(path):
+        dataset.fold(sales_datasets.prepare_rows(frame))
+    payload = {"request_id": str(uuid.uuid4()), "status": "completed", "dataset": dataset.summary()}
+    # No hot entries, so every read decompresses
+    store = ResultStore("bench", ResultBudget(0), hot_entries=0)
+
+    def run():
+        start = time.perf_counter()
+        body = ORJSONResponse(payload).body
+        store["result"] = payload
+        store["result"]
+        return time.perf_counter() - start, len(body)
+    return run, "bytes"
+
+def setup_case(spec):
+    path = Path(spec["path"])
+    case = spec["case"]
+    if case.startswith("parse_"):
+        return parse_case(path)
+    if case.startswith("aggregate_"):
+        return aggregate_case(path, dataset=case == "aggregate_dataset")
+    if case == "extract_metrics":
+        return extract_case(path)
+    return serialize_case(path)
+
+def proc_status(field: str):
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss() -> bool:
+    """Reset the resident high-water mark (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss() -> int:
+    peak = proc_status("VmHWM")
+    if peak is not None:
+        return peak
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def run_child(spec):
+    """Set up one case, time it `repeat` times and print the measurement as JSON"""
+    sys.path.insert(0, spec["repo"])
+    os.chdir(spec["repo"])
+    run, unit = setup_case(spec)
+    setup_rss = proc_status("VmRSS")
+    peak_reset = reset_peak_rss()
+
+    times, units = [], 0
+    for _ in range(spec["repeat"]):
+        seconds, units = run()
+        times.append(seconds)
+    median = statistics.median(times)
+    print(json.dumps({
+        "unit": unit,
+        "units": units,
+        "seconds": median,
+        "seconds_min": min(times),
+        "throughput": units / median if median else None,
+        "peak_rss_mb": peak_rss() / 1024 / 1024,
+        "setup_rss_mb": setup_rss / 1024 / 1024 if setup_rss is not None else None,
+        "peak_includes_setup": not peak_reset,
+    }))
+
+# Suite
+
+def case_specs(cases, rows, pages, repeat: int):
+    specs = []
+    for case in cases:
+        sizes = pages if case == "extract_metrics" else rows
+        specs.extend({"case": case, "size": size, "repeat": repeat} for size in sizes)
+    return specs
+
+def case_input(case: str, size: int) -> Path:
+    if case == "extract_metrics":
+        return synth.ensure_statement(size)
+    return synth.ensure_sales(size, case.split("_", 1)[1] if case.startswith("parse_") else "csv")
+
+def git(repo: Path, *args) -> str:
+    return subprocess.run(["git", "-C", str(repo), *args], capture_output=True, text=True, check=True).stdout.strip()
+
+def tree_info(repo: Path):
+    try:
+        return {"commit": git(repo, "rev-parse", "HEAD"), "dirty": bool(git(repo, "status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+def machine_info():
+    import numpy
+    import pandas
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+    }
+
+def run_suite(specs, repo: Path = REPO_DIR, quiet: bool = False):
+    results = []
+    for spec in specs:
+        entry = {"case": spec["case"], "size": spec["size"]}
+        try:
+            path = case_input(spec["case"], spec["size"])
+        except RuntimeError as e:
+            results.append({**entry, "skipped": str(e)})
+            if not quiet:
+                print(f"⏭️  {spec['case']} {spec['size']}: {e}")
+            continue
+
+        child = subprocess.run(
+            [sys.executable, __file__, "--child", json.dumps({**spec, "path": str(path), "repo": str(repo)})],
+            capture_output=True, text=True,
+        )
+        lines = child.stdout.strip().splitlines()
+        if child.returncode != 0 or not lines:
+            error = (child.stderr.strip().splitlines() or ["child process failed"])[-1]
+            results.append({**entry, "error": error})
+            if not quiet:
+                print(f"❌ {spec['case']} {spec['size']}: {error}")
+            continue
+        results.append({**entry, "repeat": spec["repeat"], **json.loads(lines[-1])})
+        if not quiet:
+            print(f"⏱️  {format_result(results[-1])}")
+    return {
+        "suite": "pipeline",
+        "created": datetime.now().isoformat(),
+        "tree": tree_info(repo),
+        "machine": machine_info(),
+        "chunk_rows": CHUNK_ROWS,
+        "results": results,
+    }
+
+def format_result(result) -> str:
+    return (f"{result['case']:<18}{result['size']:>10}  {result['seconds'] * 1000:>10.1f} ms"
+            f"  {result['throughput']:>14,.0f} {result['unit']}/s  {result['peak_rss_mb']:>8.1f} MB peak")
+
+# Comparison
+
+def compare(baseline, current, time_threshold: float, memory_threshold: float):
+    """Per case and size present in both runs: time and peak RSS change and a status"""
+    measured = lambda report: {(r["case"], r["size"]): r for r in report["results"] if "seconds" in r}
+    before, after = measured(baseline), measured(current)
+    rows = []
+    for key, new in after.items():
+        old = before.get(key)
+        if old is None:
+            continue
+        time_change = new["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+        memory_change = new["peak_rss_mb"] / old["peak_rss_mb"] - 1 if old["peak_rss_mb"] else 0.0
+        if time_change > time_threshold or memory_change > memory_threshold:
+            status = "regression"
+        elif time_change < -time_threshold or memory_change < -memory_threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({
+            "case": key[0],
+            "size": key[1],
+            "seconds_before": old["seconds"],
+            "seconds_after": new["seconds"],
+            "time_change": time_change,
+            "peak_rss_mb_before": old["peak_rss_mb"],
+            "peak_rss_mb_after": new["peak_rss_mb"],
+            "memory_change": memory_change,
+            "status": status,
+        })
+    return rows
+
+def print_comparison(baseline, current, rows):
+    if baseline["machine"] != current["machine"]:
+        print("⚠️  The runs were made on different machines or library versions; timings may not be comparable")
+    print(f"Comparing {(baseline['tree']['commit'] or 'unknown')[:12]} -> {(current['tree']['commit'] or 'unknown')[:12]}"
+          f"{' (uncommitted changes)' if current['tree']['dirty'] else ''}")
+    print(f"{'case':<18}{'size':>10}{'before ms':>12}{'after ms':>12}{'time':>9}{'before MB':>11}{'after MB':>10}{'memory':>9}  status")
+    icons = {"regression": "❌", "improvement": "🚀", "ok": "✅"}
+    for row in rows:
+        print(f"{row['case']:<18}{row['size']:>10}{row['seconds_before'] * 1000:>12.1f}{row['seconds_after'] * 1000:>12.1f}"
+              f"{row['time_change']:>+9.1%}{row['peak_rss_mb_before']:>11.1f}{row['peak_rss_mb_after']:>10.1f}"
+              f"{row['memory_change']:>+9.1%}  {icons[row['status']]} {row['status']}")
+
+def run_against(ref: str, specs, quiet: bool = False):
+    """Run the suite on a temporary worktree of `ref`, then on the working tree"""
+    worktree = Path(tempfile.mkdtemp(prefix="bench-")) / "tree"
+    git(REPO_DIR, "worktree", "add", "--detach", str(worktree), ref)
+    try:
+        if not quiet:
+            print(f"📦 Benchmarking {ref}")
+        baseline = run_suite(specs, worktree, quiet)
+    finally:
+        git(REPO_DIR, "worktree", "remove", "--force", str(worktree))
+        shutil.rmtree(worktree.parent, ignore_errors=True)
+    if not quiet:
+        print("📦 Benchmarking the working tree")
+    return baseline, run_suite(specs, quiet=quiet)
+
+def sizes(value: str):
+    return [int(size) for size in value.split(",") if size]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=sizes, default=sizes("10000,100000"), help="Sales sizes, e.g. 10000,1000000,50000000")
+    parser.add_argument("--pages", type=sizes, default=sizes("10,100"), help="Statement sizes in pages")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"Comma-separated subset of: {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Save the run as a JSON baseline")
+    parser.add_argument("--json", action="store_true", help="Print the run (or comparison) as JSON")
+    parser.add_argument("--compare", nargs="+", metavar="RUN", help="BASELINE [CURRENT]: compare with a saved run, running now without CURRENT")
+    parser.add_argument("--against", metavar="REF", help="Run the suite on a git ref and on the working tree, and compare")
+    parser.add_argument("--time-threshold", type=float, default=0.15, help="Slowdown flagged as a regression")
+    parser.add_argument("--memory-threshold", type=float, default=0.10, help="Peak RSS growth flagged as a regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Invalid case {unknown[0]!r}. Use one of: {', '.join(CASES)}")
+    specs = case_specs(cases, args.rows, args.pages, args.repeat)
+
+    if args.against:
+        baseline, current = run_against(args.against, specs, args.json)
+    elif args.compare:
+        baseline = json.loads(Path(args.compare[0]).read_text())
+        current = json.loads(Path(args.compare[1]).read_text()) if len(args.compare) > 1 else run_suite(specs, quiet=args.json)
+    else:
+        baseline, current = None, run_suite(specs, quiet=args.json)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2))
+        print(f"💾 Saved {args.output}", file=sys.stderr if args.json else sys.stdout)
+
+    if baseline is None:
+        if args.json:
+            print(json.dumps(current, indent=2))
+        return
+
+    rows = compare(baseline, current, args.time_threshold, args.memory_threshold)
+    if args.json:
+        print(json.dumps({"baseline": baseline["tree"], "current": current["tree"], "comparison": rows}, indent=2))
+    else:
+        print_comparison(baseline, current, rows)
+    if any(row["status"] == "regression" for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
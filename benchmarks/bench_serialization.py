@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for /status, /results and /queue payloads.
+
+Compares FastAPI's default JSON encoding with the orjson response class, both
+behind jsonable_encoder and returned directly (as the API endpoints do), and
+reports bytes on the wire uncompressed, gzipped and brotli-compressed.
+
+    python benchmarks/bench_serialization.py [--scale 10] [--repeat 50] [--json]
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from fast_responses import ORJSONResponse, brotli, orjson
+
+def sample_narratives():
+    """Real narratives pinned in the Combined workflow, used as representative LLM output"""
+    workflow = REPO_DIR / "workflows" / "Business Advisory Analysis" / "Business Advisory Analysis Combined.json"
+    pinned = json.loads(workflow.read_text(encoding="utf-8"))["pinData"]["Merge"]
+    return pinned[0]["json"]["finance_analysis"], pinned[1]["json"]["sales_analysis"]
+
+def sales_rows(scale: int):
+    with open(REPO_DIR / "data_csv.csv", newline="", encoding="latin-1") as f:
+        rows = list(csv.DictReader(f))
+    return rows * scale
+
+def finance_result(narrative: str):
+    return {
+        "request_id": str(uuid.uuid4()),
+        "status": "completed",
+        "metrics": {
+            "Total Revenue": 889312345.12,
+            "Total Cost of Sales": 247712345.55,
+            "Profit Before Tax": 384212345.01,
+            "Total Expenses": 257412345.90,
+            "Net Profit": 384212345.01,
+            "Income Tax Expenses": 96112345.33,
+            "Profit For the Year": 288212345.68,
+        },
+        "ratios": {"Gross Margin": "72.15%", "Net Profit Margin": "43.20%", "PBT Margin": "43.20%", "Expense Ratio": "28.94%"},
+        "analysis": narrative,
+        "text_length": len(narrative),
+        "timestamp": datetime.now().isoformat(),
+        "processing_time": 12.34,
+    }
+
+def sales_result(narrative: str, rows):
+    columns = {key: [row[key] for row in rows] for key in rows[0]}
+    channel_data, sales_map, customer_id_counter = {}, {}, {}
+    for row in rows:
+        value = float(row["Total Sale Value"])
+        channel_data.setdefault(row["Channel"].strip(), []).append(value)
+        sales_map.setdefault(row["Salesperson"], []).append(value)
+        customer_id_counter[row["Customer ID"]] = customer_id_counter.get(row["Customer ID"], 0) + 1
+    return {
+        "request_id": str(uuid.uuid4()),
+        "status": "completed",
+        "metrics": [columns],
+        "ratios": [{"channel_data": channel_data}, {"sales_map": sales_map}, {"customer_id_counter": customer_id_counter}],
+        "analysis": narrative,
+        "text_length": len(narrative),
+        "timestamp": datetime.now().isoformat(),
+        "processing_time": 23.45,
+    }
+
+def queue_snapshot(entries: int):
+    requests = {
+        str(uuid.uuid4()): {
+            "status": "completed",
+            "file_path": f"uploads/{uuid.uuid4()}.pdf",
+            "analysis_type": "full",
+            "timestamp": datetime.now().isoformat(),
+        }
+        for _ in range(entries)
+    }
+    return {
+        "total_requests": entries,
+        "completed": entries,
+        "processing": 0,
+        "queued": 0,
+        "failed": 0,
+        "requests": requests,
+    }
+
+def time_render(response_class, payload, repeat: int, encode: bool = True):
+    """Mean seconds to render a response; with encode, jsonable_encoder runs first as FastAPI does for returned dicts"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        content = jsonable_encoder(payload) if encode else payload
+        body = response_class(content=content).body
+    return (time.perf_counter() - start) / repeat, body
+
+def run(scale: int, repeat: int):
+    finance_text, sales_text = sample_narratives()
+    payloads = {
+        "results/finance": finance_result(finance_text),
+        "results/spreadsheet": sales_result(sales_text, sales_rows(scale)),
+        "queue": queue_snapshot(100 * scale),
+    }
+
+    report = []
+    for name, payload in payloads.items():
+        default_time, body = time_render(JSONResponse, payload, repeat)
+        orjson_time, _ = time_render(ORJSONResponse, payload, repeat)
+        direct_time, _ = time_render(ORJSONResponse, payload, repeat, encode=False)
+        report.append({
+            "payload": name,
+            "default_ms": default_time * 1000,
+            "orjson_ms": orjson_time * 1000,
+            "orjson_direct_ms": direct_time * 1000,
+            "speedup": default_time / direct_time if direct_time else None,
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=6)),
+            "br_bytes": len(brotli.compress(body, quality=4)) if brotli is not None else None,
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10, help="Copies of data_csv.csv in the sales payload, x100 queue entries")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    report = run(args.scale, args.repeat)
+
+    if args.json:
+        print(json.dumps({"orjson": orjson is not None, "brotli": brotli is not None, "results": report}, indent=2))
+        return
+
+    print(f"orjson installed: {orjson is not None}, brotli installed: {brotli is not None}")
+    print(f"{'payload':<22}{'default ms':>12}{'orjson ms':>12}{'direct ms':>12}{'speedup':>9}{'bytes':>11}{'gzip':>10}{'br':>10}")
+    for row in report:
+        br = row["br_bytes"] if row["br_bytes"] is not None else "-"
+        print(
+            f"{row['payload']:<22}{row['default_ms']:>12.3f}{row['orjson_ms']:>12.3f}{row['orjson_direct_ms']:>12.3f}{row['speedup']:>8.1f}x"
+            f"{row['bytes']:>11}{row['gzip_bytes']:>10}{br:>10}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Synthetic inputs for the pipeline benchmarks.
+
+Sales exports keep the columns of data_csv.csv and sample its items, unit
+prices, salespeople and channels. Rows come in invoices of about three lines
+dated through one year. The number of customers grows with the row count, and
+customers are skewed so that a few of them are heavy hitters. Rows are generated
+and written in chunks, so 50M-row CSVs need no more memory than 10K-row ones.
+XLSX workbooks start a new sheet every 1,048,575 rows and XLS workbooks every
+65,535 rows (writing XLS needs the xlwt package).
+
+Statement PDFs are demo6_fs.pdf replicated to N pages: copies of its header
+page come first and the four statement pages last, so metric extraction reads
+every page. Each copy gets a distinct content stream, so the page text cache
+does not short-circuit the extraction.
+
+Files are written to benchmarks/data (or BENCH_DATA_DIR) and reused:
+
+    python benchmarks/synth.py sales --rows 1000000 --format csv
+    python benchmarks/synth.py statement --pages 500
+"""
+
+import argparse
+import io
+import os
+import sys
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(os.getenv("BENCH_DATA_DIR", REPO_DIR / "benchmarks" / "data"))
+
+SALES_FORMATS = ["csv", "xlsx", "xls"]
+CHUNK_ROWS = 500_000
+SHEET_ROWS = {"xlsx": 1_048_575, "xls": 65_535}
+LINES_PER_INVOICE = 3
+STATEMENT_PAGES = 4
+
+def sales_profile():
+    """Columns of data_csv.csv and the items, salespeople and channels to sample, with their frequencies"""
+    sample = pd.read_csv(REPO_DIR / "data_csv.csv", dtype=str, encoding="latin-1")
+    items = sample.groupby("Item Code").agg(
+        name=("Item Name", "first"),
+        price=("Unit Price", "first"),
+        weight=("Item Code", "size"),
+    )
+    items["price"] = items["price"].astype(float)
+    items["weight"] = items["weight"] / items["weight"].sum()
+    return (
+        list(sample.columns),
+        items,
+        sample["Salesperson"].value_counts(normalize=True),
+        sample["Channel"].value_counts(normalize=True),
+    )
+
+def sales_frames(rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS):
+    """Synthetic sales rows in frames of at most chunk_rows rows"""
+    columns, items, salespeople, channels = sales_profile()
+    rng = np.random.default_rng(seed)
+    customers = max(55, rows // 40)
+    invoices = max(1, rows // LINES_PER_INVOICE)
+    first_day = np.datetime64(date(2025, 1, 1))
+    next_invoice = 0
+
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        # A row starts a new invoice with probability 1/LINES_PER_INVOICE (the chunk's first row always does)
+        starts = rng.random(n) < 1 / LINES_PER_INVOICE
+        starts[0] = True
+        invoice = np.cumsum(starts) - 1
+        count = int(invoice[-1]) + 1
+        invoice_number = next_invoice + np.arange(count)
+        next_invoice += count
+
+        # Per invoice: the day (invoices run through the year in order), customer, salesperson and channel
+        days = np.minimum(invoice_number * 365 // invoices, 364)
+        customer = (customers * rng.random(count) ** 3).astype(np.int64) + 1
+        salesperson = rng.choice(salespeople.index.to_numpy(), size=count, p=salespeople.to_numpy())
+        channel = rng.choice(channels.index.to_numpy(), size=count, p=channels.to_numpy())
+
+        item = rng.choice(len(items), size=n, p=items["weight"].to_numpy())
+        quantity = rng.integers(1, 15, size=n)
+        price = items["price"].to_numpy()[item]
+        dates = pd.Series(first_day + days[invoice])
+
+        yield pd.DataFrame({
+            "Date": dates.dt.day.astype(str) + "/" + dates.dt.month.astype(str) + "/" + dates.dt.year.astype(str),
+            "Invoice No": pd.Series(invoice_number[invoice] + 1).astype(str).str.zfill(6),
+            "Item Code": items.index.to_numpy()[item],
+            "Item Name": items["name"].to_numpy()[item],
+            "Quantity Sold": quantity,
+            "Unit Price": price,
+            "Total Sale Value": quantity * price,
+            "Customer ID": pd.Series(customer[invoice]).astype(str).str.zfill(6),
+            "Salesperson": salesperson[invoice],
+            "Channel": channel[invoice],
+        }, columns=columns)
+
+def write_csv(path: Path, frames):
+    with open(path, "w", newline="", encoding="latin-1") as f:
+        for i, frame in enumerate(frames):
+            frame.to_csv(f, index=False, header=i == 0)
+
+def sheet_rows(frames, limit: int):
+    """(sheet number, row tuples) with at most `limit` rows per sheet"""
+    sheet, used = 0, 0
+    for frame in frames:
+        start = 0
+        while start < len(frame):
+            if used == limit:
+                sheet, used = sheet + 1, 0
+            part = frame.iloc[start:start + limit - used]
+            used += len(part)
+            start += len(part)
+            yield sheet, part.itertuples(index=False, name=None)
+
+def write_xlsx(path: Path, frames, columns):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheets = {}
+    for number, rows in sheet_rows(frames, SHEET_ROWS["xlsx"]):
+        if number not in sheets:
+            sheets[number] = workbook.create_sheet(f"Sales {number + 1}")
+            sheets[number].append(columns)
+        for row in rows:
+            sheets[number].append([value.item() if hasattr(value, "item") else value for value in row])
+    workbook.save(path)
+
+def write_xls(path: Path, frames, columns):
+    try:
+        import xlwt
+    except ImportError:
+        raise RuntimeError("Writing .xls needs the xlwt package (pip install xlwt)")
+
+    workbook = xlwt.Workbook()
+    sheets = {}
+    for number, rows in sheet_rows(frames, SHEET_ROWS["xls"]):
+        if number not in sheets:
+            sheets[number] = [workbook.add_sheet(f"Sales {number + 1}"), 1]
+            for col, name in enumerate(columns):
+                sheets[number][0].write(0, col, name)
+        sheet = sheets[number]
+        for row in rows:
+            for col, value in enumerate(row):
+                sheet[0].write(sheet[1], col, value.item() if hasattr(value, "item") else value)
+            sheet[1] += 1
+    workbook.save(str(path))
+
+def sales_path(rows: int, fmt: str, seed: int = 0) -> Path:
+    return DATA_DIR / f"sales_{rows}_{seed}.{fmt}"
+
+def ensure_sales(rows: int, fmt: str, seed: int = 0) -> Path:
+    """Path of a synthetic sales export, generated on first use"""
+    if fmt not in SALES_FORMATS:
+        raise ValueError(f"Invalid format {fmt!r}. Use one of: {', '.join(SALES_FORMATS)}")
+    path = sales_path(rows, fmt, seed)
+    if path.exists():
+        return path
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.stem}.partial.{fmt}")
+    frames = sales_frames(rows, seed)
+    if fmt == "csv":
+        write_csv(partial, frames)
+    elif fmt == "xlsx":
+        write_xlsx(partial, frames, sales_profile()[0])
+    else:
+        write_xls(partial, frames, sales_profile()[0])
+    partial.replace(path)
+    return path
+
+def statement_pdf(pages: int) -> bytes:
+    """demo6_fs.pdf with its header page repeated in front until it has `pages` pages"""
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import DecodedStreamObject
+
+    data = (REPO_DIR / "demo6_fs.pdf").read_bytes()
+    writer = PdfWriter()
+    for copy in range(max(pages - STATEMENT_PAGES, 0)):
+        # A fresh reader per copy, so the writer does not share one content stream between the copies
+        page = writer.add_page(PdfReader(io.BytesIO(data)).pages[0])
+        contents = DecodedStreamObject()
+        contents.set_data(page.get_contents().get_data() + f"\n% copy {copy + 1}\n".encode("ascii"))
+        page.replace_contents(contents)
+    for page in PdfReader(io.BytesIO(data)).pages:
+        writer.add_page(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+def statement_path(pages: int) -> Path:
+    return DATA_DIR / f"statement_{pages}p.pdf"
+
+def ensure_statement(pages: int) -> Path:
+    """Path of a statement PDF replicated to `pages` pages, generated on first use"""
+    path = statement_path(pages)
+    if not path.exists():
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f"{path.stem}.partial.pdf")
+        partial.write_bytes(statement_pdf(pages))
+        partial.replace(path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    sales = commands.add_parser("sales", help="Synthetic sales export")
+    sales.add_argument("--rows", type=int, required=True, help="e.g. 10000 to 50000000")
+    sales.add_argument("--format", choices=SALES_FORMATS, default="csv")
+    sales.add_argument("--seed", type=int, default=0)
+    statement = commands.add_parser("statement", help="Statement PDF replicated to N pages")
+    statement.add_argument("--pages", type=int, required=True)
+    args = parser.parse_args()
+
+    try:
+        path = ensure_sales(args.rows, args.format, args.seed) if args.command == "sales" else ensure_statement(args.pages)
+    except RuntimeError as e:
+        sys.exit(f"❌ {e}")
+    print(f"✅ {path} ({path.stat().st_size / 1024 / 1024:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Completion callbacks: POST a finished analysis to the client's callback_url.
+
+Deliveries are queued and sent by a fixed number of asyncio workers on their
+own thread pool and HTTP session, so a slow or unreachable receiver never
+holds up analysis jobs or n8n connections. A delivery that fails with a
+connection error, 429 or 5xx is queued again after an exponential backoff
+(without holding a worker while it waits), up to max_attempts. Its state
+(status, attempts, last response) is kept in the job's queue entry.
+
+With CALLBACK_SECRET set, the body is signed:
+    X-Callback-Signature: sha256=HMAC_SHA256(secret, "<X-Callback-Timestamp>." + body)
+
+Callback hosts must resolve to public addresses: loopback, link-local, private
+and reserved ones (n8n, cloud metadata, the internal network) are refused unless
+the host is listed in CALLBACK_ALLOWED_HOSTS. The check is repeated before every
+attempt, and redirects are not followed.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import os
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+CALLBACK_SECRET = os.getenv("CALLBACK_SECRET")
+CALLBACK_WORKERS = int(os.getenv("CALLBACK_WORKERS", "4"))
+CALLBACK_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", "5"))
+CALLBACK_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", "10"))
+CALLBACK_BACKOFF_SECONDS = float(os.getenv("CALLBACK_BACKOFF_SECONDS", "1"))
+CALLBACK_QUEUE_MAX = int(os.getenv("CALLBACK_QUEUE_MAX", "1000"))
+# Optional comma-separated host allow-list for callback URLs; listed hosts may also be internal
+CALLBACK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+
+def public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+def check_callback_host(url: str):
+    """Raise ValueError if url's host is not allow-listed and resolves to a non-public address.
+
+    Blocks on DNS; socket.gaierror if the host does not resolve.
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname.lower()
+    if host in CALLBACK_ALLOWED_HOSTS:
+        return
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    internal = sorted(a for a in addresses if not public_address(a))
+    if internal:
+        raise ValueError(f"callback_url host {parsed.hostname} resolves to a non-public address ({', '.join(internal)})")
+
+def validate_callback_url(url: str):
+    """Raise ValueError unless url is an absolute http(s) URL on an allowed, public host; blocks on DNS"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url must be an absolute http(s) URL")
+    if CALLBACK_ALLOWED_HOSTS and parsed.hostname.lower() not in CALLBACK_ALLOWED_HOSTS:
+        raise ValueError(f"callback_url host {parsed.hostname} is not allowed")
+    try:
+        check_callback_host(url)
+    except socket.gaierror:
+        raise ValueError(f"callback_url host {parsed.hostname} does not resolve")
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    digest = hmac.new(secret.encode("utf-8"), timestamp.encode("ascii") + b"." + body, hashlib.sha256)
+    return f"sha256={digest.hexdigest()}"
+
+def new_delivery(url: str) -> Dict[str, Any]:
+    """Delivery state stored in the job's queue entry"""
+    return {
+        "url": url,
+        "status": "pending",
+        "attempts": 0,
+        "last_status_code": None,
+        "last_error": None,
+        "delivered_at": None,
+    }
+
+def retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+class CallbackDispatcher:
+    """Bounded queue of deliveries drained by `workers` asyncio tasks"""
+
+    def __init__(self, workers: int = CALLBACK_WORKERS, max_attempts: int = CALLBACK_MAX_ATTEMPTS,
+                 timeout: float = CALLBACK_TIMEOUT, backoff: float = CALLBACK_BACKOFF_SECONDS,
+                 queue_max: int = CALLBACK_QUEUE_MAX, secret: Optional[str] = CALLBACK_SECRET):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+        self.queue_max = queue_max
+        self.secret = secret
+        self.delivered = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._session = requests.Session()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_max)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="callback")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, delivery: Dict[str, Any], event: str, request_id: str, body: bytes) -> bool:
+        """Queue a delivery; False (and status "dropped") if the queue is full or not started"""
+        if self._queue is None:
+            return self._drop(delivery, request_id, "callback workers are not running")
+        try:
+            self._queue.put_nowait((delivery, event, request_id, body))
+            return True
+        except asyncio.QueueFull:
+            return self._drop(delivery, request_id, "callback queue is full")
+
+    def _drop(self, delivery: Dict[str, Any], request_id: str, reason: str) -> bool:
+        delivery["status"] = "dropped"
+        delivery["last_error"] = reason
+        self.failed += 1
+        print(f"⚠️  Dropped callback for {request_id}: {reason}")
+        return False
+
+    def _post(self, url: str, headers: Dict[str, str], body: bytes) -> int:
+        # Checked again: the host may resolve elsewhere by now
+        check_callback_host(url)
+        with self._session.post(url, data=body, headers=headers, timeout=self.timeout, allow_redirects=False) as response:
+            return response.status_code
+
+    def headers(self, event: str, request_id: str, body: bytes) -> Dict[str, str]:
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "financial-analysis-api-callbacks",
+            "X-Callback-Event": event,
+            "X-Callback-Timestamp": timestamp,
+            "X-Request-Id": request_id,
+        }
+        if self.secret:
+            headers["X-Callback-Signature"] = sign(self.secret, timestamp, body)
+        return headers
+
+    async def attempt(self, delivery: Dict[str, Any], event: str, request_id: str, body: bytes):
+        """Send once; on a retryable failure, queue the delivery again after a backoff"""
+        loop = asyncio.get_running_loop()
+        delivery["status"] = "delivering"
+        delivery["attempts"] += 1
+        retry = True
+        try:
+            status_code = await loop.run_in_executor(
+                self._executor, self._post, delivery["url"], self.headers(event, request_id, body), body
+            )
+            delivery["last_status_code"] = status_code
+            delivery["last_error"] = None if status_code < 300 else f"HTTP {status_code}"
+            if status_code < 300:
+                delivery["status"] = "delivered"
+                delivery["delivered_at"] = datetime.now().isoformat()
+                self.delivered += 1
+                print(f"📬 Delivered {event} callback for {request_id} (attempt {delivery['attempts']})")
+                return
+            retry = retryable(status_code)
+        except ValueError as e:
+            # The host now resolves to a refused address
+            delivery["last_error"] = str(e)
+            retry = False
+        except (requests.RequestException, socket.gaierror) as e:
+            delivery["last_error"] = str(e)
+
+        if retry and delivery["attempts"] < self.max_attempts:
+            delivery["status"] = "retrying"
+            delay = self.backoff * 2 ** (delivery["attempts"] - 1) * random.uniform(0.8, 1.2)
+            loop.call_later(delay, self.submit, delivery, event, request_id, body)
+            return
+
+        delivery["status"] = "failed"
+        self.failed += 1
+        print(f"⚠️  Callback for {request_id} failed after {delivery['attempts']} attempt(s): {delivery['last_error']}")
+
+    async def _worker(self):
+        while True:
+            delivery, event, request_id, body = await self._queue.get()
+            try:
+                await self.attempt(delivery, event, request_id, body)
+            except Exception as e:
+                delivery["status"] = "failed"
+                delivery["last_error"] = str(e)
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "signed": bool(self.secret),
+        }
@@ -0,0 +1,319 @@
+"""
+Columnar store of extracted finance metrics keyed by entity and period.
+
+Every metric and ratio is a float64 column (NaN when missing), and entities
+and periods are dictionary-encoded as int32 codes. Trends (year-over-year
+growth, margin deltas) are computed with vectorized NumPy over an entity's
+rows. Peer percentile ranks are read from per-period sorted columns, which
+are built on first use and dropped when the period changes.
+"""
+
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+FINANCE_STORE_PATH = Path(os.getenv("FINANCE_STORE_PATH", "datasets/finance_metrics.npz"))
+
+# Metrics extracted by the finance workflow ("Extract Metrics" node)
+METRICS = [
+    "Total Revenue",
+    "Total Cost of Sales",
+    "Profit Before Tax",
+    "Total Expenses",
+    "Net Profit",
+    "Income Tax Expenses",
+    "Profit For the Year",
+]
+
+# Metrics the statements print as deductions, "(1,234.50)"; stored as positive amounts, since the ratios subtract them
+COST_METRICS = ["Total Cost of Sales", "Total Expenses", "Income Tax Expenses"]
+
+# Ratios, in percent, as in the "Calculate Financial Ratios" node
+RATIOS = ["Gross Margin", "Net Profit Margin", "PBT Margin", "Expense Ratio"]
+
+COLUMNS = METRICS + RATIOS
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+# 2024, 2024-Q1, 2024-H1 or 2024-03
+PERIOD_PATTERN = re.compile(r"^(\d{4})(-(Q[1-4]|H[12]|0[1-9]|1[0-2]))?$")
+
+def validate_key(entity: str, period: str):
+    if not entity or not entity.strip():
+        raise ValueError("entity must not be empty")
+    if not PERIOD_PATTERN.match(period):
+        raise ValueError("period must look like 2024, 2024-Q1, 2024-H1 or 2024-03")
+
+def prior_year(period: str) -> str:
+    """Same period one year earlier: 2024-Q1 -> 2023-Q1"""
+    return f"{int(period[:4]) - 1:04d}{period[4:]}"
+
+def compute_ratios(values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """All ratios for arrays of metrics in one pass; NaN where revenue is zero or a metric is missing"""
+    revenue = values["Total Revenue"]
+    valid = np.isfinite(revenue) & (revenue != 0)
+    safe_revenue = np.where(valid, revenue, 1.0)
+
+    def percent_of_revenue(numerator):
+        with np.errstate(invalid="ignore"):
+            return np.where(valid & np.isfinite(numerator), numerator / safe_revenue * 100, np.nan)
+
+    return {
+        "Gross Margin": percent_of_revenue(revenue - values["Total Cost of Sales"]),
+        "Net Profit Margin": percent_of_revenue(values["Net Profit"]),
+        "PBT Margin": percent_of_revenue(values["Profit Before Tax"]),
+        "Expense Ratio": percent_of_revenue(values["Total Expenses"]),
+    }
+
+def to_floats(values: List[Any]) -> np.ndarray:
+    """Column of numbers; accepts None, '1,234.50' and the '(1,234.50)' style of the statements (negative)"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+
+    def parse(value):
+        if value is None or isinstance(value, (int, float)):
+            return value
+        text = str(value).strip().replace(",", "")
+        sign = 1.0
+        if text.startswith("(") and text.endswith(")"):
+            text, sign = text[1:-1].strip(), -1.0
+        try:
+            return sign * float(text) if text else None
+        except ValueError:
+            return None
+
+    return np.array([parse(v) for v in values], dtype=np.float64)
+
+def metric_columns(metrics: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Column per metric of many metric dicts, with costs as positive amounts whichever way they were signed"""
+    columns = {name: to_floats([m.get(name) for m in metrics]) for name in METRICS}
+    for name in COST_METRICS:
+        columns[name] = np.abs(columns[name])
+    return columns
+
+def batch_ratios(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ratios for many metric records at once.
+
+    Returns columns: the non-metric fields of the records (e.g. an id) as
+    lists, then every metric and ratio as a float64 array (NaN if missing),
+    then revenue_status ('ok', 'zero_revenue' or 'missing_revenue').
+    """
+    passthrough = []
+    for record in records:
+        for key in record:
+            if key not in COLUMN_INDEX and key not in passthrough:
+                passthrough.append(key)
+
+    columns: Dict[str, Any] = {key: [record.get(key) for record in records] for key in passthrough}
+    metrics = metric_columns(records)
+    columns.update(metrics)
+    columns.update(compute_ratios(metrics))
+
+    revenue = metrics["Total Revenue"]
+    columns["revenue_status"] = np.where(
+        np.isnan(revenue), "missing_revenue", np.where(revenue == 0, "zero_revenue", "ok")
+    )
+    return columns
+
+def clean(value: float) -> Optional[float]:
+    """NaN -> None for JSON"""
+    return None if np.isnan(value) else float(value)
+
+class FinanceStore:
+    def __init__(self, path: Path = FINANCE_STORE_PATH):
+        self.path = path
+        self.entities: List[str] = []
+        self.periods: List[str] = []
+        self.entity_codes: Dict[str, int] = {}
+        self.period_codes: Dict[str, int] = {}
+        self.entity = np.empty(0, dtype=np.int32)
+        self.period = np.empty(0, dtype=np.int32)
+        self.values = np.empty((len(COLUMNS), 0), dtype=np.float64)
+        self.size = 0
+        self.rows: Dict[Tuple[int, int], int] = {}
+        # period code -> (sorted values per column, finite count per column)
+        self.peer_index: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.lock = threading.Lock()
+        if path.exists():
+            self.load()
+
+    def _code(self, codes: Dict[str, int], names: List[str], name: str) -> int:
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        return codes[name]
+
+    def _reserve(self, rows: int):
+        capacity = self.values.shape[1]
+        if self.size + rows <= capacity:
+            return
+        capacity = max(16, capacity * 2, self.size + rows)
+        self.entity = np.resize(self.entity, capacity)
+        self.period = np.resize(self.period, capacity)
+        values = np.full((len(COLUMNS), capacity), np.nan)
+        values[:, :self.size] = self.values[:, :self.size]
+        self.values = values
+
+    def upsert(self, records: List[Dict[str, Any]]) -> int:
+        """Insert or replace (entity, period) rows; ratios are derived from the metrics"""
+        for record in records:
+            validate_key(record["entity"], record["period"])
+
+        metrics = metric_columns([record.get("metrics") or {} for record in records])
+        ratios = compute_ratios(metrics)
+        block = np.vstack([*(metrics[name] for name in METRICS), *(ratios[name] for name in RATIOS)])
+
+        with self.lock:
+            self._reserve(len(records))
+            for j, record in enumerate(records):
+                key = (
+                    self._code(self.entity_codes, self.entities, record["entity"].strip()),
+                    self._code(self.period_codes, self.periods, record["period"]),
+                )
+                row = self.rows.get(key)
+                if row is None:
+                    row = self.rows[key] = self.size
+                    self.size += 1
+                self.entity[row], self.period[row] = key
+                self.values[:, row] = block[:, j]
+                self.peer_index.pop(key[1], None)
+            self.save()
+        return len(records)
+
+    def entity_summary(self) -> Dict[str, List[str]]:
+        with self.lock:
+            summary: Dict[str, List[str]] = {}
+            for entity, period in zip(self.entity[:self.size], self.period[:self.size]):
+                summary.setdefault(self.entities[entity], []).append(self.periods[period])
+            return {entity: sorted(periods) for entity, periods in sorted(summary.items())}
+
+    def trend(self, entity: str) -> Optional[List[Dict[str, Any]]]:
+        """Per period: metrics, ratios, YoY growth (%) and ratio change vs the previous period (points)"""
+        with self.lock:
+            code = self.entity_codes.get(entity)
+            if code is None:
+                return None
+            rows = np.flatnonzero(self.entity[:self.size] == code)
+            periods = [self.periods[p] for p in self.period[rows]]
+            order = np.argsort(periods, kind="stable")
+            rows = rows[order]
+            periods = [periods[i] for i in order]
+            values = self.values[:, rows]
+
+        # Column of the same period one year earlier, -1 when there is none
+        position = {period: i for i, period in enumerate(periods)}
+        prior = np.array([position.get(prior_year(p), -1) for p in periods], dtype=np.int64)
+        has_prior = prior >= 0
+        prior_values = np.where(has_prior, values[:, np.maximum(prior, 0)], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            yoy = np.where(prior_values != 0, (values - prior_values) / np.abs(prior_values) * 100, np.nan)
+
+        ratio_rows = [COLUMN_INDEX[name] for name in RATIOS]
+        deltas = np.full((len(RATIOS), len(periods)), np.nan)
+        deltas[:, 1:] = np.diff(values[ratio_rows], axis=1)
+
+        trend = []
+        for i, period in enumerate(periods):
+            trend.append({
+                "period": period,
+                "metrics": {name: clean(values[COLUMN_INDEX[name], i]) for name in METRICS},
+                "ratios": {name: clean(values[COLUMN_INDEX[name], i]) for name in RATIOS},
+                "yoy_growth": {name: clean(yoy[COLUMN_INDEX[name], i]) for name in METRICS},
+                "yoy_ratio_change": {name: clean(values[COLUMN_INDEX[name], i] - prior_values[COLUMN_INDEX[name], i]) for name in RATIOS},
+                "ratio_change": {name: clean(deltas[k, i]) for k, name in enumerate(RATIOS)},
+            })
+        return trend
+
+    def _peers(self, period_code: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted values of every column among the entities of a period (NaN sorts last)"""
+        if period_code not in self.peer_index:
+            rows = np.flatnonzero(self.period[:self.size] == period_code)
+            values = self.values[:, rows]
+            self.peer_index[period_code] = (np.sort(values, axis=1), np.isfinite(values).sum(axis=1))
+        return self.peer_index[period_code]
+
+    def percentile_ranks(self, entity: str, period: str) -> Optional[Dict[str, Any]]:
+        """Percentile rank of an entity's metrics and ratios among all entities reporting the same period"""
+        with self.lock:
+            key = (self.entity_codes.get(entity), self.period_codes.get(period))
+            if key not in self.rows:
+                return None
+            own = self.values[:, self.rows[key]]
+            ordered, counts = self._peers(key[1])
+
+            ranks = {}
+            for name, i in COLUMN_INDEX.items():
+                if np.isnan(own[i]) or counts[i] == 0:
+                    ranks[name] = {"value": None, "percentile": None, "peers": int(counts[i])}
+                    continue
+                column = ordered[i, :counts[i]]
+                below = np.searchsorted(column, own[i], side="left")
+                equal = np.searchsorted(column, own[i], side="right") - below
+                ranks[name] = {
+                    "value": float(own[i]),
+                    "percentile": float((below + 0.5 * equal) / counts[i] * 100),
+                    "peers": int(counts[i]),
+                }
+            return ranks
+
+    def ranking(self, period: str, column: str) -> Optional[List[Dict[str, Any]]]:
+        """Entities of a period ranked by one metric or ratio, highest first"""
+        with self.lock:
+            code = self.period_codes.get(period)
+            if code is None:
+                return None
+            rows = np.flatnonzero(self.period[:self.size] == code)
+            values = self.values[COLUMN_INDEX[column], rows]
+            finite = np.isfinite(values)
+            rows, values = rows[finite], values[finite]
+            order = np.argsort(-values, kind="stable")
+            ordered = np.sort(values)
+            below = np.searchsorted(ordered, values[order], side="left")
+            equal = np.searchsorted(ordered, values[order], side="right") - below
+            percentiles = (below + 0.5 * equal) / max(len(values), 1) * 100
+            return [
+                {
+                    "rank": rank + 1,
+                    "entity": self.entities[self.entity[rows[i]]],
+                    "value": float(values[i]),
+                    "percentile": float(percentiles[rank]),
+                }
+                for rank, i in enumerate(order)
+            ]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            entities=np.array(self.entities, dtype=str),
+            periods=np.array(self.periods, dtype=str),
+            entity=self.entity[:self.size],
+            period=self.period[:self.size],
+            values=self.values[:, :self.size],
+            columns=np.array(COLUMNS, dtype=str),
+        )
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            self.entities = data["entities"].tolist()
+            self.periods = data["periods"].tolist()
+            self.entity = data["entity"].astype(np.int32)
+            self.period = data["period"].astype(np.int32)
+            saved = dict(zip(data["columns"].tolist(), data["values"]))
+        self.size = len(self.entity)
+        self.values = np.full((len(COLUMNS), self.size), np.nan)
+        for name, column in saved.items():
+            if name in COLUMN_INDEX:
+                self.values[COLUMN_INDEX[name]] = column
+        self.entity_codes = {name: i for i, name in enumerate(self.entities)}
+        self.period_codes = {name: i for i, name in enumerate(self.periods)}
+        self.rows = {(int(e), int(p)): i for i, (e, p) in enumerate(zip(self.entity, self.period))}
+
+store = FinanceStore()
@@ -0,0 +1,82 @@
+"""
+Deferred imports for heavy optional dependencies (pandas, numpy, reportlab, matplotlib).
+
+A LazyModule stands in for a module and imports it on first attribute access,
+recording how long the import took.
+"""
+
+import importlib
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Seconds spent importing each lazily loaded module, filled on first use
+lazy_import_times: Dict[str, float] = {}
+# Every LazyModule created, in creation order (several proxies may stand in for the same module)
+lazy_modules: List["LazyModule"] = []
+
+class LazyModule:
+    """Proxy that imports the named module the first time one of its attributes is used"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        lazy_modules.append(self)
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            lazy_import_times[self._name] = time.perf_counter() - start
+            print(f"📦 Loaded {self._name} in {lazy_import_times[self._name]:.3f}s")
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+def importtime_report(module: str = "api", top: int = 30, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Import `module` in a fresh interpreter under -X importtime and summarize the cost per module"""
+    repo_dir = str(Path(__file__).resolve().parent)
+    code = f"import sys; sys.path.insert(0, {repo_dir!r}); import {module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd or repo_dir,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    entries: List[Dict[str, Any]] = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2,
+            })
+
+    total = next((e["cumulative_ms"] for e in entries if e["module"] == module and e["depth"] == 0), None)
+    return {
+        "module": module,
+        "returncode": proc.returncode,
+        "total_ms": total,
+        "modules_imported": len(entries),
+        "top_level": sorted((e for e in entries if e["depth"] <= 1), key=lambda e: e["cumulative_ms"], reverse=True)[:top],
+        "top_self": sorted(entries, key=lambda e: e["self_ms"], reverse=True)[:top],
+    }
@@ -0,0 +1,222 @@
+"""
+Process memory instrumentation: RSS, open file descriptors, approximate sizes
+of in-memory stores and tracemalloc snapshots with top allocation sites.
+
+RSS and descriptor counts come from /proc on Linux; elsewhere RSS falls back to
+the peak reported by resource.getrusage and descriptor counts are unavailable.
+
+Stores are sized in a worker thread while the event loop keeps changing them,
+so snapshot_stores() copies them on the loop first. Sizing also materialises
+every container with list() before walking it. Objects that worker threads
+change (datasets, the page cache) then never fail the report mid-iteration.
+"""
+
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Objects not descended into when sizing stores (locks, event loops, executors)
+OPAQUE_MODULES = ("asyncio", "threading", "_thread", "concurrent")
+
+# tracemalloc statistic groupings
+GROUP_BY = ["lineno", "filename", "traceback"]
+
+SNAPSHOT_MAX_KEPT = int(os.getenv("MEMORY_SNAPSHOT_MAX_KEPT", "8"))
+
+# Snapshot id -> (taken at, snapshot), oldest first
+snapshots: "OrderedDict[str, Any]" = OrderedDict()
+_snapshot_lock = threading.Lock()
+_next_snapshot = 1
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def open_fd_count() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+def approx_size(obj: Any, seen: Optional[set] = None) -> int:
+    """Deep size in bytes, following containers, object attributes, numpy arrays and pandas frames"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+        return 0
+    if type(obj).__module__.split(".")[0] in OPAQUE_MODULES:
+        return sys.getsizeof(obj)
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int) and hasattr(obj, "dtype"):
+        return max(nbytes, sys.getsizeof(obj))
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and hasattr(obj, "columns"):
+        return int(memory_usage(deep=True).sum())
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    # list() copies in one step, so a container changed by another thread cannot fail the walk
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in list(obj))
+    elif hasattr(obj, "__dict__"):
+        size += approx_size(vars(obj), seen)
+    return size
+
+def shallow_copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, (list, set)):
+        return type(value)(value)
+    return value
+
+def snapshot_stores(stores: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy each store's entries, and each entry one level deep; call on the event loop that mutates them"""
+    snapshot = {}
+    for name, store in stores.items():
+        if hasattr(store, "memory_stats"):
+            snapshot[name] = store
+        elif isinstance(store, dict):
+            snapshot[name] = [(key, shallow_copy(value)) for key, value in list(store.items())]
+        else:
+            snapshot[name] = [shallow_copy(item) for item in list(store)]
+    return snapshot
+
+def store_sizes(stores: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """Entry count and approximate bytes of each store of snapshot_stores() (stores with memory_stats() report themselves)"""
+    report = {}
+    for name, entries in stores.items():
+        if hasattr(entries, "memory_stats"):
+            report[name] = entries.memory_stats()
+            continue
+        report[name] = {"entries": len(entries), "approx_bytes": approx_size(entries)}
+    return report
+
+def process_report(stores: Dict[str, Any]) -> Dict[str, Any]:
+    """Report for stores copied by snapshot_stores(); runs in a worker thread"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "rss_bytes": rss_bytes(),
+        "open_fds": open_fd_count(),
+        "threads": threading.active_count(),
+        "gc_objects": len(gc.get_objects()),
+        "stores": store_sizes(stores),
+        "tracemalloc": tracing_status(),
+    }
+
+def tracing_status() -> Dict[str, Any]:
+    status: Dict[str, Any] = {"tracing": tracemalloc.is_tracing(), "snapshots": list(snapshots)}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        status.update({
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        })
+    return status
+
+def start_tracing(frames: int = 1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        print(f"🧠 Started tracemalloc with {frames} frame(s) per allocation")
+
+def stop_tracing():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        print("🧠 Stopped tracemalloc")
+    with _snapshot_lock:
+        # Snapshots are only comparable within one tracing session
+        snapshots.clear()
+
+def statistic_entry(stat) -> Dict[str, Any]:
+    return {
+        "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_bytes": stat.size,
+        "count": stat.count,
+    }
+
+def diff_entry(stat) -> Dict[str, Any]:
+    return {
+        **statistic_entry(stat),
+        "size_diff_bytes": stat.size_diff,
+        "count_diff": stat.count_diff,
+    }
+
+def filtered(snapshot):
+    return snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ])
+
+def take_snapshot(limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+    """Take a snapshot and keep it for later diffs; returns its id and top allocation sites"""
+    global _next_snapshot
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not tracing; start it first")
+    snapshot = filtered(tracemalloc.take_snapshot())
+    taken = datetime.now().isoformat()
+    with _snapshot_lock:
+        snapshot_id = str(_next_snapshot)
+        _next_snapshot += 1
+        snapshots[snapshot_id] = (taken, snapshot)
+        while len(snapshots) > SNAPSHOT_MAX_KEPT:
+            snapshots.popitem(last=False)
+    stats = snapshot.statistics(key_type)
+    return {
+        "snapshot_id": snapshot_id,
+        "taken": taken,
+        "traced_bytes": sum(stat.size for stat in stats),
+        "top": [statistic_entry(stat) for stat in stats[:limit]],
+    }
+
+def get_snapshot(snapshot_id: str):
+    with _snapshot_lock:
+        if snapshot_id not in snapshots:
+            raise KeyError(snapshot_id)
+        return snapshots[snapshot_id][1]
+
+def diff_snapshots(snapshot_id: str, against: Optional[str] = None, limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+    """Top allocation sites that grew between `snapshot_id` and `against` (default: the previous snapshot)"""
+    if against is None:
+        with _snapshot_lock:
+            ids = list(snapshots)
+        if snapshot_id not in ids:
+            raise KeyError(snapshot_id)
+        position = ids.index(snapshot_id)
+        if position == 0:
+            raise KeyError(f"no snapshot before {snapshot_id}")
+        against = ids[position - 1]
+    newer, older = get_snapshot(snapshot_id), get_snapshot(against)
+    stats: List[Any] = newer.compare_to(older, key_type)
+    return {
+        "snapshot_id": snapshot_id,
+        "against": against,
+        "size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "top": [diff_entry(stat) for stat in stats[:limit]],
+    }
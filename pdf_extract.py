@@ -0,0 +1,212 @@
+"""
+Page-streamed text extraction for financial statements.
+
+Pages are extracted in order and searched for the metric lines the finance
+workflow's "Extract Metrics" node looks for. Extraction stops as soon as every
+metric has matched, or once the closing line of the income statement has, and
+only the pages that matched are kept, so a 200-page annual report is reduced
+to its income statement. Long documents are
+extracted in batches across a process pool. Page text is cached by a hash of
+the page content and everything it draws with (fonts with their encodings,
+form XObjects and their own resources), so re-uploads and shared pages are
+not extracted twice.
+"""
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Executor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+# Same patterns as the "Extract Metrics" node of the finance workflow
+METRIC_PATTERNS = {
+    "Total Revenue": re.compile(r"Total Revenue\s+([\d,]+\.\d+)", re.IGNORECASE),
+    "Total Cost of Sales": re.compile(r"Total Cost of sales\s+\(([\d,]+\.\d+)\)", re.IGNORECASE),
+    "Profit Before Tax": re.compile(r"Profit Before Tax\s+([\d,]+\.\d+)", re.IGNORECASE),
+    "Total Expenses": re.compile(r"Total Expenses\s+\(([\d,]+\.\d+)\)", re.IGNORECASE),
+    "Net Profit": re.compile(r"Net Profit\/\(Loss\)\s+([\d,]+\.\d+)", re.IGNORECASE),
+    "Income Tax Expenses": re.compile(r"Income Tax Expenses\s+([\d,]+\.\d+)", re.IGNORECASE),
+    "Profit For the Year": re.compile(r"Profit For the Year\s+([\d,]+\.\d+)", re.IGNORECASE),
+}
+
+# Metric on the closing line of the income statement; metrics not found by then are not in it
+STOP_AFTER_METRIC = os.getenv("PDF_STOP_AFTER", "Profit For the Year")
+
+# Documents with at least this many pages are extracted in the process pool
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PAGE_BATCH_SIZE = int(os.getenv("PDF_PAGE_BATCH_SIZE", "8"))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PDF_PAGE_CACHE_MAX_ENTRIES", "4096"))
+
+# Embedded font programs do not change the extracted text, and are the largest streams of a page
+UNHASHED_KEYS = {"/FontFile", "/FontFile2", "/FontFile3"}
+
+# Page content hash -> extracted text
+page_text_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def object_hash(obj, memo: Dict[Tuple[int, int], str]) -> str:
+    """Hash of a PDF object with everything it references; memo holds the hashes of indirect objects"""
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref not in memo:
+            # Placeholder for reference cycles, replaced once the object is hashed
+            memo[ref] = "cycle"
+            memo[ref] = object_hash(obj.get_object(), memo)
+        return memo[ref]
+
+    digest = hashlib.sha256()
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"stream<" if isinstance(obj, StreamObject) else b"dict<")
+        for name, value in sorted(obj.items()):
+            if name not in UNHASHED_KEYS and name != "/Parent":
+                digest.update(f"{name}=".encode("utf-8"))
+                digest.update(object_hash(value, memo).encode("ascii"))
+        if isinstance(obj, StreamObject):
+            digest.update(obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"array<")
+        for value in obj:
+            digest.update(object_hash(value, memo).encode("ascii"))
+    else:
+        digest.update(f"{type(obj).__name__}:{obj!r}".encode("utf-8"))
+    return digest.hexdigest()
+
+def page_key(page, memo: Optional[Dict[Tuple[int, int], str]] = None) -> str:
+    """Hash of the page's content stream and its whole resource tree (fonts, encodings, XObjects).
+
+    Pass the same memo for every page of a document, so shared resources are hashed once.
+    """
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    if resources is not None:
+        digest.update(object_hash(resources, memo).encode("ascii"))
+    return digest.hexdigest()
+
+def cached_text(key: str) -> Optional[str]:
+    with _cache_lock:
+        if key in page_text_cache:
+            page_text_cache.move_to_end(key)
+            return page_text_cache[key]
+    return None
+
+def cache_text(key: str, text: str):
+    with _cache_lock:
+        page_text_cache[key] = text
+        page_text_cache.move_to_end(key)
+        while len(page_text_cache) > PAGE_CACHE_MAX_ENTRIES:
+            page_text_cache.popitem(last=False)
+
+# Reader of the document a pool worker last extracted from, reused across its batches
+_worker_reader: Tuple[Optional[str], Optional[PdfReader]] = (None, None)
+
+def extract_page_texts(path: str, numbers: List[int]) -> List[str]:
+    """Text of the given pages; runs in the process pool"""
+    global _worker_reader
+    if _worker_reader[0] != path:
+        _worker_reader = (path, PdfReader(path))
+    reader = _worker_reader[1]
+    return [reader.pages[i].extract_text() or "" for i in numbers]
+
+def iter_page_texts(path: Optional[str], reader: PdfReader, executor: Optional[Executor]) -> Iterator[Tuple[int, str, bool]]:
+    """(page number, text, cache hit) in page order.
+
+    With an executor, uncached pages are extracted in batches, keeping at most
+    two batches per worker in flight. Closing the iterator early cancels the
+    batches that have not started.
+    """
+    page_count = len(reader.pages)
+    keys: Dict[int, str] = {}
+    memo: Dict[Tuple[int, int], str] = {}
+
+    def key(i: int) -> str:
+        # Hashed on demand so pages after an early stop are never read
+        if i not in keys:
+            keys[i] = page_key(reader.pages[i], memo)
+        return keys[i]
+
+    if executor is None:
+        for i in range(page_count):
+            text = cached_text(key(i))
+            hit = text is not None
+            if not hit:
+                text = reader.pages[i].extract_text() or ""
+                cache_text(key(i), text)
+            yield i, text, hit
+        return
+
+    window = 2 * max(getattr(executor, "_max_workers", 1), 1)
+    batches = [list(range(start, min(start + PAGE_BATCH_SIZE, page_count))) for start in range(0, page_count, PAGE_BATCH_SIZE)]
+    pending: "deque[Tuple[List[int], Dict[int, str], Any]]" = deque()
+    next_batch = 0
+    try:
+        while pending or next_batch < len(batches):
+            while next_batch < len(batches) and len(pending) < window:
+                numbers = batches[next_batch]
+                hits = {i: text for i in numbers if (text := cached_text(key(i))) is not None}
+                missing = [i for i in numbers if i not in hits]
+                future = executor.submit(extract_page_texts, path, missing) if missing else None
+                pending.append((numbers, hits, future))
+                next_batch += 1
+
+            numbers, hits, future = pending.popleft()
+            extracted = dict(zip([i for i in numbers if i not in hits], future.result() if future else []))
+            for i, text in extracted.items():
+                cache_text(key(i), text)
+            for i in numbers:
+                yield i, hits.get(i, extracted.get(i, "")), i in hits
+    finally:
+        for _, _, future in pending:
+            if future is not None:
+                future.cancel()
+
+def extract_statement_text(data: bytes, executor: Optional[Executor] = None) -> Dict[str, Any]:
+    """Text of the pages that carry the finance metrics, stopping once all of them were found"""
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    parallel = executor is not None and page_count >= PARALLEL_MIN_PAGES
+
+    found: Dict[str, int] = {}
+    pages: List[Tuple[int, str]] = []
+    scanned = cache_hits = 0
+    # Pool workers read the document from a temp file instead of receiving it with every batch
+    spool = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) if parallel else None
+    if spool is not None:
+        with spool:
+            spool.write(data)
+    page_texts = iter_page_texts(spool.name if spool else None, reader, executor if parallel else None)
+    try:
+        for i, text, hit in page_texts:
+            scanned += 1
+            cache_hits += hit
+            matched = [name for name, pattern in METRIC_PATTERNS.items() if name not in found and pattern.search(text)]
+            if matched:
+                pages.append((i, text))
+                found.update({name: i + 1 for name in matched})
+            if len(found) == len(METRIC_PATTERNS) or STOP_AFTER_METRIC in found:
+                break
+    finally:
+        page_texts.close()
+        if spool is not None:
+            os.unlink(spool.name)
+
+    return {
+        "text": "\n".join(text for _, text in pages),
+        "pages": [i + 1 for i, _ in pages],
+        "metric_pages": found,
+        "missing_metrics": [name for name in METRIC_PATTERNS if name not in found],
+        "page_count": page_count,
+        "pages_scanned": scanned,
+        "cache_hits": cache_hits,
+        "parallel": parallel,
+    }
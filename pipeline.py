@@ -0,0 +1,175 @@
+"""
+Stage-graph executor for the analysis pipelines.
+
+A pipeline is a small DAG of named stages, e.g.
+
+    finance:parse -> finance:extract -> finance:ratios -> finance:narrative
+    sales:parse   -> sales:extract   -> sales:ratios   -> sales:narrative   -> combine
+
+Every stage has a cache key: a hash of its name, the parameters it reads and
+the keys of the stages it depends on (for a stage reading an upload, also the
+content hash of the upload). A key therefore identifies a stage's output
+without running anything. Outputs go to a shared cache; a run starts from the
+stages the result is built from and only goes upstream from the ones that are
+not cached, running independent branches concurrently. Running a finished
+request again with a new parameter (say another model) reuses every stage
+that does not read it and runs only the stages downstream.
+
+Stages can also be seeded with a known output (e.g. a narrative that was
+stored earlier); a seeded stage is keyed by its output and never runs.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import time
+from collections.abc import MutableMapping
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+class StageUnavailable(Exception):
+    """A stage has to run but its input is gone (e.g. the upload was released and the output evicted)"""
+
+class Stage:
+    """One node of a pipeline: func(ctx) -> output, run in a worker thread"""
+
+    def __init__(self, name: str, func: Callable[["StageContext"], Any], deps: Iterable[str] = (),
+                 params: Iterable[str] = (), source: Optional[str] = None, streams: bool = False):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = list(params)
+        # Name of the upload the stage reads, if any
+        self.source = source
+        # Whether the stage gets the run's narrative fragment callback
+        self.streams = streams
+
+class StageContext:
+    """What a stage function sees: its dependencies' outputs, its parameters and its upload"""
+
+    def __init__(self, stage: Stage, outputs: Dict[str, Any], params: Dict[str, Any], source: Any, on_fragment):
+        self.stage = stage.name
+        self.outputs = {dep: outputs[dep] for dep in stage.deps}
+        self.params = {name: params.get(name) for name in stage.params}
+        self.source = source
+        self.on_fragment = on_fragment if stage.streams else None
+
+    def __getitem__(self, dep: str) -> Any:
+        return self.outputs[dep]
+
+def digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class StageGraph:
+    """Stages in dependency order, and the stages whose outputs make up the result"""
+
+    def __init__(self, name: str, stages: List[Stage], outputs: Optional[List[str]] = None,
+                 executor: Optional[Executor] = None):
+        self.name = name
+        # Stage functions block on n8n (and its concurrency limiter), so they run on their own
+        # threads instead of asyncio's default executor; None uses the default executor
+        self.executor = executor
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown or later stages: {', '.join(missing)}")
+            self.stages[stage.name] = stage
+        # Default: the stages nothing depends on
+        self.outputs = outputs or [name for name in self.stages if not any(name in s.deps for s in self.stages.values())]
+
+    def keys(self, digests: Dict[str, str], params: Dict[str, Any], seeds: Dict[str, Any]) -> Dict[str, str]:
+        """Cache key of every stage"""
+        keys = {}
+        for name, stage in self.stages.items():
+            if name in seeds:
+                keys[name] = digest({"seed": name, "output": seeds[name]})
+            else:
+                keys[name] = digest({
+                    "stage": name,
+                    "source": digests.get(stage.source) if stage.source else None,
+                    "params": {p: params.get(p) for p in stage.params},
+                    "deps": [keys[dep] for dep in stage.deps],
+                })
+        return keys
+
+    def _resolve(self, cache: MutableMapping, keys: Dict[str, str], seeds: Dict[str, Any], load: bool):
+        """Walk up from the result stages: (stage -> status, loaded outputs); nothing above a seeded or cached stage is needed"""
+        unknown = [name for name in seeds if name not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown seeded stages: {', '.join(unknown)}")
+        status: Dict[str, str] = {}
+        outputs: Dict[str, Any] = {}
+        pending = list(self.outputs)
+        while pending:
+            name = pending.pop()
+            if name in status:
+                continue
+            if name in seeds:
+                status[name] = "seeded"
+                outputs[name] = seeds[name]
+                continue
+            try:
+                # Loaded right away so an eviction cannot strand a stage whose dependencies were skipped
+                if load:
+                    outputs[name] = cache[keys[name]]
+                elif keys[name] not in cache:
+                    raise KeyError(keys[name])
+                status[name] = "cached"
+            except KeyError:
+                status[name] = "run"
+                pending.extend(self.stages[name].deps)
+        return {name: status[name] for name in self.stages if name in status}, outputs
+
+    def plan(self, cache: MutableMapping, digests: Dict[str, str], params: Dict[str, Any],
+             seeds: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+        """Stage -> "seeded", "cached" or "run" for a run with these inputs"""
+        seeds = seeds or {}
+        plan, _ = self._resolve(cache, self.keys(digests, params, seeds), seeds, load=False)
+        return plan
+
+    def unavailable(self, plan: Dict[str, str], sources: Dict[str, Any]) -> List[str]:
+        """Stages of a plan that have to run but read an upload that is not there"""
+        return [name for name, status in plan.items()
+                if status == "run" and self.stages[name].source and sources.get(self.stages[name].source) is None]
+
+    async def run(self, cache: MutableMapping, sources: Dict[str, Any], digests: Dict[str, str],
+                  params: Dict[str, Any], seeds: Optional[Dict[str, Any]] = None, on_fragment=None) -> Dict[str, Any]:
+        """Run the stages that are not cached; returns the outputs and a per-stage report"""
+        seeds = seeds or {}
+        keys = self.keys(digests, params, seeds)
+        plan, outputs = self._resolve(cache, keys, seeds, load=True)
+        missing = self.unavailable(plan, sources)
+        if missing:
+            raise StageUnavailable(f"Stages {', '.join(missing)} are no longer cached and their upload is gone; upload the file again")
+
+        report = {name: {"key": keys[name], "status": status, "processing_time": 0.0} for name, status in plan.items()}
+        for name, status in plan.items():
+            if status == "seeded":
+                cache[keys[name]] = seeds[name]
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            stage = self.stages[name]
+            await asyncio.gather(*(tasks[dep] for dep in stage.deps if dep in tasks))
+            start_time = time.perf_counter()
+            source = sources.get(stage.source) if stage.source else None
+            ctx = StageContext(stage, outputs, params, source, on_fragment)
+            context = contextvars.copy_context()
+            outputs[name] = await asyncio.get_running_loop().run_in_executor(self.executor, context.run, stage.func, ctx)
+            cache[keys[name]] = outputs[name]
+            report[name]["status"] = "ran"
+            report[name]["processing_time"] = time.perf_counter() - start_time
+            print(f"🧩 {self.name}: ran {name} in {report[name]['processing_time']:.2f}s")
+
+        for name, status in plan.items():
+            if status == "run":
+                tasks[name] = asyncio.create_task(run_stage(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return {"outputs": outputs, "stages": report}
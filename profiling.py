@@ -0,0 +1,182 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A profiled request, including the background job it queues, runs while a
+sampler thread records the stack of every busy thread at a fixed interval.
+Samples are written to PROFILE_DIR in the collapsed-stack format
+("frame;frame;frame count") read by flamegraph.pl, speedscope and inferno.
+
+Profiles are process-wide: the request's work hops between the event loop and
+several executors, so every busy thread is sampled, and whatever other requests
+ran meanwhile is included too. Each stack starts with its thread's name, and
+the profile records how many other requests overlapped it.
+
+Requests are profiled when an admin asks for it with the X-Profile header or
+profile=true query flag, or at random with probability PROFILE_SAMPLE_RATE
+for continuous profiling under real traffic.
+"""
+
+import asyncio
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+
+from fast_responses import ORJSONResponse
+
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Fraction of job-creating requests profiled without being asked (0 disables continuous profiling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Requests can only ask for a profile when ADMIN_TOKEN is set and sent in X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Paths that queue background jobs; only these are picked for continuous profiling
+SAMPLED_PATH_PREFIXES = ("/analyze/", "/datasets/")
+
+# Profile of the request being handled, linked from the job it creates
+current_profile: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_profile", default=None)
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+def is_idle(frame) -> bool:
+    """Thread pool workers waiting for work, threads blocked in threading waits and an event loop waiting for I/O"""
+    filename = frame.f_code.co_filename.replace("\\", "/")
+    name = frame.f_code.co_name
+    return (
+        (name == "_worker" and filename.endswith("concurrent/futures/thread.py"))
+        or (name == "wait" and filename.endswith("/threading.py"))
+        or (name == "select" and filename.endswith("/selectors.py"))
+    )
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every `interval` seconds"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+def write_collapsed(path: Path, samples: Counter):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+class ProfilingMiddleware:
+    """Profile requests (and their background tasks) that ask for it or are sampled"""
+
+    def __init__(self, app, interval_ms: float = PROFILE_INTERVAL_MS, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.interval = interval_ms / 1000
+        self.sample_rate = sample_rate
+        # HTTP requests in flight, and the profiles being recorded (to count the requests overlapping them)
+        self.active = 0
+        self.recording: List[Dict[str, Any]] = []
+
+    def requested(self, scope) -> bool:
+        headers = Headers(scope=scope)
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        flag = headers.get("x-profile") or (query.get("profile") or [""])[0]
+        return flag.lower() in ("1", "true", "yes")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for profile in self.recording:
+            profile["overlapping_requests"] += 1
+        self.active += 1
+        try:
+            await self.handle(scope, receive, send)
+        finally:
+            self.active -= 1
+
+    async def handle(self, scope, receive, send):
+        trigger = None
+        if self.requested(scope):
+            if not is_admin(Headers(scope=scope).get("x-admin-token")):
+                await ORJSONResponse({"detail": "Profiling requires a valid X-Admin-Token"}, status_code=403)(scope, receive, send)
+                return
+            trigger = "requested"
+        elif self.sample_rate > 0 and scope["path"].startswith(SAMPLED_PATH_PREFIXES) and random.random() < self.sample_rate:
+            trigger = "sampled"
+
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        profile = {
+            "id": profile_id,
+            "url": f"/profiles/{profile_id}.folded",
+            "trigger": trigger,
+            "path": scope["path"],
+            "scope": "process",
+            "status": "recording",
+            # Requests already running, then any started before the profile ends
+            "overlapping_requests": self.active - 1,
+        }
+        self.recording.append(profile)
+        token = current_profile.set(profile)
+        profiler = SamplingProfiler(self.interval)
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            # Starlette runs background tasks inside the app call, after the response is sent
+            await self.app(scope, receive, send)
+        finally:
+            self.recording.remove(profile)
+            current_profile.reset(token)
+            # Joining the sampler and writing the file block, so they run off the event loop
+            samples = await asyncio.to_thread(profiler.stop)
+            await asyncio.to_thread(write_collapsed, PROFILE_DIR / f"{profile_id}.folded", samples)
+            profile.update({
+                "status": "saved",
+                "duration_seconds": round(time.perf_counter() - start, 3),
+                "samples": profiler.sample_count,
+            })
+            print(f"🔬 Saved {trigger} profile {profile_id} for {scope['path']} ({profiler.sample_count} samples, "
+                  f"{profile['overlapping_requests']} overlapping requests)")
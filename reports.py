@@ -0,0 +1,165 @@
+"""
+PDF report and chart rendering for completed analyses.
+
+The render functions take plain result dicts and write to a path, so the API
+can run them in a process pool and keep matplotlib off the event loop.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.lib.styles import getSampleStyleSheet
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+# Charts available per result kind
+CHARTS = {
+    "finance": ["metrics", "ratios"],
+    "sales": ["channels", "salespeople"],
+    "business-advisory": ["metrics", "ratios", "channels", "salespeople"],
+}
+
+def result_hash(kind: str, result: Dict[str, Any]) -> str:
+    """Content hash of a result, used as the on-disk cache key"""
+    payload = json.dumps({"kind": kind, "result": result}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def parse_ratio(value: Any) -> float:
+    """Ratios come back from n8n as strings like '12.34%'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().rstrip("%").replace(",", ""))
+    except ValueError:
+        return float("nan")
+
+def finance_parts(result: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Finance metrics and ratios of a finance or business advisory result"""
+    metrics = result.get("metrics") or {}
+    ratios = result.get("ratios") or {}
+    if "finance" in metrics or "sales" in metrics:
+        metrics = metrics.get("finance") or {}
+        ratios = ratios.get("finance") or {}
+    return metrics, ratios
+
+def sales_totals(result: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Revenue per channel and per salesperson from the sales workflow ratios"""
+    ratios = result.get("ratios") or {}
+    if isinstance(ratios, dict):
+        ratios = ratios.get("sales") or []
+
+    totals = {"channels": {}, "salespeople": {}}
+    for item in ratios:
+        if not isinstance(item, dict):
+            continue
+        for source, target in (("channel_data", "channels"), ("sales_map", "salespeople")):
+            for name, values in (item.get(source) or {}).items():
+                if not isinstance(values, list):
+                    values = [values]
+                totals[target][str(name).strip()] = float(sum(v for v in values if isinstance(v, (int, float))))
+    return totals
+
+def chart_series(kind: str, result: Dict[str, Any], chart: str) -> Tuple[str, Dict[str, float]]:
+    """Title and label -> value series for a chart"""
+    if chart == "metrics":
+        metrics, _ = finance_parts(result)
+        return "Key Financial Metrics", {k: float(v) for k, v in metrics.items() if isinstance(v, (int, float))}
+    if chart == "ratios":
+        _, ratios = finance_parts(result)
+        return "Financial Ratios (%)", {k: parse_ratio(v) for k, v in ratios.items()}
+    if chart == "channels":
+        return "Revenue by Channel", sales_totals(result)["channels"]
+    if chart == "salespeople":
+        return "Revenue by Salesperson", sales_totals(result)["salespeople"]
+    raise ValueError(f"Unknown chart: {chart}")
+
+def render_chart(kind: str, result: Dict[str, Any], chart: str, out_path: str) -> str:
+    """Render one bar chart as PNG"""
+    title, series = chart_series(kind, result, chart)
+    series = dict(sorted(series.items(), key=lambda kv: kv[1], reverse=True))
+
+    fig, ax = plt.subplots(figsize=(8, 4.5))
+    if series:
+        ax.barh(list(series.keys())[::-1], list(series.values())[::-1], color="#2f6f9f")
+        ax.ticklabel_format(axis="x", style="plain", useOffset=False)
+    else:
+        ax.text(0.5, 0.5, "No data", ha="center", va="center", transform=ax.transAxes)
+    ax.set_title(title)
+    fig.tight_layout()
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format="png", dpi=120)
+    plt.close(fig)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def table_rows(values: Dict[str, Any], formatter) -> List[List[str]]:
+    return [[str(k), formatter(v)] for k, v in values.items()]
+
+def format_amount(value: Any) -> str:
+    if isinstance(value, (int, float)):
+        return f"{value:,.2f}"
+    return str(value)
+
+def render_report(kind: str, result: Dict[str, Any], out_path: str, chart_dir: str) -> str:
+    """Render a PDF report with metric/ratio tables, charts and the narrative"""
+    styles = getSampleStyleSheet()
+    story = [
+        Paragraph("Financial Statement Analysis Report", styles["Title"]),
+        Paragraph(f"Request {result.get('request_id', '')} &middot; {result.get('timestamp', '')}", styles["Normal"]),
+        Spacer(1, 0.5 * cm),
+    ]
+
+    table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#2f6f9f")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+    ])
+
+    sections = []
+    if kind in ("finance", "business-advisory"):
+        metrics, ratios = finance_parts(result)
+        sections.append(("Metrics", table_rows(metrics, format_amount)))
+        sections.append(("Ratios", table_rows(ratios, str)))
+    if kind in ("sales", "business-advisory"):
+        totals = sales_totals(result)
+        sections.append(("Revenue by Channel", table_rows(totals["channels"], format_amount)))
+        sections.append(("Revenue by Salesperson", table_rows(totals["salespeople"], format_amount)))
+
+    for title, rows in sections:
+        if not rows:
+            continue
+        story.append(Paragraph(title, styles["Heading2"]))
+        story.append(Table([["Item", "Value"]] + rows, colWidths=[9 * cm, 6 * cm], style=table_style))
+        story.append(Spacer(1, 0.4 * cm))
+
+    stem = os.path.splitext(os.path.basename(out_path))[0]
+    for chart in CHARTS[kind]:
+        _, series = chart_series(kind, result, chart)
+        if not series:
+            continue
+        chart_path = os.path.join(chart_dir, f"{stem}-{chart}.png")
+        if not os.path.exists(chart_path):
+            render_chart(kind, result, chart, chart_path)
+        story.append(Image(chart_path, width=16 * cm, height=9 * cm))
+        story.append(Spacer(1, 0.4 * cm))
+
+    story.append(Paragraph("Analysis", styles["Heading2"]))
+    for paragraph in str(result.get("analysis", "")).split("\n\n"):
+        text = paragraph.strip().replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        if text:
+            story.append(Paragraph(text.replace("\n", "<br/>"), styles["BodyText"]))
+            story.append(Spacer(1, 0.2 * cm))
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    SimpleDocTemplate(tmp_path, pagesize=A4, title="Financial Statement Analysis Report").build(story)
+    os.replace(tmp_path, out_path)
+    return out_path
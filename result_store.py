@@ -0,0 +1,216 @@
+"""
+Compressed, size-accounted storage for analysis results.
+
+A ResultStore is a drop-in replacement for the result dicts. Each result is
+pickled; results at least `compress_min_bytes` long are kept compressed (zstd
+when the zstandard package is installed, zlib otherwise) and decompressed on
+read. A small LRU of recently read results is kept decompressed, so status
+polling does not decompress the same result again and again. Every read
+unpickles a fresh copy, so a caller that changes a result never changes the
+stored one, whatever its size.
+
+All stores share a ResultBudget: when their stored plus hot bytes exceed it,
+the least recently written or read results across all stores are evicted.
+"""
+
+import os
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSION_CODECS = ["zstd", "zlib", "none"]
+RESULT_COMPRESSION = os.getenv("RESULT_COMPRESSION", "zstd" if zstandard is not None else "zlib")
+RESULT_COMPRESS_MIN_BYTES = int(os.getenv("RESULT_COMPRESS_MIN_BYTES", "2048"))
+RESULT_HOT_ENTRIES = int(os.getenv("RESULT_HOT_ENTRIES", "64"))
+RESULT_MEMORY_BUDGET_MB = float(os.getenv("RESULT_MEMORY_BUDGET_MB", "512"))
+
+_zstd_local = threading.local()
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if not hasattr(_zstd_local, "compressor"):
+            _zstd_local.compressor = zstandard.ZstdCompressor(level=6)
+        return _zstd_local.compressor.compress(data)
+    return zlib.compress(data, 6)
+
+def decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if not hasattr(_zstd_local, "decompressor"):
+            _zstd_local.decompressor = zstandard.ZstdDecompressor()
+        return _zstd_local.decompressor.decompress(blob)
+    return zlib.decompress(blob)
+
+class ResultBudget:
+    """Byte budget shared by several stores; evicts the least recently used results across all of them"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evicted = 0
+        # (store, key) from least to most recently written or read
+        self._order: "OrderedDict[Tuple[int, str], ResultStore]" = OrderedDict()
+        self.lock = threading.RLock()
+
+    def added(self, store: "ResultStore", key: str, nbytes: int):
+        self.total_bytes += nbytes
+        self._order[(id(store), key)] = store
+        self._order.move_to_end((id(store), key))
+
+    def accessed(self, store: "ResultStore", key: str):
+        if (id(store), key) in self._order:
+            self._order.move_to_end((id(store), key))
+
+    def removed(self, store: "ResultStore", key: str, nbytes: int):
+        self.total_bytes -= nbytes
+        self._order.pop((id(store), key), None)
+
+    def enforce(self):
+        if self.max_bytes <= 0 or self.total_bytes <= self.max_bytes:
+            return
+        while self.total_bytes > self.max_bytes and self._order:
+            (_, key), store = next(iter(self._order.items()))
+            store.evict(key)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "used_bytes": self.total_bytes,
+                "evicted": self.evicted,
+            }
+
+class ResultStore(MutableMapping):
+    """Mapping of request_id -> result that keeps large results compressed"""
+
+    def __init__(self, name: str, budget: ResultBudget, codec: str = RESULT_COMPRESSION,
+                 compress_min_bytes: int = RESULT_COMPRESS_MIN_BYTES, hot_entries: int = RESULT_HOT_ENTRIES):
+        if codec not in COMPRESSION_CODECS:
+            raise ValueError(f"Unknown compression {codec!r}. Use one of: {', '.join(COMPRESSION_CODECS)}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("RESULT_COMPRESSION=zstd requires the zstandard package")
+        self.name = name
+        self.budget = budget
+        self.codec = codec
+        self.compress_min_bytes = compress_min_bytes
+        self.hot_entries = hot_entries
+        # key -> (codec or "pickle", compressed or pickled bytes, stored bytes, pickled bytes)
+        self._entries: Dict[str, Tuple[str, bytes, int, int]] = {}
+        # Pickled bytes of recently read compressed entries
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.hot_bytes = 0
+        self.decompressions = 0
+
+    def __setitem__(self, key: str, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.codec != "none" and len(data) >= self.compress_min_bytes:
+            blob = compress(data, self.codec)
+            entry = (self.codec, blob, len(blob), len(data))
+        else:
+            entry = ("pickle", data, len(data), len(data))
+
+        with self.budget.lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.raw_bytes += entry[3]
+            self.stored_bytes += entry[2]
+            self.budget.added(self, key, entry[2])
+            if entry[0] != "pickle":
+                # Just written results are usually polled right away
+                self._make_hot(key, data)
+            self.budget.enforce()
+
+    def __getitem__(self, key: str) -> Any:
+        with self.budget.lock:
+            codec, stored, _, _ = self._entries[key]
+            self.budget.accessed(self, key)
+            data = self._hot.get(key)
+            if data is not None:
+                self._hot.move_to_end(key)
+        if data is None and codec == "pickle":
+            data = stored
+        elif data is None:
+            data = decompress(stored, codec)
+            with self.budget.lock:
+                self.decompressions += 1
+                if self._entries.get(key, (None, None))[1] is stored:
+                    self._make_hot(key, data)
+                    self.budget.enforce()
+        return pickle.loads(data)
+
+    def __delitem__(self, key: str):
+        with self.budget.lock:
+            if key not in self._entries:
+                raise KeyError(key)
+            self._remove(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self.budget.lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def _make_hot(self, key: str, data: bytes):
+        if self.hot_entries <= 0:
+            return
+        if key not in self._hot:
+            self.hot_bytes += len(data)
+            self.budget.total_bytes += len(data)
+        self._hot[key] = data
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries:
+            self._drop_hot_key(next(iter(self._hot)))
+
+    def _drop_hot_key(self, key: str):
+        self._hot.pop(key)
+        raw = self._entries[key][3]
+        self.hot_bytes -= raw
+        self.budget.total_bytes -= raw
+
+    def _remove(self, key: str):
+        if key in self._hot:
+            self._drop_hot_key(key)
+        _, _, stored, raw = self._entries.pop(key)
+        self.raw_bytes -= raw
+        self.stored_bytes -= stored
+        self.budget.removed(self, key, stored)
+
+    def evict(self, key: str):
+        self._remove(key)
+        print(f"🗑️  Evicted result {key} from {self.name} to stay within the result memory budget")
+
+    def memory_stats(self) -> Dict[str, Any]:
+        with self.budget.lock:
+            compressed = sum(1 for entry in self._entries.values() if entry[0] != "pickle")
+            return {
+                "entries": len(self._entries),
+                "approx_bytes": self.stored_bytes + self.hot_bytes,
+                "compressed_entries": compressed,
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "compression_ratio": round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else None,
+                "hot_entries": len(self._hot),
+                "hot_bytes": self.hot_bytes,
+                "decompressions": self.decompressions,
+            }
+
+result_budget = ResultBudget(int(RESULT_MEMORY_BUDGET_MB * 1024 * 1024))
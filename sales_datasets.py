@@ -0,0 +1,633 @@
+"""
+Named sales datasets aggregated incrementally.
+
+Rows appended to a dataset are folded into running per-channel,
+per-salesperson, per-customer and per-item totals, so an append costs
+O(new rows) rather than a rescan of the history. Dated rows are also folded
+into daily, weekly and monthly rollups, which answer range queries without
+touching the rows again. The aggregate state is saved under DATASET_DIR and
+reloaded on first use: each append adds the totals of its own rows to an
+append-only log, which is folded into the saved snapshot every
+DATASET_COMPACT_APPENDS appends, so an append writes O(new rows) too.
+
+Rows are also folded into a SalesSketch (see sketches.py): top customers and
+items, distinct customers and sale-value quantiles in fixed memory. Sketches
+merge across chunks and files, so huge exports can be summarised chunk by
+chunk without keeping their rows.
+"""
+
+import bisect
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from lazy_imports import LazyModule
+from sketches import HyperLogLog, TDigest, TopK
+
+pd = LazyModule("pandas")
+
+DATASET_DIR = Path(os.getenv("DATASET_DIR", "datasets"))
+DATASET_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Appends logged before the log is folded into the snapshot
+DATASET_COMPACT_APPENDS = int(os.getenv("DATASET_COMPACT_APPENDS", "100"))
+
+# Canonical column -> accepted headers, compared lowercased with spaces and punctuation removed
+COLUMN_ALIASES = {
+    "date": ["date"],
+    "invoice": ["invoiceno", "invoice", "invoicenumber"],
+    "item": ["itemcode"],
+    "item_name": ["itemname"],
+    "quantity": ["quantitysold", "qtysold", "quantity", "qty"],
+    "revenue": ["totalsalevalue", "totalsale", "salevalue"],
+    "customer": ["customerid", "customer"],
+    "salesperson": ["salesperson"],
+    "channel": ["channel"],
+}
+
+# Aggregation dimension -> key in the summary
+DIMENSIONS = {
+    "channel": "channels",
+    "salesperson": "salespeople",
+    "customer": "customers",
+    "item": "items",
+}
+
+REQUIRED_COLUMNS = ["revenue", *DIMENSIONS]
+
+# Rollup grains; every period is keyed by the ISO date it starts on (weeks start on Monday)
+GRAINS = ["day", "week", "month"]
+
+# Dates like 15/01/2025 are day first unless SALES_DATE_DAYFIRST=false
+DATE_DAYFIRST = os.getenv("SALES_DATE_DAYFIRST", "true").lower() == "true"
+
+# Sketch sizes: labels tracked per top-K list, HyperLogLog precision, t-digest compression
+SKETCH_TOP_CAPACITY = int(os.getenv("SKETCH_TOP_CAPACITY", "200"))
+SKETCH_TOP_K = int(os.getenv("SKETCH_TOP_K", "20"))
+SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "12"))
+SKETCH_COMPRESSION = float(os.getenv("SKETCH_COMPRESSION", "100"))
+SKETCH_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+# Top-K lists: name -> (dimension, weight column or None to count rows)
+TOP_LISTS = {
+    "customers_by_revenue": ("customer", "revenue"),
+    "customers_by_rows": ("customer", None),
+    "items_by_revenue": ("item", "revenue"),
+    "items_by_quantity": ("item", "quantity"),
+}
+
+# Sale-value digests kept per label of these dimensions
+QUANTILE_DIMENSIONS = {"channel": "channels", "salesperson": "salespeople"}
+
+def normalize_header(header: Any) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(header).lower())
+
+def canonical_columns(frame) -> Dict[str, str]:
+    """Map canonical column names to the headers used by this file"""
+    headers = {normalize_header(column): column for column in frame.columns}
+    found = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                found[name] = headers[alias]
+                break
+    return found
+
+def labels(column):
+    """Dimension values as clean strings; whole numbers lose padding and decimals ('000005', 5.0 -> '5')"""
+    text = column.fillna("").astype(str).str.strip()
+    numbers = pd.to_numeric(text, errors="coerce")
+    whole = numbers.notna() & (numbers % 1 == 0)
+    text = text.where(~whole, numbers.where(whole, 0).astype("int64").astype(str))
+    return text.where(text != "", "(blank)")
+
+def parse_dates(column):
+    """Dates as exported by the sales systems: 15/01/2025, 20250106 or 2025-06-01 00:00:00; NaT if unparseable"""
+    text = column.fillna("").astype(str).str.strip()
+    compact = text.str.fullmatch(r"\d{8}")
+    iso = text.str.match(r"\d{4}-\d{2}-\d{2}")
+    dates = pd.to_datetime(text.where(iso).str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+    dates = dates.fillna(pd.to_datetime(text.where(compact), format="%Y%m%d", errors="coerce"))
+    slashed = text.where(~(compact | iso))
+    return dates.fillna(pd.to_datetime(slashed, format="%d/%m/%Y" if DATE_DAYFIRST else "%m/%d/%Y", errors="coerce"))
+
+def period_starts(dates, grain: str):
+    """ISO start date of the day, week or month each date falls in"""
+    if grain == "week":
+        dates = dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+    elif grain == "month":
+        dates = dates - pd.to_timedelta(dates.dt.day - 1, unit="D")
+    return dates.dt.strftime("%Y-%m-%d")
+
+def period_start(day: date, grain: str) -> str:
+    if grain == "week":
+        day = day - timedelta(days=day.weekday())
+    elif grain == "month":
+        day = day.replace(day=1)
+    return day.isoformat()
+
+def prepare_rows(frame):
+    """Rename a raw sales frame to canonical columns and coerce the values"""
+    columns = canonical_columns(frame)
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ValueError(f"Missing sales columns: {', '.join(missing)}")
+
+    rows = frame[list(columns.values())].rename(columns={v: k for k, v in columns.items()})
+    rows["revenue"] = pd.to_numeric(rows["revenue"], errors="coerce").fillna(0.0)
+    if "quantity" in rows:
+        rows["quantity"] = pd.to_numeric(rows["quantity"], errors="coerce").fillna(0.0)
+    else:
+        rows["quantity"] = 0.0
+    for name in DIMENSIONS:
+        rows[name] = labels(rows[name])
+    if "item_name" in rows:
+        rows["item_name"] = rows["item_name"].fillna("").astype(str).str.strip()
+    rows["date"] = parse_dates(rows["date"]) if "date" in rows else pd.NaT
+    if "invoice" in rows:
+        rows["invoice"] = labels(rows["invoice"])
+    return rows
+
+def read_sales_file(filename: str, f: BinaryIO):
+    """Read an uploaded CSV or Excel sales export, all cells as text"""
+    if filename.lower().endswith(".csv"):
+        return pd.read_csv(f, dtype=str, encoding="latin-1")
+    return pd.read_excel(f, dtype=str)
+
+class SalesSketch:
+    """Fixed-size summary of prepared sales rows; sketches of disjoint rows merge into the sketch of all of them"""
+
+    def __init__(self):
+        self.rows = 0
+        self.customers = HyperLogLog(SKETCH_HLL_PRECISION)
+        self.top = {name: TopK(SKETCH_TOP_CAPACITY) for name in TOP_LISTS}
+        self.sale_values = TDigest(SKETCH_COMPRESSION)
+        # dimension -> label -> digest of that label's sale values
+        self.quantiles: Dict[str, Dict[str, TDigest]] = {name: {} for name in QUANTILE_DIMENSIONS}
+
+    def update(self, rows):
+        if rows.empty:
+            return
+        self.rows += len(rows)
+        self.customers.update(rows["customer"])
+        for name, (dimension, weight) in TOP_LISTS.items():
+            self.top[name].update(rows[dimension], rows[weight] if weight else None)
+        self.sale_values.update(rows["revenue"])
+        for dimension, digests in self.quantiles.items():
+            for label, values in rows.groupby(dimension, sort=False)["revenue"]:
+                digests.setdefault(label, TDigest(SKETCH_COMPRESSION)).update(values)
+
+    def merge(self, other: "SalesSketch"):
+        self.rows += other.rows
+        self.customers.merge(other.customers)
+        for name, top in self.top.items():
+            top.merge(other.top[name])
+        self.sale_values.merge(other.sale_values)
+        for dimension, digests in self.quantiles.items():
+            for label, digest in other.quantiles[dimension].items():
+                digests.setdefault(label, TDigest(SKETCH_COMPRESSION)).merge(digest)
+
+    @staticmethod
+    def distribution(digest: TDigest) -> Dict[str, Any]:
+        return {
+            "count": int(digest.count),
+            "total": digest.total(),
+            "min": digest.min,
+            "max": digest.max,
+            **digest.quantiles(SKETCH_QUANTILES),
+        }
+
+    def summary(self, top: int = SKETCH_TOP_K) -> Dict[str, Any]:
+        """JSON-safe summary: estimates only, sized by `top` and the number of channels and salespeople"""
+        return {
+            "rows": self.rows,
+            "distinct_customers": self.customers.estimate(),
+            "distinct_customers_error": round(1.04 / len(self.customers.registers) ** 0.5, 4),
+            "top": {name: sketch.top(top) for name, sketch in self.top.items()},
+            "sale_value": self.distribution(self.sale_values),
+            **{
+                f"sale_value_by_{key}": {label: self.distribution(d) for label, d in sorted(self.quantiles[dimension].items())}
+                for dimension, key in QUANTILE_DIMENSIONS.items()
+            },
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "customers": self.customers.to_dict(),
+            "top": {name: sketch.to_dict() for name, sketch in self.top.items()},
+            "sale_values": self.sale_values.to_dict(),
+            "quantiles": {
+                dimension: {label: digest.to_dict() for label, digest in digests.items()}
+                for dimension, digests in self.quantiles.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SalesSketch":
+        sketch = cls()
+        sketch.rows = data["rows"]
+        sketch.customers = HyperLogLog.from_dict(data["customers"])
+        sketch.top.update({name: TopK.from_dict(top) for name, top in data["top"].items()})
+        sketch.sale_values = TDigest.from_dict(data["sale_values"])
+        for dimension, digests in data["quantiles"].items():
+            sketch.quantiles[dimension] = {label: TDigest.from_dict(d) for label, d in digests.items()}
+        return sketch
+
+def sketch_frames(frames) -> SalesSketch:
+    """Sketch raw sales frames (e.g. CSV chunks) one at a time"""
+    sketch = SalesSketch()
+    for frame in frames:
+        sketch.update(prepare_rows(frame))
+    return sketch
+
+def read_sales_chunks(filename: str, f: BinaryIO, chunk_rows: int, sheet: Optional[str] = None):
+    """Raw frames of at most chunk_rows rows; CSVs are streamed, Excel sheets are read whole and sliced"""
+    if filename.lower().endswith(".csv"):
+        with pd.read_csv(f, dtype=str, encoding="latin-1", chunksize=chunk_rows) as reader:
+            yield from reader
+        return
+    frame = pd.read_excel(f, dtype=str, sheet_name=sheet if sheet is not None else 0)
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+def sales_sheets(filename: str, f: BinaryIO) -> List[Optional[str]]:
+    """Sheets of an Excel workbook with sales columns ([None] for a CSV); master-data sheets are skipped"""
+    if filename.lower().endswith(".csv"):
+        return [None]
+    headers = pd.read_excel(f, sheet_name=None, nrows=0)
+    sheets = [
+        name for name, frame in headers.items()
+        if all(column in canonical_columns(frame) for column in REQUIRED_COLUMNS)
+    ]
+    # With no sales sheet, parse the first one so its missing columns are reported
+    return sheets or list(headers)[:1]
+
+def sketch_part(filename: str, source, sheet: Optional[str], chunk_rows: int) -> Dict[str, Any]:
+    """Sketch one CSV or one workbook sheet, given as a file path or its bytes; runs in ingest worker processes.
+
+    A part without the sales columns (e.g. a notes sheet) is reported with its
+    error and an empty sketch rather than failing the whole upload.
+    """
+    start = time.perf_counter()
+    part = {"file": filename, "sheet": sheet, "rows": 0, "error": None}
+    try:
+        with (open(source, "rb") if isinstance(source, str) else io.BytesIO(source)) as f, \
+                closing(read_sales_chunks(filename, f, chunk_rows, sheet)) as frames:
+            part["sketch"] = sketch_frames(frames)
+        part["rows"] = part["sketch"].rows
+    except ValueError as e:
+        part["sketch"] = SalesSketch()
+        part["error"] = str(e)
+    part["parse_seconds"] = round(time.perf_counter() - start, 4)
+    part["worker_pid"] = os.getpid()
+    return part
+
+def merge_tree(sketches: List[SalesSketch]) -> SalesSketch:
+    """Merge partial sketches pairwise, level by level"""
+    if not sketches:
+        return SalesSketch()
+    while len(sketches) > 1:
+        level = []
+        for i in range(0, len(sketches) - 1, 2):
+            sketches[i].merge(sketches[i + 1])
+            level.append(sketches[i])
+        if len(sketches) % 2:
+            level.append(sketches[-1])
+        sketches = level
+    return sketches[0]
+
+class SalesDataset:
+    """Running aggregates of every row appended to one dataset"""
+
+    def __init__(self, dataset_id: str):
+        self.dataset_id = dataset_id
+        self.created = datetime.now().isoformat()
+        self.updated = self.created
+        self.rows = 0
+        self.revenue = 0.0
+        self.quantity = 0.0
+        self.files: List[Dict[str, Any]] = []
+        self.item_names: Dict[str, str] = {}
+        self.dimensions: Dict[str, Dict[str, Dict[str, float]]] = {name: {} for name in DIMENSIONS}
+        # rollups[grain][dimension or "total"][period][label] -> totals, periods[grain] kept sorted
+        self.rollups: Dict[str, Dict[str, Dict[str, Dict[str, Dict[str, float]]]]] = {
+            grain: {name: {} for name in ["total", *DIMENSIONS]} for grain in GRAINS
+        }
+        self.periods: Dict[str, List[str]] = {grain: [] for grain in GRAINS}
+        self.undated_rows = 0
+        self.sketch = SalesSketch()
+        # Sequence number of the last append, and appends logged since the snapshot was written
+        self.seq = 0
+        self.logged = 0
+        self.lock = threading.Lock()
+
+    def has_file(self, digest: str) -> bool:
+        return any(f.get("digest") == digest for f in self.files)
+
+    def fold(self, rows) -> int:
+        """Add prepared rows to the running totals"""
+        for name, totals in self.dimensions.items():
+            grouped = rows.groupby(name, sort=False).agg(
+                revenue=("revenue", "sum"),
+                quantity=("quantity", "sum"),
+                rows=("revenue", "size"),
+            )
+            for key, revenue, quantity, count in grouped.itertuples():
+                entry = totals.setdefault(key, {"revenue": 0.0, "quantity": 0.0, "rows": 0})
+                entry["revenue"] += float(revenue)
+                entry["quantity"] += float(quantity)
+                entry["rows"] += int(count)
+
+        if "item_name" in rows:
+            named = rows[rows["item_name"] != ""]
+            self.item_names.update(zip(named["item"], named["item_name"]))
+
+        self.fold_rollups(rows)
+        self.sketch.update(rows)
+
+        self.rows += len(rows)
+        self.revenue += float(rows["revenue"].sum())
+        self.quantity += float(rows["quantity"].sum())
+        self.updated = datetime.now().isoformat()
+        return len(rows)
+
+    def fold_rollups(self, rows):
+        """Add dated rows to the day/week/month rollups.
+
+        Invoices are counted as distinct invoice numbers per period and label
+        within an append, so an invoice split across two appends counts twice.
+        """
+        dated = rows[rows["date"].notna()]
+        self.undated_rows += len(rows) - len(dated)
+        if dated.empty:
+            return
+
+        aggregations = {
+            "revenue": ("revenue", "sum"),
+            "quantity": ("quantity", "sum"),
+            "rows": ("revenue", "size"),
+        }
+        if "invoice" in dated:
+            aggregations["invoices"] = ("invoice", "nunique")
+
+        for grain in GRAINS:
+            frame = dated.assign(period=period_starts(dated["date"], grain))
+            for name in ["total", *DIMENSIONS]:
+                keys = ["period"] if name == "total" else ["period", name]
+                grouped = frame.groupby(keys, sort=False).agg(**aggregations)
+                buckets = self.rollups[grain][name]
+                for key, values in zip(grouped.index, grouped.itertuples(index=False)):
+                    period, label = (key, "total") if name == "total" else key
+                    if period not in buckets:
+                        buckets[period] = {}
+                        if name == "total":
+                            bisect.insort(self.periods[grain], period)
+                    entry = buckets[period].setdefault(label, {"revenue": 0.0, "quantity": 0.0, "rows": 0, "invoices": 0})
+                    entry["revenue"] += float(values.revenue)
+                    entry["quantity"] += float(values.quantity)
+                    entry["rows"] += int(values.rows)
+                    entry["invoices"] += int(getattr(values, "invoices", 0))
+
+    def merge(self, delta: "SalesDataset"):
+        """Add the aggregates of another dataset, holding only newer rows"""
+        for name, totals in delta.dimensions.items():
+            for key, added in totals.items():
+                entry = self.dimensions[name].setdefault(key, {"revenue": 0.0, "quantity": 0.0, "rows": 0})
+                for field, value in added.items():
+                    entry[field] += value
+        self.item_names.update(delta.item_names)
+
+        for grain, dimensions in delta.rollups.items():
+            for name, buckets in dimensions.items():
+                for period, labels in buckets.items():
+                    if period not in self.rollups[grain][name]:
+                        self.rollups[grain][name][period] = {}
+                        if name == "total":
+                            bisect.insort(self.periods[grain], period)
+                    for label, added in labels.items():
+                        entry = self.rollups[grain][name][period].setdefault(label, {"revenue": 0.0, "quantity": 0.0, "rows": 0, "invoices": 0})
+                        for field, value in added.items():
+                            entry[field] += value
+        self.sketch.merge(delta.sketch)
+
+        self.rows += delta.rows
+        self.revenue += delta.revenue
+        self.quantity += delta.quantity
+        self.undated_rows += delta.undated_rows
+        self.files.extend(delta.files)
+        self.updated = delta.updated
+
+    def rollup(self, grain: str, by: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Precomputed totals per period (and per label of `by`) for periods overlapping [start, end]"""
+        with self.lock:
+            periods = self.periods[grain]
+            lo = bisect.bisect_left(periods, period_start(start, grain)) if start else 0
+            hi = bisect.bisect_right(periods, period_start(end, grain)) if end else len(periods)
+            buckets = self.rollups[grain][by or "total"]
+
+            result = []
+            for period in periods[lo:hi]:
+                for label, entry in buckets.get(period, {}).items():
+                    row = {"period": period, **entry}
+                    if by:
+                        row[by] = label
+                    result.append(row)
+            return result
+
+    def summary(self, top: Optional[int] = None) -> Dict[str, Any]:
+        with self.lock:
+            return self._summary(top)
+
+    def _summary(self, top: Optional[int]) -> Dict[str, Any]:
+        result = {
+            "dataset_id": self.dataset_id,
+            "created": self.created,
+            "updated": self.updated,
+            "rows": self.rows,
+            "undated_rows": self.undated_rows,
+            "first_period": self.periods["day"][0] if self.periods["day"] else None,
+            "last_period": self.periods["day"][-1] if self.periods["day"] else None,
+            "total_revenue": self.revenue,
+            "total_quantity": self.quantity,
+            "files": list(self.files),
+        }
+        for name, key in DIMENSIONS.items():
+            ranked = sorted(self.dimensions[name].items(), key=lambda kv: kv[1]["revenue"], reverse=True)
+            if top is not None:
+                ranked = ranked[:top]
+            result[key] = {label: dict(entry) for label, entry in ranked}
+        for code, entry in result["items"].items():
+            if code in self.item_names:
+                entry["name"] = self.item_names[code]
+        result["sketches"] = self.sketch.summary(top or SKETCH_TOP_K)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "dataset_id": self.dataset_id,
+            "created": self.created,
+            "updated": self.updated,
+            "rows": self.rows,
+            "revenue": self.revenue,
+            "quantity": self.quantity,
+            "files": self.files,
+            "item_names": self.item_names,
+            "dimensions": self.dimensions,
+            "rollups": self.rollups,
+            "periods": self.periods,
+            "undated_rows": self.undated_rows,
+            "sketch": self.sketch.to_dict(),
+            "seq": self.seq,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SalesDataset":
+        dataset = cls(data["dataset_id"])
+        dataset.created = data["created"]
+        dataset.updated = data["updated"]
+        dataset.rows = data["rows"]
+        dataset.revenue = data["revenue"]
+        dataset.quantity = data["quantity"]
+        dataset.files = data["files"]
+        dataset.item_names = data["item_names"]
+        dataset.dimensions.update(data["dimensions"])
+        # Datasets saved before rollups existed start with empty rollups
+        dataset.rollups.update(data.get("rollups", {}))
+        dataset.periods.update(data.get("periods", {}))
+        dataset.undated_rows = data.get("undated_rows", 0)
+        # Datasets saved before sketches existed only sketch rows appended from now on (see sketches.rows)
+        if "sketch" in data:
+            dataset.sketch = SalesSketch.from_dict(data["sketch"])
+        dataset.seq = data.get("seq", 0)
+        return dataset
+
+# Datasets loaded in this process
+sales_datasets: Dict[str, SalesDataset] = {}
+_store_lock = threading.Lock()
+
+def dataset_path(dataset_id: str) -> Path:
+    return DATASET_DIR / f"{dataset_id}.json"
+
+def dataset_log_path(dataset_id: str) -> Path:
+    return DATASET_DIR / f"{dataset_id}.log"
+
+def load_dataset(dataset_id: str) -> Optional[SalesDataset]:
+    """Snapshot from disk with the appends logged after it, or None if neither exists"""
+    path, log_path = dataset_path(dataset_id), dataset_log_path(dataset_id)
+    if path.exists():
+        dataset = SalesDataset.from_dict(json.loads(path.read_text(encoding="utf-8")))
+    elif log_path.exists():
+        dataset = SalesDataset(dataset_id)
+    else:
+        return None
+    if log_path.exists():
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash mid-append; that append was never acknowledged
+                    break
+                # Appends already in the snapshot (the process stopped before the log was truncated)
+                if data["seq"] <= dataset.seq:
+                    continue
+                dataset.merge(SalesDataset.from_dict(data))
+                dataset.seq = data["seq"]
+                dataset.logged += 1
+    return dataset
+
+def get_dataset(dataset_id: str, create: bool = False) -> Optional[SalesDataset]:
+    """Dataset from memory or disk; with create, a new empty dataset if none exists"""
+    if not DATASET_ID_PATTERN.match(dataset_id):
+        raise ValueError("Dataset IDs may only contain letters, digits, '-' and '_' (max 64)")
+    with _store_lock:
+        if dataset_id not in sales_datasets:
+            dataset = load_dataset(dataset_id)
+            if dataset is not None:
+                sales_datasets[dataset_id] = dataset
+            elif create:
+                sales_datasets[dataset_id] = SalesDataset(dataset_id)
+            else:
+                return None
+        return sales_datasets[dataset_id]
+
+def save_dataset(dataset: SalesDataset):
+    """Write the full snapshot and empty the log it now contains"""
+    DATASET_DIR.mkdir(exist_ok=True)
+    path = dataset_path(dataset.dataset_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dataset.to_dict(), f)
+    os.replace(tmp_path, path)
+    dataset_log_path(dataset.dataset_id).unlink(missing_ok=True)
+    dataset.logged = 0
+
+def log_append(dataset: SalesDataset, delta: SalesDataset):
+    """Persist one append as a line of its own totals; compacts once the log is long"""
+    if dataset.logged + 1 >= DATASET_COMPACT_APPENDS:
+        save_dataset(dataset)
+        return
+    DATASET_DIR.mkdir(exist_ok=True)
+    with open(dataset_log_path(dataset.dataset_id), "a", encoding="utf-8") as f:
+        f.write(json.dumps(delta.to_dict()) + "\n")
+    dataset.logged += 1
+
+def list_datasets() -> List[str]:
+    on_disk = {p.stem for pattern in ("*.json", "*.log") for p in DATASET_DIR.glob(pattern)} if DATASET_DIR.exists() else set()
+    return sorted(on_disk | set(sales_datasets))
+
+def delete_dataset(dataset_id: str) -> bool:
+    with _store_lock:
+        loaded = sales_datasets.pop(dataset_id, None) is not None
+        found = False
+        for path in (dataset_path(dataset_id), dataset_log_path(dataset_id)):
+            if path.exists():
+                path.unlink()
+                found = True
+        return found or loaded
+
+def append_rows(dataset_id: str, frame, source: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold a frame of new rows into the dataset and persist its state"""
+    dataset = get_dataset(dataset_id, create=True)
+    with dataset.lock:
+        if source.get("digest") and dataset.has_file(source["digest"]):
+            return {"dataset_id": dataset_id, "rows_appended": 0, "duplicate": True, "total_rows": dataset.rows}
+
+        # Folded on its own first, so the same totals update the dataset and go to the log
+        delta = SalesDataset(dataset_id)
+        appended = delta.fold(prepare_rows(frame))
+        delta.files.append({**source, "rows": appended, "appended_at": delta.updated})
+        delta.seq = dataset.seq + 1
+        dataset.merge(delta)
+        dataset.seq = delta.seq
+        log_append(dataset, delta)
+        return {"dataset_id": dataset_id, "rows_appended": appended, "duplicate": False, "total_rows": dataset.rows}
+
+def file_digest(f: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+def append_file(dataset_id: str, filename: str, f: BinaryIO) -> Dict[str, Any]:
+    """Append an uploaded sales export; a file with the same content is only counted once"""
+    digest = file_digest(f)
+    dataset = get_dataset(dataset_id, create=True)
+    if dataset.has_file(digest):
+        return {"dataset_id": dataset_id, "rows_appended": 0, "duplicate": True, "total_rows": dataset.rows}
+    frame = read_sales_file(filename, f)
+    return append_rows(dataset_id, frame, {"filename": filename, "digest": digest})
+
+def append_records(dataset_id: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Append rows posted as JSON objects keyed by column header"""
+    frame = pd.DataFrame.from_records(records)
+    return append_rows(dataset_id, frame, {"filename": None, "digest": None})
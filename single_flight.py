@@ -0,0 +1,149 @@
+"""
+Single-flight execution of identical analyses.
+
+When the same file is uploaded several times within seconds, the stage cache
+cannot help yet: nothing has finished. Requests for the same work (same content
+hash, analysis type and parameters) therefore share one execution. The first one
+starts it and later ones attach while it is in flight. Each request keeps its
+own request_id but resolves from the shared outcome, and a failure reaches every
+attached request. When the request that starts the execution streams, narrative
+fragments go to every attached request's stream, and a late joiner first gets
+the fragments it missed.
+
+Cancellation is reference-counted. A request that cancels detaches and
+resolves as cancelled. The shared execution is cancelled only when the last
+attached request detaches.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+class Flight:
+    """One shared execution and the requests attached to it"""
+
+    def __init__(self, key: str, leader: str):
+        self.key = key
+        self.leader = leader
+        self.started = time.time()
+        self.task: Optional[asyncio.Task] = None
+        # request_id -> future resolved with the shared outcome
+        self.waiters: Dict[str, asyncio.Future] = {}
+        # request_id -> fragment callback (None when the request does not stream)
+        self.sinks: Dict[str, Optional[Callable[[str], None]]] = {}
+        self.fragments: List[str] = []
+        self._lock = threading.Lock()
+
+    def push(self, text: str):
+        """Relay a fragment to every attached stream; called from the worker thread running the stage"""
+        with self._lock:
+            self.fragments.append(text)
+            sinks = [sink for sink in self.sinks.values() if sink is not None]
+        for sink in sinks:
+            sink(text)
+
+    def streams(self) -> bool:
+        """Whether any attached request streams its narrative"""
+        with self._lock:
+            return any(sink is not None for sink in self.sinks.values())
+
+    def attach(self, request_id: str, sink: Optional[Callable[[str], None]]) -> asyncio.Future:
+        with self._lock:
+            self.sinks[request_id] = sink
+            missed = list(self.fragments)
+        if sink is not None:
+            for text in missed:
+                sink(text)
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[request_id] = waiter
+        return waiter
+
+    def detach(self, request_id: str) -> Optional[asyncio.Future]:
+        with self._lock:
+            self.sinks.pop(request_id, None)
+        return self.waiters.pop(request_id, None)
+
+class SingleFlight:
+    """In-flight executions by key; all methods run on the event loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[str, Flight] = {}
+        self._by_request: Dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def join(self, key: str, request_id: str, run: Callable[[Flight], Awaitable[Any]],
+             sink: Optional[Callable[[str], None]] = None) -> Flight:
+        """Attach request_id to the execution in flight for key, starting run(flight) if there is none"""
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            print(f"🔗 {self.name}: {request_id} attached to the run of {flight.leader} ({len(flight.waiters) + 1} requests)")
+        else:
+            flight = Flight(key, request_id)
+            self.flights[key] = flight
+            self.started += 1
+        self._by_request[request_id] = flight
+        flight.attach(request_id, sink)
+        if flight.task is None:
+            # Started once the first request is attached, so run() sees whether it streams
+            flight.task = asyncio.create_task(run(flight))
+            flight.task.add_done_callback(lambda task: self._finish(flight, task))
+        return flight
+
+    async def wait(self, request_id: str) -> Any:
+        """The shared outcome for request_id; raises its exception, or CancelledError once the request is cancelled"""
+        flight = self._by_request[request_id]
+        try:
+            return await flight.waiters[request_id]
+        finally:
+            self._by_request.pop(request_id, None)
+
+    def leads(self, request_id: str) -> bool:
+        """Whether an execution started by request_id is still running (it reads that request's upload)"""
+        return any(flight.leader == request_id for flight in self.flights.values())
+
+    def cancel(self, request_id: str) -> Optional[int]:
+        """Detach request_id and return how many requests are still attached (0: the execution was cancelled).
+        None if the request is not in flight"""
+        flight = self._by_request.get(request_id)
+        if flight is None:
+            return None
+        waiter = flight.detach(request_id)
+        if waiter is None:
+            return None
+        waiter.cancel()
+        if not flight.waiters and not flight.task.done():
+            # Later submissions start a new execution instead of joining the cancelled one
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+            flight.task.cancel()
+            self.cancelled += 1
+            print(f"🛑 {self.name}: cancelled the run of {flight.leader}, no request is attached")
+        return len(flight.waiters)
+
+    def _finish(self, flight: Flight, task: asyncio.Task):
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+        error = None if task.cancelled() else task.exception()
+        for waiter in flight.waiters.values():
+            if waiter.done():
+                continue
+            if task.cancelled():
+                waiter.cancel()
+            elif error is not None:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self.flights),
+            "attached_requests": sum(len(flight.waiters) for flight in self.flights.values()),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
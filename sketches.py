@@ -0,0 +1,198 @@
+"""
+Mergeable, fixed-size summaries of large sales streams.
+
+- TopK: Space-Saving heavy hitters by weight (revenue, rows, quantity)
+- HyperLogLog: distinct counts
+- TDigest: quantiles
+
+Every sketch is updated from a whole pandas column at a time, merges with
+another sketch of the same kind (chunks, files, datasets) and round-trips
+through to_dict/from_dict as JSON-safe values. Memory does not grow with the
+number of rows: TopK keeps `capacity` labels, HyperLogLog 2**precision
+registers and TDigest about compression/2 centroids.
+"""
+
+import base64
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+from lazy_imports import LazyModule
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+class TopK:
+    """Space-Saving summary of the heaviest labels.
+
+    Every label not kept has a true weight of at most `floor`; a kept label's
+    estimate is at most `error` above its true weight.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self.floor = 0.0
+
+    def update(self, labels, weights=None):
+        """Add a column of labels, each with weight 1 or the matching weight"""
+        if weights is None:
+            grouped = pd.Series(labels).value_counts(sort=False)
+        else:
+            grouped = pd.Series(np.asarray(weights, dtype="float64"), index=pd.Index(labels)).groupby(level=0, sort=False).sum()
+        ranked = grouped.sort_values(ascending=False)
+        chunk = TopK(self.capacity)
+        chunk.counts = {str(k): float(v) for k, v in ranked.iloc[:self.capacity].items()}
+        chunk.errors = dict.fromkeys(chunk.counts, 0.0)
+        chunk.floor = float(ranked.iloc[self.capacity]) if len(ranked) > self.capacity else 0.0
+        self.merge(chunk)
+
+    def merge(self, other: "TopK"):
+        counts, errors = {}, {}
+        for label in set(self.counts) | set(other.counts):
+            counts[label] = self.counts.get(label, self.floor) + other.counts.get(label, other.floor)
+            errors[label] = self.errors.get(label, self.floor) + other.errors.get(label, other.floor)
+        ranked = sorted(counts, key=counts.get, reverse=True)
+        kept, dropped = ranked[:self.capacity], ranked[self.capacity:]
+        self.floor = max([self.floor + other.floor] + [counts[label] for label in dropped[:1]])
+        self.counts = {label: counts[label] for label in kept}
+        self.errors = {label: errors[label] for label in kept}
+
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        return [
+            {"label": label, "estimate": round(self.counts[label], 2), "max_error": round(self.errors[label], 2)}
+            for label in list(self.counts)[:k]
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "counts": self.counts, "errors": self.errors, "floor": self.floor}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TopK":
+        sketch = cls(data["capacity"])
+        sketch.counts = data["counts"]
+        sketch.errors = data["errors"]
+        sketch.floor = data["floor"]
+        return sketch
+
+class HyperLogLog:
+    """Distinct count estimate with a standard error of about 1.04 / sqrt(2**precision)"""
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype="uint8")
+
+    def update(self, labels):
+        hashes = pd.util.hash_pandas_object(pd.Series(labels, dtype="object"), index=False).to_numpy(dtype="uint64")
+        if len(hashes) == 0:
+            return
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype("int64")
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Rank = position of the first 1 bit in the remaining 64 - p bits
+        bits = np.zeros(len(rest), dtype="int64")
+        nonzero = rest > 0
+        bits[nonzero] = np.floor(np.log2(rest[nonzero].astype("float64"))).astype("int64") + 1
+        rank = (64 - p) - bits + 1
+        np.maximum.at(self.registers, index, rank.astype("uint8"))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.power(2.0, -self.registers.astype("float64"))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(data["precision"])
+        sketch.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype="uint8").copy()
+        return sketch
+
+class TDigest:
+    """Merging t-digest: centroids sized by the k1 scale function, accurate near the tails"""
+
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.count = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Cumulative weight at each point's midpoint, mapped through k1 and cut into unit buckets
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k.min()).astype("int64")
+        bucket_weights = np.bincount(bucket, weights=weights)
+        bucket_sums = np.bincount(bucket, weights=means * weights)
+        used = bucket_weights > 0
+        self.weights = bucket_weights[used]
+        self.means = bucket_sums[used] / self.weights
+        self.count = float(total)
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other: "TDigest"):
+        if other.count == 0:
+            return
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def total(self) -> float:
+        """Sum of all values added (exact up to float rounding: centroids keep weighted means)"""
+        return float(np.dot(self.means, self.weights))
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        # Interpolate between centroid midpoints, anchored at the observed min and max
+        positions = np.concatenate([[0.0], np.cumsum(self.weights) - self.weights / 2, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * self.count, positions, values))
+
+    def quantiles(self, qs: Sequence[float]) -> Dict[str, Optional[float]]:
+        return {f"p{round(q * 100, 1):g}": self.quantile(q) for q in qs}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        sketch = cls(data["compression"])
+        sketch.means = np.asarray(data["means"], dtype="float64")
+        sketch.weights = np.asarray(data["weights"], dtype="float64")
+        sketch.count = data["count"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        return sketch
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test client for completion callbacks (callback_url)
+
+Starts a local receiver that checks the X-Callback-Signature HMAC and fails
+the first delivery with a 503 to exercise retries, uploads a PDF with
+callback_url pointing at it and waits for the pushed result. Start the API
+with the same CALLBACK_SECRET, and allow-list localhost (loopback callback hosts
+are refused otherwise), e.g.:
+
+    CALLBACK_SECRET=test-secret CALLBACK_BACKOFF_SECONDS=0.5 CALLBACK_ALLOWED_HOSTS=localhost uvicorn api:app
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+# API configuration
+API_BASE_URL = "http://localhost:8000"
+
+# Receiver configuration
+RECEIVER_PORT = int(os.getenv("RECEIVER_PORT", "8765"))
+CALLBACK_SECRET = os.getenv("CALLBACK_SECRET", "test-secret")
+FAIL_FIRST = 1
+
+deliveries = []
+delivered = threading.Event()
+
+class CallbackReceiver(BaseHTTPRequestHandler):
+    """Verifies the signature, rejects the first FAIL_FIRST deliveries, then accepts"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        timestamp = self.headers.get("X-Callback-Timestamp", "")
+        expected = "sha256=" + hmac.new(
+            CALLBACK_SECRET.encode("utf-8"), timestamp.encode("ascii") + b"." + body, hashlib.sha256
+        ).hexdigest()
+        valid = hmac.compare_digest(expected, self.headers.get("X-Callback-Signature", ""))
+        deliveries.append({"event": self.headers.get("X-Callback-Event"), "valid": valid, "body": body})
+
+        code = 503 if len(deliveries) <= FAIL_FIRST else (200 if valid else 401)
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        if code == 200:
+            delivered.set()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_receiver():
+    server = ThreadingHTTPServer(("0.0.0.0", RECEIVER_PORT), CallbackReceiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🧪 Callback receiver listening on port {RECEIVER_PORT}")
+    return server
+
+def test_callback(pdf_file_path: str):
+    """Upload with callback_url and wait for the signed delivery"""
+    print(f"\n📤 Testing completion callback for: {pdf_file_path}")
+
+    callback_url = f"http://localhost:{RECEIVER_PORT}/analysis-done"
+    with open(pdf_file_path, 'rb') as f:
+        files = {'file': (os.path.basename(pdf_file_path), f, 'application/pdf')}
+        response = requests.post(
+            f"{API_BASE_URL}/analyze/upload",
+            files=files,
+            params={'analysis_type': 'full', 'callback_url': callback_url}
+        )
+
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return False
+
+    request_id = response.json()['request_id']
+    print(f"✅ Upload successful: {request_id}")
+
+    start_time = time.time()
+    if not delivered.wait(timeout=600):
+        print("❌ No callback received")
+        return False
+    print(f"⏱️  Callback received after {time.time() - start_time:.2f}s and {len(deliveries)} attempt(s)")
+
+    payload = json.loads(deliveries[-1]["body"])
+    if not deliveries[-1]["valid"]:
+        print("❌ Signature did not verify")
+        return False
+    if payload["request_id"] != request_id:
+        print(f"❌ Callback was for {payload['request_id']}")
+        return False
+    print(f"✅ Signed {payload['event']} callback with status {payload['status']}")
+
+    # Give the API a moment to record the delivery
+    time.sleep(0.5)
+    status = requests.get(f"{API_BASE_URL}/status/{request_id}").json()
+    callback = status["queue_info"]["callback"]
+    print(f"📬 Delivery status: {callback['status']} after {callback['attempts']} attempt(s)")
+    return callback["status"] == "delivered"
+
+def main():
+    """Main test function"""
+    print("🚀 Completion Callback Test Client")
+    print("=" * 50)
+
+    pdf_files = list(Path(".").glob("*.pdf"))
+    if not pdf_files:
+        print("\n⚠️  No PDF files found in current directory")
+        return
+
+    server = start_receiver()
+    try:
+        if test_callback(str(pdf_files[0])):
+            print("\n🎉 Test completed successfully!")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
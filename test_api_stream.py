@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test client for narrative streaming (/stream/{request_id})
+
+Starts a local stand-in for the n8n finance webhook on port 5678 that streams
+the narrative as NDJSON chunks (the format n8n uses with the Webhook node's
+Streaming response mode), uploads a PDF with stream=true and prints the
+fragments relayed by the API. Stop n8n before running this test.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+# API configuration
+API_BASE_URL = "http://localhost:8000"
+
+# Stand-in webhook configuration
+STANDIN_PORT = int(os.getenv("STANDIN_PORT", "5678"))
+FRAGMENT_DELAY = 0.3
+
+NARRATIVE = [
+    "Revenue grew strongly this period. ",
+    "Gross margin held above 70%, ",
+    "while operating expenses rose slightly. ",
+    "We recommend a detailed review of administrative costs.",
+]
+
+class StandInWebhook(BaseHTTPRequestHandler):
+    """Streams the narrative in fragments, then the final workflow output"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(event):
+            data = (json.dumps(event) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        chunk({"type": "begin"})
+        for text in NARRATIVE:
+            time.sleep(FRAGMENT_DELAY)
+            chunk({"type": "item", "content": text})
+        chunk({"type": "end"})
+        chunk({
+            "type": "result",
+            "data": {
+                "Metrics": {"Total Revenue": 1000.0, "Net Profit": 250.0},
+                "Ratios": {"Net Profit Margin": "25.00%"},
+                "Analysis": "".join(NARRATIVE),
+            },
+        })
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+def start_standin_webhook():
+    server = ThreadingHTTPServer(("0.0.0.0", STANDIN_PORT), StandInWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🧪 Stand-in webhook listening on port {STANDIN_PORT}")
+    return server
+
+def test_stream_upload(pdf_file_path: str):
+    """Upload with stream=true and relay fragments from /stream/{request_id}"""
+    print(f"\n📤 Testing streamed analysis for: {pdf_file_path}")
+
+    with open(pdf_file_path, 'rb') as f:
+        files = {'file': (os.path.basename(pdf_file_path), f, 'application/pdf')}
+        response = requests.post(
+            f"{API_BASE_URL}/analyze/upload",
+            files=files,
+            params={'analysis_type': 'full', 'stream': 'true'}
+        )
+
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return False
+
+    request_id = response.json()['request_id']
+    print(f"✅ Upload successful: {request_id}")
+
+    start_time = time.time()
+    first_fragment = None
+    fragments = []
+    event = None
+
+    with requests.get(f"{API_BASE_URL}/stream/{request_id}", stream=True) as stream:
+        for line in stream.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "fragment":
+                    if first_fragment is None:
+                        first_fragment = time.time() - start_time
+                    fragments.append(data["text"])
+                    print(f"   🧩 {data['text']}")
+                elif event == "done":
+                    print("✅ Stream completed")
+                elif event == "error":
+                    print(f"❌ Stream failed: {data['detail']}")
+                    return False
+
+    total = time.time() - start_time
+    print(f"⏱️  Time to first fragment: {first_fragment:.2f}s, full narrative: {total:.2f}s")
+
+    result = requests.get(f"{API_BASE_URL}/results/{request_id}").json()
+    if result["analysis"] != "".join(fragments):
+        print("❌ Stored narrative does not match streamed fragments")
+        return False
+    print(f"✅ Stored result matches streamed narrative ({result['text_length']} chars)")
+    return True
+
+def main():
+    """Main test function"""
+    print("🚀 Narrative Streaming Test Client")
+    print("=" * 50)
+
+    pdf_files = list(Path(".").glob("*.pdf"))
+    if not pdf_files:
+        print("\n⚠️  No PDF files found in current directory")
+        return
+
+    server = start_standin_webhook()
+    try:
+        if test_stream_upload(str(pdf_files[0])):
+            print("\n🎉 Test completed successfully!")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Cold start regression test: importing api must stay under the import budget
+and must not pull in the lazily loaded heavy dependencies
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from lazy_imports import importtime_report
+
+# Budget for a cold `import api` (seconds)
+IMPORT_BUDGET_SECONDS = float(os.getenv("API_IMPORT_BUDGET_SECONDS", "1.0"))
+
+# Modules that must only be imported on first use
+LAZY_MODULES = ["pandas", "numpy", "matplotlib", "reportlab", "reports"]
+
+REPO_DIR = str(Path(__file__).resolve().parent)
+
+def test_cold_import_budget():
+    """Cold import of api stays under budget"""
+    with tempfile.TemporaryDirectory() as cwd:
+        report = importtime_report("api", top=10, cwd=cwd)
+
+    assert report["returncode"] == 0, "import api failed"
+    total_seconds = report["total_ms"] / 1000
+    print(f"⏱️  Cold import of api: {total_seconds:.3f}s (budget {IMPORT_BUDGET_SECONDS:.3f}s)")
+    for entry in report["top_level"][:5]:
+        print(f"   - {entry['module']}: {entry['cumulative_ms']:.1f} ms")
+    assert total_seconds <= IMPORT_BUDGET_SECONDS, f"import api took {total_seconds:.3f}s"
+
+def test_heavy_modules_not_imported():
+    """Heavy dependencies are not loaded at import time"""
+    code = (
+        f"import sys; sys.path.insert(0, {REPO_DIR!r}); import api; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, timeout=120)
+
+    assert proc.returncode == 0, proc.stderr
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    print(f"📦 Eagerly loaded heavy modules: {loaded or 'none'}")
+    assert not loaded, f"loaded at import time: {loaded}"
+
+def main():
+    """Main test function"""
+    print("🚀 API Cold Start Test")
+    print("=" * 50)
+
+    failed = False
+    for test in (test_heavy_modules_not_imported, test_cold_import_budget):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Page text cache test: pages that share a content stream but draw different
+form XObjects must not be served each other's cached text
+"""
+
+import io
+import sys
+
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject
+
+import pdf_extract
+
+# One line of the income statement per page, each drawn by a form XObject named F0
+STATEMENT_LINES = [
+    "Total Revenue 1,000.00",
+    "Net Profit/(Loss) 200.00",
+    "Profit For the Year 150.00",
+]
+
+def xobject_page_pdf(line: str) -> bytes:
+    """One-page PDF whose content stream only paints the form XObject F0, which draws `line`"""
+    writer = PdfWriter()
+    page = writer.add_blank_page(width=612, height=792)
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    form = DecodedStreamObject()
+    form.set_data(f"BT /F1 12 Tf 72 700 Td ({line}) Tj ET".encode("latin-1"))
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(612), FloatObject(792)]),
+        NameObject("/Resources"): DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+        }),
+    })
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/F0"): writer._add_object(form)}),
+    })
+    contents = DecodedStreamObject()
+    contents.set_data(b"q /F0 Do Q")
+    page[NameObject("/Contents")] = writer._add_object(contents)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def merged_pdf(parts) -> bytes:
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(io.BytesIO(part))
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def test_xobject_pages_have_distinct_keys():
+    """Merged pages drawing different form XObjects get different cache keys"""
+    pdf_extract.page_text_cache.clear()
+    result = pdf_extract.extract_statement_text(merged_pdf([xobject_page_pdf(line) for line in STATEMENT_LINES]))
+    print(f"📄 Pages {result['pages']}, cache hits {result['cache_hits']}, missing {len(result['missing_metrics'])} metrics")
+    assert result["cache_hits"] == 0, f"{result['cache_hits']} pages were served another page's text"
+    assert result["metric_pages"] == {"Total Revenue": 1, "Net Profit": 2, "Profit For the Year": 3}, result["metric_pages"]
+
+def test_reupload_hits_cache():
+    """Extracting the same document again is served from the cache"""
+    data = merged_pdf([xobject_page_pdf(line) for line in STATEMENT_LINES])
+    pdf_extract.page_text_cache.clear()
+    pdf_extract.extract_statement_text(data)
+    result = pdf_extract.extract_statement_text(data)
+    assert result["cache_hits"] == len(STATEMENT_LINES), f"{result['cache_hits']} cache hits"
+    assert result["metric_pages"] == {"Total Revenue": 1, "Net Profit": 2, "Profit For the Year": 3}, result["metric_pages"]
+
+def main():
+    """Main test function"""
+    print("🚀 PDF Page Cache Test")
+    print("=" * 50)
+
+    failed = False
+    for test in (test_xobject_pages_have_distinct_keys, test_reupload_hits_cache):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            print(f"❌ {test.__doc__}: {e}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()